@@ -1,70 +1,157 @@
 '''
 Script that uses Perplexity model sonar to fetch fictitious restaurant and menu list basis user prompts on UI.
+The chat model & chains are built on first use, hence importing this module doesn't load the OpenAI client.
 '''
 
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from pathlib import Path
 from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from Fictitious_restaurant_with_menu.backend.restaurant_catalog import RestaurantCatalog
+from common.resources import get_chat_model, resource
 import os
 
 #.env path
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# fetch API key
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# ---------- PROMPTS (chains are built ONCE per process on first use, see get_chain) ----------
+# setup a message template
+prompt = ChatPromptTemplate.from_template('''
+I want to open a restaurant for {cuisine} food. Suggest a fancy name for it? 
 
-# create agent using Sonar-pro model and configure other model related params
-model = ChatOpenAI(
-    model='gpt-5.2',
-    api_key=openai_api_key,
-    temperature=0.3, # higher number indicates more randomness in the model's output
-    max_tokens=500, #defines the no of words in the model's response
-    timeout=30 # max time in sec to wait for model's response
-)
+Only one name please.
+Do not add '**' at the start and end of the restaurant name.
+Do not add any description following the name like "The Grand Hotel. It's a classic place..." just "The Grand Hotel"
+Do not add citations at all like [1][2].. following the restaurant name.
+''')
 
-def generate_restaurant_and_menu(cuisine):
+# generate menu items based on restaurant name using runnable sequence
+menu_prompt = ChatPromptTemplate.from_template('''
+Suggest some menu items for {restaurant_name}. 
+
+Do not add citations like [1][2][3]...
+Do not add explanations at all.
+Do not add any description after the food names.
+
+Return it as a comma separated strings like 'fooditem1,fooditem2,fooditem3,...'
+''')
+# structured output: name & menu items in ONE round-trip
+class RestaurantMenu(BaseModel):
+    restaurant_name : str = Field(description="Fancy name of the restaurant without '**', description or citations")
+    menu_items : List[str] = Field(description='Names of the dishes on the menu without descriptions or citations')
+
+structured_prompt = ChatPromptTemplate.from_template('''
+I want to open a restaurant for {cuisine} food. Suggest a fancy name for it and some menu items for it.
+
+Only one name please, without '**', description or citations like [1][2].
+Menu items are food names only, without explanations, descriptions or citations.
+''')
+
+@resource
+def get_chain(structured : bool = True):
     '''
-    Function that generates restaurant and menu list given the country the restaurant belongs to.
-    parameters: restaurant_name
-    :return:
+    Function that builds the chain ONCE per process on first use.
+    :param structured: structured output, name & menu items in ONE round-trip. Otherwise the sequential chain: two
+                       round-trips, the menu is generated from the name.
+    :return: runnable chain.
     '''
-
-    # setup a message template
-    prompt = ChatPromptTemplate.from_template('''
-    I want to open a restaurant for {cuisine} food. Suggest a fancy name for it? 
-    
-    Only one name please.
-    Do not add '**' at the start and end of the restaurant name.
-    Do not add any description following the name like "The Grand Hotel. It's a classic place..." just "The Grand Hotel"
-    Do not add citations at all like [1][2].. following the restaurant name.
-    ''')
+    model = get_chat_model()
+    if structured:
+        return structured_prompt | model.with_structured_output(RestaurantMenu)
 
     # display response from the model using runnable sequence
     name_chain = prompt | model | StrOutputParser()
+    menu_chain = menu_prompt | model | StrOutputParser()
+    return {'restaurant_name':name_chain} | RunnablePassthrough.assign(menu=menu_chain)
 
-    # generate menu items based on restaurant name using runnable sequence
-    menu_prompt = ChatPromptTemplate.from_template('''
-    Suggest some menu items for {restaurant_name}. 
-    
-    Do not add citations like [1][2][3]...
-    Do not add explanations at all.
-    Do not add any description after the food names.
-    
-    Return it as a comma separated strings like 'fooditem1,fooditem2,fooditem3,...'
-    ''')
-    menu_chain= menu_prompt | model | StrOutputParser()
-
-    # sequential chain
-    full_chain = (
-        {'restaurant_name':name_chain} | RunnablePassthrough.assign(menu=menu_chain)
-    )
+def parse_menu(menu : str) -> List[str]:
+    '''
+    Function that turns the comma separated menu of the sequential chain into a list of items.
+    :param menu: 'fooditem1,fooditem2,fooditem3,...'
+    :return: list of menu items.
+    '''
+    return [item.strip().strip("'\"") for item in menu.split(',') if item.strip().strip("'\"")]
+
+def to_response(result, structured : bool) -> dict:
+    '''
+    :return: {'restaurant_name': str, 'menu': list of menu items} whatever the chain used.
+    '''
+    if structured:
+        return {'restaurant_name': result.restaurant_name.strip(), 'menu': [item.strip() for item in result.menu_items if item.strip()]}
+    return {'restaurant_name': result['restaurant_name'].strip(), 'menu': parse_menu(result['menu'])}
+
+def generate_restaurant_and_menu(cuisine, structured : bool = True):
+    '''
+    Function that generates restaurant and menu list given the country the restaurant belongs to.
+    parameters: cuisine, structured (one structured call instead of two sequential ones)
+    :return: {'restaurant_name': str, 'menu': list of menu items}
+    '''
+    chain = get_chain(structured)
+    return to_response(chain.invoke({'cuisine':cuisine}), structured)
 
-    result = full_chain.invoke({'cuisine':cuisine})
-    return result
+async def agenerate_restaurant_and_menu(cuisine, structured : bool = True):
+    '''
+    Async version of generate_restaurant_and_menu.
+    :return: {'restaurant_name': str, 'menu': list of menu items}
+    '''
+    chain = get_chain(structured)
+    return to_response(await chain.ainvoke({'cuisine':cuisine}), structured)
+
+def generate_restaurant_batch(cuisines : List[str], structured : bool = True, max_concurrency : int = 8) -> List[Optional[dict]]:
+    '''
+    Function that generates one restaurant & menu per entry of cuisines concurrently. A cuisine may appear several times
+    to get several variants.
+    :param cuisines: list of cuisines.
+    :param structured: one structured call per cuisine instead of two sequential ones.
+    :param max_concurrency: max no of calls in flight.
+    :return: responses in the order of cuisines, None where the generation failed.
+    '''
+    chain = get_chain(structured)
+    results = chain.batch([{'cuisine': cuisine} for cuisine in cuisines], config={'max_concurrency': max_concurrency}, return_exceptions=True)
+    return [None if isinstance(result, Exception) else to_response(result, structured) for result in results]
+
+def generate_restaurants(cuisines : List[str], structured : bool = True, max_concurrency : int = 8) -> Dict[str, Optional[dict]]:
+    '''
+    Function that generates a restaurant & menu for every cuisine concurrently, hence the whole catalog takes about one
+    call's latency.
+    :param cuisines: list of cuisines.
+    :param structured: one structured call per cuisine instead of two sequential ones.
+    :param max_concurrency: max no of calls in flight.
+    :return: mapping of cuisine to its response or None if its generation failed.
+    '''
+    return dict(zip(cuisines, generate_restaurant_batch(cuisines, structured, max_concurrency)))
+
+async def agenerate_restaurants(cuisines : List[str], structured : bool = True, max_concurrency : int = 8) -> Dict[str, Optional[dict]]:
+    '''
+    Async version of generate_restaurants, bounded by max_concurrency through abatch.
+    :return: mapping of cuisine to its response or None if its generation failed.
+    '''
+    chain = get_chain(structured)
+    results = await chain.abatch([{'cuisine': cuisine} for cuisine in cuisines], config={'max_concurrency': max_concurrency}, return_exceptions=True)
+    return {cuisine: None if isinstance(result, Exception) else to_response(result, structured) for cuisine, result in zip(cuisines, results)}
+
+# cuisines offered in the UI
+CUISINES = ["Indian","Italian","Nepalese","Chinese","Japanese","Mongolian","American","Mexican","Finnish","Greenlandish"]
+
+@resource
+def get_restaurant_catalog():
+    '''
+    Function that creates the pre-generated restaurant catalog ONCE per process & starts warming it in the background.
+    No of variants per cuisine via RESTAURANT_VARIANTS & their lifetime in seconds via RESTAURANT_TTL.
+    :return: restaurant catalog.
+    '''
+    catalog = RestaurantCatalog(
+        generate_restaurant_batch,
+        CUISINES,
+        variants=int(os.getenv('RESTAURANT_VARIANTS', '3')),
+        ttl=float(os.getenv('RESTAURANT_TTL', str(24 * 3600))),
+        path='./cache/restaurant_catalog.json',
+    )
+    return catalog.start()
 
 if __name__ == '__main__':
-    print(generate_restaurant_and_menu('Mongolian'))
\ No newline at end of file
+    print(generate_restaurant_and_menu('Mongolian'))
@@ -0,0 +1,165 @@
+'''
+Script that keeps a catalog of pre-generated restaurants & menus so that the UI never waits for the model.
+Every cuisine holds a few variants generated in the background. Serving a variant is a local lookup that consumes it and
+wakes the refill thread, which tops the catalog up with one concurrent batch. Variants expire after a while and the
+catalog is persisted to disk so that a restart is warm as well.
+'''
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+class RestaurantCatalog:
+    """
+    Pool of pre-generated restaurant variants per cuisine, refilled asynchronously as variants are served or expire.
+    """
+    def __init__(
+        self,
+        generate_batch : Callable[[List[str]], List[Optional[dict]]],
+        cuisines : List[str],
+        variants : int = 3,
+        ttl : float = 24 * 3600,
+        path = None,
+        refill_interval : float = 300,
+    ):
+        '''
+        :param generate_batch: callable generating one restaurant per cuisine of the list (duplicates allowed), None on failure.
+        :param cuisines: cuisines of the catalog.
+        :param variants: no of variants kept ready per cuisine.
+        :param ttl: seconds after which a variant is dropped & regenerated.
+        :param path: optional JSON file the catalog is persisted to.
+        :param refill_interval: max seconds between two refills even when nothing is served, so that expired variants are replaced.
+        '''
+        self.generate_batch = generate_batch
+        self.cuisines = list(cuisines)
+        self.variants = variants
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.refill_interval = refill_interval
+
+        self._pools: Dict[str, deque] = {cuisine: deque() for cuisine in self.cuisines}
+        self._last: Dict[str, dict] = {} # last variant served per cuisine, re-served while its pool is empty
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.generated = 0
+        self.served = 0
+        self._load()
+
+    # ---------- PERSISTENCE ----------
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError):
+            return
+        for cuisine, entries in data.get('pools', {}).items():
+            if cuisine in self._pools:
+                self._pools[cuisine].extend(entries[:self.variants])
+        self._last.update({cuisine: entry for cuisine, entry in data.get('last', {}).items() if cuisine in self._pools})
+
+    def _save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = {'pools': {cuisine: list(pool) for cuisine, pool in self._pools.items()}, 'last': dict(self._last)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps(data), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    # ---------- REFILL ----------
+    def _drop_expired(self, now : float):
+        for pool in self._pools.values():
+            while pool and now - pool[0]['created_at'] > self.ttl:
+                pool.popleft()
+
+    def missing(self) -> List[str]:
+        '''
+        :return: one cuisine per missing variant.
+        '''
+        with self._lock:
+            self._drop_expired(time.time())
+            return [cuisine for cuisine, pool in self._pools.items() for _ in range(self.variants - len(pool))]
+
+    def refill(self) -> int:
+        '''
+        Function that generates every missing variant in one concurrent batch.
+        :return: no of variants added.
+        '''
+        wanted = self.missing()
+        if not wanted:
+            return 0
+        results = self.generate_batch(wanted)
+
+        added = 0
+        now = time.time()
+        with self._lock:
+            for cuisine, response in zip(wanted, results):
+                if response is not None and len(self._pools[cuisine]) < self.variants:
+                    self._pools[cuisine].append({'response': response, 'created_at': now})
+                    added += 1
+            self.generated += added
+        self._save()
+        return added
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except Exception:
+                # a failed batch is retried on the next wake-up, the catalog keeps serving what it has
+                pass
+            self._wake.wait(timeout=self.refill_interval)
+            self._wake.clear()
+
+    def start(self):
+        '''
+        Starts the background refill thread, which warms the catalog right away.
+        :return: the catalog.
+        '''
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='restaurant-catalog', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ---------- SERVING ----------
+    def get(self, cuisine : str, selection : str = 'rotate') -> Optional[dict]:
+        '''
+        Function that serves a variant instantly & schedules its replacement.
+        :param cuisine: cuisine of the restaurant.
+        :param selection: 'rotate' serves the oldest variant first, 'random' any of them.
+        :return: {'restaurant_name': str, 'menu': list of menu items}, the last served variant while the pool is empty or
+                 None if nothing was ever generated for the cuisine.
+        '''
+        with self._lock:
+            self._drop_expired(time.time())
+            pool = self._pools.get(cuisine)
+            if pool:
+                index = random.randrange(len(pool)) if selection == 'random' else 0
+                entry = pool[index]
+                del pool[index]
+                self._last[cuisine] = entry
+                self.served += 1
+            else:
+                entry = self._last.get(cuisine)
+        self._wake.set()
+        return entry['response'] if entry else None
+
+    def ready(self) -> Dict[str, int]:
+        '''
+        :return: no of variants ready per cuisine.
+        '''
+        with self._lock:
+            return {cuisine: len(pool) for cuisine, pool in self._pools.items()}
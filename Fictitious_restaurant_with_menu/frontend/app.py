@@ -3,20 +3,52 @@ Script that creates an UI that displays restaurant name and possible menus using
 '''
 
 import streamlit as st
-from Fictitious_restaurant_with_menu.backend.restaurant_and_menu_generator_server import generate_restaurant_and_menu
+from Fictitious_restaurant_with_menu.backend.restaurant_and_menu_generator_server import generate_restaurant_and_menu, get_restaurant_catalog, CUISINES
+from common.serving import ServiceBusy, post_json, service_url
 
 st.title('Fictitious Restaurant with Menu Generator')
 
+def get_restaurant(cuisine : str) -> dict:
+    '''
+    Function that gets a restaurant & its menu for the cuisine, from the agent service when AGENT_SERVICE_URL is set.
+    :return: {'restaurant_name': str, 'menu': list of menu items}
+    '''
+    if service_url():
+        with st.spinner('Fetching restaurant...'):
+            return post_json('/restaurants', {'cuisine': cuisine})
+
+    # catalog of pre-generated restaurants shared by every session & refilled in the background
+    response = get_restaurant_catalog().get(cuisine)
+    if response is None:
+        # catalog still cold for this cuisine
+        with st.spinner('Generating restaurant...'):
+            response = generate_restaurant_and_menu(cuisine)
+    return response
+
+# start filling the catalog as soon as the page loads unless the service holds it
+if not service_url():
+    get_restaurant_catalog()
+
 # choose cuisine
-cuisine = st.sidebar.selectbox('Pick a cuisine',options=["Indian","Italian","Nepalese","Chinese","Japanese","Mongolian","American","Mexican","Finnish","Greenlandish"],help="Choose a cuisine")
+cuisine = st.sidebar.selectbox('Pick a cuisine',options=CUISINES,help="Choose a cuisine")
+another = st.sidebar.button('Show another restaurant')
 
 if cuisine:
-    response = generate_restaurant_and_menu(cuisine)
+    # a restaurant is picked when the cuisine changes or another one is asked for, other reruns re-use it
+    shown = st.session_state.setdefault('shown', {})
+    if cuisine not in shown or another:
+        try:
+            shown[cuisine] = get_restaurant(cuisine)
+        except ServiceBusy as e:
+            st.warning(f'The service is busy, please try again in {e.retry_after}s.')
+            st.stop()
+    response = shown[cuisine]
+
     # display restaurant name
     restaurant = response['restaurant_name']
     st.header(restaurant)
     # fetch menu items
-    menu_items = response['menu'].split(',')
+    menu_items = response['menu']
 
     # display menu items
     with st.container(border=True):
@@ -24,9 +56,3 @@ if cuisine:
 
         for item in menu_items:
             st.write('-',item)
-
-
-
-
-
-
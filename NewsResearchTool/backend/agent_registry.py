@@ -0,0 +1,99 @@
+'''
+Script that keeps compiled RAG agents around between questions.
+Building an agent (tool schema generation & graph compilation) only depends on the corpus it retrieves from, hence agents
+are cached per corpus identity in a size-capped LRU registry and repeated questions against the same articles skip all setup.
+'''
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+
+@dataclass
+class RegistryStats:
+    """
+    Counters exposing how much time goes into building agents versus answering with them.
+    """
+    hits: int = 0
+    builds: int = 0
+    evictions: int = 0
+    build_seconds: float = 0.0
+    answers: int = 0
+    answer_seconds: float = 0.0
+
+    @property
+    def avg_build_seconds(self) -> float:
+        return self.build_seconds / self.builds if self.builds else 0.0
+
+    @property
+    def avg_answer_seconds(self) -> float:
+        return self.answer_seconds / self.answers if self.answers else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'hits': self.hits, 'builds': self.builds, 'evictions': self.evictions,
+            'avg_build_seconds': round(self.avg_build_seconds, 4), 'avg_answer_seconds': round(self.avg_answer_seconds, 4),
+        }
+
+
+class AgentRegistry:
+    """
+    LRU cache of compiled agents keyed on corpus identity.
+    """
+    def __init__(self, max_size : int = 8):
+        '''
+        :param max_size: max no of compiled agents kept in memory. The least recently used one is evicted first.
+        '''
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+        self.max_size = max_size
+        self.stats = RegistryStats()
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._agents)
+
+    def get(self, key : Hashable, build : Callable[[], object]):
+        '''
+        Function that returns the agent compiled for the key, building it only on a miss.
+        :param key: corpus identity e.g. the frozenset of article urls the agent retrieves from.
+        :param build: zero-argument callable that compiles the agent.
+        :return: compiled agent.
+        '''
+        with self._lock:
+            if key in self._agents:
+                self._agents.move_to_end(key)
+                self.stats.hits += 1
+                return self._agents[key]
+
+        # build outside the lock so that questions on other corpora aren't blocked meanwhile
+        start = time.perf_counter()
+        agent = build()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.stats.builds += 1
+            self.stats.build_seconds += elapsed
+            # another session may have built the same agent meanwhile, keep the first one
+            agent = self._agents.setdefault(key, agent)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_size:
+                self._agents.popitem(last=False)
+                self.stats.evictions += 1
+        return agent
+
+    def record_answer(self, seconds : float):
+        '''
+        Records the time spent answering one question with a registered agent.
+        :param seconds: wall-clock time of the answer.
+        :return:
+        '''
+        with self._lock:
+            self.stats.answers += 1
+            self.stats.answer_seconds += seconds
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
@@ -0,0 +1,282 @@
+'''
+Script that fetches news articles concurrently and parses them into langchain documents.
+Downloads run in a bounded thread pool with a per-host limit & per-host timeouts, while HTML parsing (CPU-bound) runs in a
+process pool so that it overlaps with the remaining downloads. Responses are kept in an on-disk cache along with their
+ETag/Last-Modified headers so that re-fetching an article is a conditional request or is skipped altogether.
+'''
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from langchain_core.documents import Document
+
+from common.tracing import span
+
+logger = logging.getLogger(__name__)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def parse_html(html : bytes) -> str:
+    '''
+    Function that extracts the text of an article from its HTML the same way UnstructuredURLLoader does in 'single' mode.
+    Runs inside a worker process hence it only takes & returns picklable values.
+    :param html: raw HTML of the page.
+    :return: article text.
+    '''
+    from unstructured.partition.html import partition_html
+
+    elements = partition_html(text=html.decode('utf-8', errors='replace'))
+    return "\n\n".join(str(element) for element in elements)
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of fetching one url.
+    """
+    url: str
+    body: bytes
+    text: Optional[str] = None # parsed text, present when the cached body didn't change
+    from_cache: bool = False # True when no body was downloaded (fresh or 304 Not Modified)
+
+
+class HttpCache:
+    """
+    On-disk cache of HTTP responses. For every url it stores the body, its parsed text and the validators
+    (ETag/Last-Modified) needed for a conditional re-fetch.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url : str, suffix : str) -> Path:
+        return self.cache_dir / (hashlib.sha256(url.encode('utf-8')).hexdigest() + suffix)
+
+    @staticmethod
+    def _atomic_write(path : Path, data : bytes):
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, url : str) -> Optional[dict]:
+        '''
+        :param url: article url.
+        :return: cached entry with 'etag', 'last_modified', 'fetched_at' & 'body' or None if the url was never fetched.
+        '''
+        try:
+            with open(self._path(url, '.json'), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            entry['body'] = self._path(url, '.body').read_bytes()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def get_text(self, url : str) -> Optional[str]:
+        try:
+            return self._path(url, '.txt').read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+    def put(self, url : str, body : bytes, headers):
+        '''
+        Stores a freshly downloaded body & its validators. Any previously parsed text is discarded.
+        :return:
+        '''
+        self._path(url, '.txt').unlink(missing_ok=True)
+        self._atomic_write(self._path(url, '.body'), body)
+        self.touch(url, etag=headers.get('ETag'), last_modified=headers.get('Last-Modified'))
+
+    def put_text(self, url : str, text : str):
+        self._atomic_write(self._path(url, '.txt'), text.encode('utf-8'))
+
+    def touch(self, url : str, etag=None, last_modified=None):
+        '''
+        Updates the validators & marks the entry as fetched now (used after a 304 Not Modified response as well).
+        :return:
+        '''
+        entry = self.get(url) or {}
+        meta = {
+            'url': url,
+            'etag': etag or entry.get('etag'),
+            'last_modified': last_modified or entry.get('last_modified'),
+            'fetched_at': time.time(),
+        }
+        self._atomic_write(self._path(url, '.json'), json.dumps(meta).encode('utf-8'))
+
+
+class ArticleLoader:
+    """
+    Concurrent replacement for UnstructuredURLLoader(urls).load().
+    """
+    def __init__(
+        self,
+        cache_dir = "./cache/http/",
+        max_workers : int = 8,
+        per_host_limit : int = 2,
+        timeout : Timeout = (5, 20),
+        host_timeouts : Optional[Dict[str, Timeout]] = None,
+        max_age : float = 0,
+        parse_workers : Optional[int] = None,
+        headers : Optional[dict] = None,
+    ):
+        '''
+        :param cache_dir: directory of the on-disk HTTP cache.
+        :param max_workers: max no of downloads in flight.
+        :param per_host_limit: max no of downloads in flight against a single host.
+        :param timeout: default (connect, read) timeout in seconds.
+        :param host_timeouts: per-host overrides of the timeout e.g. {'www.reuters.com': (3, 10)}.
+        :param max_age: seconds a cached response is served without contacting the server. 0 always revalidates.
+        :param parse_workers: size of the HTML parsing process pool. 0 parses in the calling process.
+        :param headers: extra request headers.
+        '''
+        self.cache = HttpCache(cache_dir)
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.host_timeouts = host_timeouts or {}
+        self.max_age = max_age
+        self.parse_workers = parse_workers
+        self.headers = {'User-Agent': 'Mozilla/5.0 (compatible; NewsResearchTool/1.0)', **(headers or {})}
+
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self._local = threading.local()
+        self._parse_pool = None
+
+    # ---------- FETCHING ----------
+    def _session(self) -> requests.Session:
+        # sessions aren't thread-safe hence each download thread keeps its own connection pool
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def _host_slot(self, host : str) -> threading.BoundedSemaphore:
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def fetch(self, url : str) -> FetchResult:
+        '''
+        Function that downloads one url, re-using the cached copy when it is fresh or the server answers 304 Not Modified.
+        :param url: article url.
+        :return: fetch result holding the body & possibly its already parsed text.
+        '''
+        cached = self.cache.get(url)
+        if cached and time.time() - cached['fetched_at'] < self.max_age:
+            return FetchResult(url, cached['body'], self.cache.get_text(url), from_cache=True)
+
+        # ask the server to only send the body if it changed since the cached copy
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        host = urlsplit(url).netloc
+        with self._host_slot(host):
+            response = self._session().get(url, headers=headers, timeout=self.host_timeouts.get(host, self.timeout))
+
+        if response.status_code == 304 and cached:
+            self.cache.touch(url, etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+            return FetchResult(url, cached['body'], self.cache.get_text(url), from_cache=True)
+
+        response.raise_for_status()
+        self.cache.put(url, response.content, response.headers)
+        return FetchResult(url, response.content)
+
+    # ---------- PARSING ----------
+    def _get_parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.parse_workers == 0:
+            return None
+        if self._parse_pool is None:
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._parse_pool
+
+    def _parse(self, result : FetchResult) -> Future:
+        if result.text is not None:
+            future = Future()
+            future.set_result(result.text)
+            return future
+
+        pool = self._get_parse_pool()
+        if pool is None:
+            future = Future()
+            try:
+                future.set_result(parse_html(result.body))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return pool.submit(parse_html, result.body)
+
+    def load(self, urls : List[str]) -> List[Document]:
+        '''
+        Function that fetches & parses all urls concurrently. Each page is handed to the parsing pool as soon as its
+        download completes. Urls that fail are logged & skipped just like UnstructuredURLLoader does.
+        :param urls: list of article urls.
+        :return: one langchain document per successfully loaded url, in the order of urls.
+        '''
+        with span('articles.load', urls=len(urls)) as load_span:
+            docs = self._load(list(dict.fromkeys(urls)), load_span)
+            load_span.set(docs=len(docs))
+        return docs
+
+    def _traced_fetch(self, url : str, parent) -> FetchResult:
+        # downloads run on pool threads, hence the parent span is passed explicitly
+        with span('http.fetch', parent=parent, url=url) as fetch_span:
+            result = self.fetch(url)
+            fetch_span.set(from_cache=result.from_cache, bytes=len(result.body))
+            return result
+
+    def _load(self, urls : List[str], load_span) -> List[Document]:
+        parsed = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(urls)))) as download_pool:
+            downloads = {download_pool.submit(self._traced_fetch, url, load_span): url for url in urls}
+            for future in as_completed(downloads):
+                url = downloads[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching {url}, exception: {e}")
+                    continue
+                parsed[url] = (result, self._parse(result))
+
+        docs = []
+        for url in urls:
+            if url not in parsed:
+                continue
+            result, future = parsed[url]
+            try:
+                # parsing overlaps the downloads, the span only covers the time still spent waiting for it
+                with span('html.parse_wait', url=url, cached=result.text is not None):
+                    text = future.result()
+            except Exception as e:
+                logger.error(f"Error parsing {url}, exception: {e}")
+                continue
+            if result.text is None:
+                self.cache.put_text(url, text)
+            docs.append(Document(page_content=text, metadata={'source': url}))
+
+        return docs
+
+    def close(self):
+        '''
+        Shuts the parsing process pool down.
+        :return:
+        '''
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
@@ -0,0 +1,156 @@
+'''
+Script that turns a recording from st.audio_input into audio ready for transcription without touching the disk.
+The WAV buffer is decoded in memory to a float32 mono NumPy array, resampled to the 16kHz Whisper expects with vectorized
+interpolation and trimmed of leading & trailing silence with an energy-based VAD. Whisper gets the array directly and the
+remote transcriber gets the trimmed audio re-encoded as 16kHz PCM16 WAV bytes, hence shorter audio on both paths.
+'''
+import io
+import subprocess
+import wave
+from dataclasses import dataclass
+
+import numpy as np
+
+TARGET_RATE = 16000 # sample rate Whisper works at
+
+
+@dataclass
+class AudioClip:
+    samples: np.ndarray # float32 mono in [-1, 1]
+    sample_rate: int
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def to_wav_bytes(self) -> bytes:
+        '''
+        :return: clip encoded as PCM16 mono WAV, e.g. for uploading to a remote transcriber.
+        '''
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes((np.clip(self.samples, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+        return buffer.getvalue()
+
+
+def read_bytes(audio) -> bytes:
+    '''
+    :param audio: raw bytes or a buffer such as the UploadedFile returned by st.audio_input.
+    :return: content of the buffer.
+    '''
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return bytes(audio)
+    if hasattr(audio, 'getbuffer'):
+        return bytes(audio.getbuffer())
+    return audio.read()
+
+
+def decode_wav(data : bytes):
+    '''
+    Function that decodes a PCM WAV file in memory.
+    :param data: WAV bytes.
+    :return: float32 mono samples in [-1, 1] & their sample rate.
+    '''
+    with wave.open(io.BytesIO(data), 'rb') as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        frames = f.readframes(f.getnframes())
+
+    if width == 1:
+        # 8 bit WAV is unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        # 24 bit: pad every sample to 32 bit little endian then shift back
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = (padded.view('<i4').ravel() >> 8).astype(np.float32) / 8388608
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"unsupported WAV sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32, copy=False), rate
+
+
+def decode_with_ffmpeg(data : bytes, sample_rate : int = TARGET_RATE) -> np.ndarray:
+    '''
+    Function that decodes any format ffmpeg knows (webm, ogg, mp3 ...) through pipes, like whisper.load_audio does with a file.
+    :param data: encoded audio bytes.
+    :param sample_rate: sample rate of the output.
+    :return: float32 mono samples.
+    '''
+    cmd = ['ffmpeg', '-nostdin', '-threads', '0', '-i', 'pipe:0', '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), 'pipe:1']
+    out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    return np.frombuffer(out, dtype='<i2').astype(np.float32) / 32768
+
+
+def resample(samples : np.ndarray, orig_rate : int, target_rate : int = TARGET_RATE) -> np.ndarray:
+    '''
+    Function that resamples with linear interpolation over the whole signal at once. Recorders mostly capture 44.1/48kHz
+    speech, whose content sits well below 8kHz, hence no separate anti-aliasing filter is applied.
+    :param samples: float32 mono samples.
+    :param orig_rate: sample rate of the samples.
+    :param target_rate: sample rate of the output.
+    :return: resampled float32 samples.
+    '''
+    if orig_rate == target_rate or len(samples) == 0:
+        return samples
+    n_out = int(round(len(samples) * target_rate / orig_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (orig_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def trim_silence(samples : np.ndarray, sample_rate : int, frame_ms : int = 30, threshold_db : float = -35.0, min_rms : float = 0.005, padding_ms : int = 200) -> np.ndarray:
+    '''
+    Function that drops leading & trailing silence with an energy-based voice activity detector: a frame is voiced when
+    its RMS is above both threshold_db relative to the loudest frame and the absolute min_rms.
+    :param samples: float32 mono samples.
+    :param sample_rate: sample rate of the samples.
+    :param frame_ms: length of the frames the energy is computed on.
+    :param threshold_db: level relative to the loudest frame below which a frame is silence.
+    :param min_rms: absolute RMS below which a frame is silence, so that pure noise isn't kept.
+    :param padding_ms: audio kept before the first & after the last voiced frame so that word edges aren't clipped.
+    :return: trimmed samples, empty if nothing was voiced.
+    '''
+    frame = max(1, sample_rate * frame_ms // 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+
+    rms = np.sqrt(np.mean(np.square(samples[:n_frames * frame].reshape(n_frames, frame), dtype=np.float64), axis=1))
+    threshold = max(rms.max() * 10 ** (threshold_db / 20), min_rms)
+    voiced = np.flatnonzero(rms > threshold)
+    if len(voiced) == 0:
+        return samples[:0]
+
+    padding = sample_rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def load_audio(audio, trim : bool = True) -> AudioClip:
+    '''
+    Function that decodes a recording in memory into 16kHz float32 mono audio.
+    :param audio: raw bytes or a buffer such as the UploadedFile returned by st.audio_input (WAV). Other formats are
+                  decoded by ffmpeg through pipes.
+    :param trim: trim leading & trailing silence.
+    :return: audio clip.
+    '''
+    data = read_bytes(audio)
+    try:
+        samples, rate = decode_wav(data)
+        samples = resample(samples, rate, TARGET_RATE)
+    except (wave.Error, EOFError):
+        samples = decode_with_ffmpeg(data, TARGET_RATE)
+
+    if trim:
+        samples = trim_silence(samples, TARGET_RATE)
+    return AudioClip(samples=np.ascontiguousarray(samples, dtype=np.float32), sample_rate=TARGET_RATE)
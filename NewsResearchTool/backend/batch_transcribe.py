@@ -0,0 +1,214 @@
+'''
+Script that transcribes recorded questions in bulk with the local Whisper model, e.g. to pre-process analyst questions offline.
+Clips are decoded & trimmed in memory (see audio_ingest), padded to Whisper's 30 second window and decoded in batches by
+the cached model of every worker of a process pool sized to the available cores. Results are streamed out as JSONL as
+soon as each batch is done and clips/sec & real-time factor are reported to size CPU-only nodes.
+
+Usage from the project root:
+    python -m NewsResearchTool.backend.batch_transcribe recordings/ --out questions.jsonl
+    find recordings -name '*.wav' | python -m NewsResearchTool.backend.batch_transcribe - --workers 4 --batch-size 8
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+AUDIO_SUFFIXES = ('.wav', '.mp3', '.m4a', '.ogg', '.webm', '.flac')
+WHISPER_WINDOW = 30 # seconds of audio Whisper decodes at once
+
+
+@dataclass
+class BatchReport:
+    clips: int = 0
+    failed: int = 0
+    audio_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    workers: int = 0
+
+    @property
+    def clips_per_sec(self) -> float:
+        return self.clips / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def real_time_factor(self) -> float:
+        '''
+        :return: wall seconds spent per second of audio for the whole pool, below 1 is faster than real time.
+        '''
+        return self.wall_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'clips': self.clips, 'failed': self.failed, 'workers': self.workers,
+            'audio_seconds': round(self.audio_seconds, 2), 'wall_seconds': round(self.wall_seconds, 2),
+            'clips_per_sec': round(self.clips_per_sec, 3), 'real_time_factor': round(self.real_time_factor, 4),
+        }
+
+
+def available_cores() -> int:
+    '''
+    :return: no of cores this process may run on (CPU affinity aware).
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def iter_audio_files(source) -> Iterator[str]:
+    '''
+    :param source: directory (searched recursively), single file, '-' for one path per line on stdin or an iterable of paths.
+    :return: generator of audio file paths.
+    '''
+    if not isinstance(source, (str, Path)):
+        yield from (str(path) for path in source)
+        return
+    if str(source) == '-':
+        yield from (line.strip() for line in sys.stdin if line.strip())
+        return
+    source = Path(source)
+    if source.is_dir():
+        yield from (str(path) for path in sorted(source.rglob('*')) if path.suffix.lower() in AUDIO_SUFFIXES)
+    else:
+        yield str(source)
+
+
+# ---------- WORKER PROCESS ----------
+def _init_worker(torch_threads : int):
+    import torch
+
+    # cores are split between the worker processes instead of every process spawning a thread per core
+    torch.set_num_threads(torch_threads)
+    from NewsResearchTool.backend.speech_to_text import load_whisper_model
+    load_whisper_model()
+
+
+def _transcribe_batch(paths : List[str]) -> List[dict]:
+    '''
+    Worker side: decodes a batch of clips and runs the clips fitting Whisper's window through one batched decode.
+    :param paths: audio file paths.
+    :return: one result per clip.
+    '''
+    import torch
+    import whisper
+    from NewsResearchTool.backend.audio_ingest import load_audio
+    from NewsResearchTool.backend.speech_to_text import load_whisper_model
+
+    model = load_whisper_model()
+    results, short = [], []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                clip = load_audio(f.read())
+        except Exception as e:
+            results.append({'path': path, 'text': None, 'audio_seconds': 0.0, 'error': f"{type(e).__name__}: {e}"})
+            continue
+        record = {'path': path, 'text': '', 'audio_seconds': round(clip.duration, 3), 'error': None, 'seconds': time.perf_counter() - start}
+        results.append(record)
+        if clip.duration == 0:
+            continue
+        if clip.duration <= WHISPER_WINDOW:
+            short.append((record, clip))
+        else:
+            # long recordings go through the sliding-window transcription one at a time
+            start = time.perf_counter()
+            record['text'] = model.transcribe(clip.samples, language='en', fp16=False, temperature=0.0, condition_on_previous_text=False)['text'].strip()
+            record['seconds'] += time.perf_counter() - start
+
+    if short:
+        start = time.perf_counter()
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(clip.samples)), n_mels=model.dims.n_mels)
+            for _, clip in short
+        ]).to(model.device)
+        options = whisper.DecodingOptions(language='en', fp16=False, temperature=0.0, without_timestamps=True)
+        with torch.inference_mode():
+            decoded = whisper.decode(model, mel, options)
+        # the batch time is shared by its clips in proportion to their duration
+        elapsed = time.perf_counter() - start
+        total = sum(clip.duration for _, clip in short)
+        for (record, clip), result in zip(short, decoded):
+            record['text'] = result.text.strip()
+            record['seconds'] += elapsed * clip.duration / total
+
+    for record in results:
+        if 'seconds' in record:
+            record['seconds'] = round(record['seconds'], 3)
+    return results
+
+
+# ---------- DRIVER ----------
+def iter_transcriptions(source, workers : Optional[int] = None, batch_size : int = 8, report : Optional[BatchReport] = None) -> Iterator[dict]:
+    '''
+    Function that transcribes clips on a process pool & yields the results batch by batch as they complete (not in input order).
+    :param source: see iter_audio_files.
+    :param workers: no of worker processes, the available cores by default.
+    :param batch_size: no of clips decoded by Whisper at once.
+    :param report: optional report filled in while transcribing.
+    :return: generator of {'path', 'text', 'audio_seconds', 'seconds', 'error'} dicts.
+    '''
+    workers = workers or available_cores()
+    report = report if report is not None else BatchReport()
+    report.workers = workers
+    torch_threads = max(1, available_cores() // workers)
+
+    paths = iter_audio_files(source)
+    batches = iter(lambda: list(islice(paths, batch_size)), [])
+    start = time.perf_counter()
+
+    # spawn keeps torch's thread pools out of the workers & bounded in-flight batches keep memory flat on huge inputs
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        in_flight = {pool.submit(_transcribe_batch, batch) for batch in islice(batches, workers * 2)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    report.clips += 1
+                    report.failed += record['error'] is not None
+                    report.audio_seconds += record['audio_seconds']
+                    report.wall_seconds = time.perf_counter() - start
+                    yield record
+                next_batch = next(batches, None)
+                if next_batch:
+                    in_flight.add(pool.submit(_transcribe_batch, next_batch))
+    report.wall_seconds = time.perf_counter() - start
+
+
+def transcribe_to_jsonl(source, out, workers : Optional[int] = None, batch_size : int = 8) -> BatchReport:
+    '''
+    Function that writes one JSON line per clip to out, flushed as soon as its batch is done.
+    :param source: see iter_audio_files.
+    :param out: writable text stream.
+    :param workers: no of worker processes, the available cores by default.
+    :param batch_size: no of clips decoded by Whisper at once.
+    :return: throughput report.
+    '''
+    report = BatchReport()
+    for record in iter_transcriptions(source, workers=workers, batch_size=batch_size, report=report):
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="directory of recordings, a single file or '-' to read paths from stdin")
+    parser.add_argument('--out', default='-', help="JSONL output file, stdout by default")
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, the available cores by default')
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8')
+    try:
+        report = transcribe_to_jsonl(args.source, out, workers=args.workers, batch_size=args.batch_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(report.as_dict()), file=sys.stderr)
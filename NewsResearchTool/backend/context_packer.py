@@ -0,0 +1,238 @@
+'''
+Script that assembles the context the retrieval tool hands to the RAG agent.
+Retrieved chunks of one article that overlap (chunk_overlap of the splitter) or touch are merged back by start_index into one
+passage, metadata is stripped down to the article url, text the agent was already given by an earlier tool call of the same
+conversation is left out and the passages are packed best first into a token budget counted with tiktoken. Prompts carry
+fewer tokens per answer, hence the model answers sooner.
+'''
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from NewsResearchTool.backend.embedding_pipeline import estimate_tokens
+
+
+# ---------- TOKENS ----------
+@lru_cache(maxsize=1)
+def _encoding():
+    '''
+    :return: tiktoken encoding of the OpenAI chat models, None if tiktoken or its vocabulary (downloaded on first use)
+             isn't available in which case tokens are estimated.
+    '''
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding('o200k_base')
+    except Exception:
+        return None
+
+
+def count_tokens(text : str) -> int:
+    '''
+    :param text: any text.
+    :return: no of tokens of the text for the chat model, estimated if tiktoken can't be loaded.
+    '''
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text : str, max_tokens : int) -> str:
+    '''
+    Function that cuts a text to at most max_tokens tokens, on a word boundary.
+    :param text: any text.
+    :param max_tokens: max no of tokens kept.
+    :return: beginning of the text.
+    '''
+    encoding = _encoding()
+    if encoding is None:
+        head = text[:max(0, max_tokens - 1) * 4]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    if len(head) < len(text) and ' ' in head:
+        head = head[:head.rindex(' ')]
+    return head
+
+
+# ---------- PASSAGES ----------
+# max no of characters between two chunks of an article for them to be merged, i.e. the separator stripped by the splitter
+MAX_GAP = 2
+
+@dataclass
+class Passage:
+    """
+    Contiguous span of one article built from one or more retrieved chunks.
+    """
+    source: str
+    start: Optional[int] # character offset in the article, None if the chunk carries no start_index
+    text: str
+    rank: int # best (lowest) retrieval rank of its chunks
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def merge_chunks(docs : List[Document]) -> List[Passage]:
+    '''
+    Function that merges the retrieved chunks of an article that overlap or touch into one passage, the overlap kept once.
+    :param docs: retrieved chunks best first, with 'source' & 'start_index' in their metadata.
+    :return: passages ordered by their best chunk.
+    '''
+    by_source: Dict[str, List[Passage]] = {}
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get('source', '')
+        by_source.setdefault(source, []).append(Passage(source, doc.metadata.get('start_index'), doc.page_content, rank))
+
+    passages = []
+    for chunks in by_source.values():
+        # chunks without an offset can't be placed in the article, they are kept as they are
+        passages.extend(chunk for chunk in chunks if chunk.start is None)
+        merged: List[Passage] = []
+        for chunk in sorted((chunk for chunk in chunks if chunk.start is not None), key=lambda chunk: chunk.start):
+            last = merged[-1] if merged else None
+            if last is not None and chunk.start <= last.end + MAX_GAP:
+                # only the part of the chunk past the end of the passage is new. The splitter strips the whitespace
+                # between consecutive chunks, it is put back as newlines so that offsets still match the article.
+                last.text += '\n' * (chunk.start - last.end) + chunk.text[max(0, last.end - chunk.start):]
+                last.rank = min(last.rank, chunk.rank)
+            else:
+                merged.append(Passage(chunk.source, chunk.start, chunk.text, chunk.rank))
+        passages.extend(merged)
+    return sorted(passages, key=lambda passage: passage.rank)
+
+
+# ---------- CONVERSATION ----------
+@dataclass
+class ConversationContext:
+    """
+    Article spans already given to the agent during one conversation, so that repeated tool calls only add new text.
+    """
+    seen: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict) # source -> given (start, end) character spans
+    seen_texts: set = field(default_factory=set) # passages without an offset, by text
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False) # tool calls of one step may run in parallel
+
+    def unseen(self, passage : Passage) -> List[Passage]:
+        '''
+        :return: the parts of the passage not given to the agent yet, at most one per gap between given spans.
+        '''
+        if passage.start is None:
+            return [] if passage.text in self.seen_texts else [passage]
+
+        parts, cursor = [], passage.start
+        for start, end in sorted(self.seen.get(passage.source, [])):
+            if end <= cursor or start >= passage.end:
+                continue
+            if start > cursor:
+                parts.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < passage.end:
+            parts.append((cursor, passage.end))
+        return [
+            Passage(passage.source, start, passage.text[start - passage.start:end - passage.start], passage.rank)
+            for start, end in parts
+        ]
+
+    def mark(self, passage : Passage):
+        if passage.start is None:
+            self.seen_texts.add(passage.text)
+        else:
+            self.seen.setdefault(passage.source, []).append((passage.start, passage.end))
+
+
+# context of the conversation the calling code runs in. Langchain's tool threads & asyncio tasks inherit it.
+_conversation: ContextVar[Optional[ConversationContext]] = ContextVar('conversation', default=None)
+
+
+@contextmanager
+def conversation() -> Iterator[ConversationContext]:
+    '''
+    Context manager scoping the de-duplication of retrieved text to one conversation e.g. one run of the agent.
+    '''
+    context = ConversationContext()
+    token = _conversation.set(context)
+    try:
+        yield context
+    finally:
+        try:
+            _conversation.reset(token)
+        except ValueError:
+            # a generator holding the conversation was closed from another context
+            pass
+
+
+# ---------- PACKING ----------
+@dataclass
+class PackStats:
+    """
+    Outcome of packing the chunks of one tool call.
+    """
+    chunks: int = 0
+    passages: int = 0 # after merging overlapping chunks
+    packed: int = 0 # passages (or parts of them) sent to the agent
+    skipped: int = 0 # passages given by an earlier tool call of the conversation
+    truncated: bool = False
+    raw_tokens: int = 0 # tokens of the chunks serialized with their whole metadata
+    tokens: int = 0 # tokens of the packed context
+
+    def as_dict(self) -> dict:
+        return {
+            'chunks': self.chunks, 'passages': self.passages, 'packed': self.packed, 'skipped': self.skipped,
+            'truncated': self.truncated, 'raw_tokens': self.raw_tokens, 'tokens': self.tokens,
+        }
+
+
+def format_passage(passage : Passage) -> str:
+    return f"Source: {passage.source}\n{passage.text.strip()}"
+
+
+def pack_context(docs : List[Document], token_budget : int = 800, min_tokens : int = 40) -> Tuple[str, PackStats]:
+    '''
+    Function that turns retrieved chunks into the context of the agent: merged passages, best first, stripped down to
+    their url, without text given earlier in the conversation (see conversation()) & within the token budget.
+    :param docs: retrieved chunks best first.
+    :param token_budget: max no of tokens of the context.
+    :param min_tokens: a passage that doesn't fit is cut to the remaining budget if at least that many tokens remain.
+    :return: context & packing stats.
+    '''
+    stats = PackStats(chunks=len(docs))
+    stats.raw_tokens = count_tokens("\n\n".join(f"Source: {doc.metadata}\n Content: {doc.page_content}" for doc in docs))
+    passages = merge_chunks(docs)
+    stats.passages = len(passages)
+
+    context = _conversation.get() or ConversationContext()
+    parts, used = [], 0
+    with context.lock:
+        for passage in passages:
+            unseen = context.unseen(passage)
+            if not unseen:
+                stats.skipped += 1
+                continue
+            for part in unseen:
+                text = format_passage(part)
+                # passages are joined by a blank line, about 1 token
+                tokens = count_tokens(text) + 1
+                if used + tokens > token_budget:
+                    remaining = token_budget - used
+                    stats.truncated = True
+                    if remaining < min_tokens:
+                        break
+                    part = Passage(part.source, part.start, truncate_to_tokens(part.text, remaining - count_tokens(f"Source: {part.source}\n") - 1), part.rank)
+                    text = format_passage(part)
+                    tokens = count_tokens(text) + 1
+                parts.append(text)
+                used += tokens
+                context.mark(part)
+                stats.packed += 1
+            if stats.truncated:
+                break
+
+    packed = "\n\n".join(parts)
+    stats.tokens = count_tokens(packed) if packed else 0
+    return packed, stats
@@ -0,0 +1,208 @@
+'''
+Script that keeps the news corpus stored in the vector index in sync with the URLs submitted on the UI.
+Work is keyed on each URL & the hash of its content rather than on the whole tuple of URLs, so adding, removing or
+re-ordering one URL only costs fetching & embedding the article that actually changed.
+'''
+import hashlib
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from NewsResearchTool.backend.vector_index import MmapVectorIndex
+
+
+def content_hash(text : str) -> str:
+    '''
+    Function that fingerprints article content so that an unchanged article is never re-split or re-embedded.
+    :param text: article content.
+    :return: hex digest of the content.
+    '''
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class SyncReport:
+    """
+    Outcome of one corpus sync.
+    """
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+
+
+class CorpusView:
+    """
+    Read-only view over the shared index restricted to the currently active URLs.
+    Exposes the same search methods as the index so it can be handed to the retrieval tool as the vector store.
+    """
+    def __init__(self, index : MmapVectorIndex, sources : Iterable[str]):
+        self.index = index
+        self.sources = tuple(sources)
+
+    def similarity_search_with_score(self, query : str, k : int = 4):
+        return self.index.similarity_search_with_score(query, k=k, sources=self.sources)
+
+    def similarity_search(self, query : str, k : int = 4) -> List[Document]:
+        return self.index.similarity_search(query, k=k, sources=self.sources)
+
+    def search(self, query : str, k : int = 4, mode : str = 'vector', alpha : float = 0.5):
+        return self.index.search(query, k=k, sources=self.sources, mode=mode, alpha=alpha)
+
+
+class NewsCorpus:
+    """
+    Corpus manager over a persistent vector index. Every chunk carries its article url ('source') and the article's
+    content hash in its metadata, hence the state of the corpus is recovered from the index itself after a restart.
+    Articles no live view searches are kept for reuse until they are idle for idle_ttl seconds or the corpus holds more
+    than max_sources articles, in which case the least recently used go first.
+    """
+    def __init__(self, index : MmapVectorIndex, loader : Callable[[List[str]], List[Document]], splitter,
+                 idle_ttl : float = 0, max_sources : Optional[int] = None):
+        '''
+        :param index: persistent vector index holding the chunks of every article.
+        :param loader: callable that fetches a list of urls & returns one langchain document per article.
+        :param splitter: text splitter used to chunk articles before embedding.
+        :param idle_ttl: seconds an article no live view searches stays indexed, 0 to drop it on the next sync.
+        :param max_sources: max no of indexed articles, None for no cap. Articles searched by a live view are never
+                            evicted hence the cap can be exceeded while they are in use.
+        '''
+        self.index = index
+        self.loader = loader
+        self.splitter = splitter
+        self.idle_ttl = idle_ttl
+        self.max_sources = max_sources
+
+        # url -> time.monotonic() it was last synced or viewed. Articles found in the index after a restart count as
+        # used when first seen.
+        self._last_used = {}
+
+        # serialises syncs coming from concurrent Streamlit sessions
+        self._lock = threading.Lock()
+
+        # views handed out & still referenced somewhere (e.g. by a cached agent or a question being answered). Every
+        # session shares the corpus, hence the articles of a live view are never dropped by another session's sync.
+        self._views = weakref.WeakSet()
+        self._views_lock = threading.Lock()
+
+    def indexed_hashes(self) -> dict:
+        '''
+        :return: mapping of every indexed url to the content hash its chunks were built from.
+        '''
+        return {source: metadata.get('content_hash') for source, metadata in self.index.sources().items()}
+
+    def referenced_sources(self) -> set:
+        '''
+        :return: article urls searched by at least one live view.
+        '''
+        with self._views_lock:
+            return {source for view in self._views for source in view.sources}
+
+    def _touch(self, urls : Iterable[str]):
+        now = time.monotonic()
+        for url in urls:
+            self._last_used[url] = now
+
+    def sync(self, urls : Iterable[str], refresh : bool = False, evict : bool = True) -> SyncReport:
+        '''
+        Function that brings the index in line with the given urls: new articles are fetched & indexed, articles that
+        were already indexed are skipped and articles neither in the list nor searched by a live view (another session's
+        articles) are evicted once idle or over the cap (see evict()).
+        :param urls: active article urls in any order.
+        :param refresh: re-fetch already indexed urls as well. Their chunks are only rebuilt if the content hash changed.
+        :param evict: evict idle articles no live view searches.
+        :return: report of what changed.
+        '''
+        active = list(dict.fromkeys(url for url in urls if url))
+        report = SyncReport()
+
+        with self._lock:
+            indexed = self.indexed_hashes()
+            self._touch(active)
+
+            to_fetch = active if refresh else [url for url in active if url not in indexed]
+            report.unchanged = [url for url in active if url not in to_fetch]
+            if to_fetch:
+                self._index(to_fetch, indexed, report)
+
+            if evict:
+                report.removed = self._evict(active)
+
+        return report
+
+    def _evict(self, active : List[str]) -> List[str]:
+        '''
+        Function that drops the articles no live view searches once they are idle for longer than idle_ttl, then the least
+        recently used ones while the corpus holds more than max_sources articles. The caller holds the lock.
+        :param active: urls of the current sync, never evicted.
+        :return: evicted urls.
+        '''
+        indexed = list(self.index.sources())
+        now = time.monotonic()
+        for url in indexed:
+            self._last_used.setdefault(url, now)
+
+        keep = set(active) | self.referenced_sources()
+        # least recently used first
+        candidates = sorted((url for url in indexed if url not in keep), key=self._last_used.get)
+        evicted = [url for url in candidates if now - self._last_used[url] >= self.idle_ttl]
+        if self.max_sources is not None:
+            over = len(indexed) - len(evicted) - self.max_sources
+            expired = set(evicted)
+            evicted += [url for url in candidates if url not in expired][:max(0, over)]
+
+        if evicted:
+            self.index.delete_sources(evicted)
+            for url in evicted:
+                self._last_used.pop(url, None)
+        return evicted
+
+    def _index(self, to_fetch : List[str], indexed : dict, report : SyncReport):
+        '''
+        Function that fetches the urls & (re-)indexes the articles whose content changed.
+        :param to_fetch: urls to fetch.
+        :param indexed: mapping of every indexed url to its content hash.
+        :param report: report filled with what changed.
+        '''
+        docs = {doc.metadata.get('source'): doc for doc in self.loader(to_fetch)}
+
+        stale, chunks = [], []
+        for url in to_fetch:
+            doc = docs.get(url)
+            if doc is None or not doc.page_content.strip():
+                report.failed.append(url)
+                continue
+
+            digest = content_hash(doc.page_content)
+            if indexed.get(url) == digest:
+                report.unchanged.append(url)
+                continue
+
+            if url in indexed:
+                stale.append(url)
+                report.updated.append(url)
+            else:
+                report.added.append(url)
+
+            doc.metadata['content_hash'] = digest
+            chunks.extend(self.splitter.split_documents([doc]))
+
+        if stale:
+            self.index.delete_sources(stale)
+        self.index.add_documents(chunks)
+
+    def view(self, urls : Iterable[str]) -> CorpusView:
+        '''
+        :param urls: active article urls.
+        :return: view of the corpus whose searches only return chunks of the given urls.
+        '''
+        view = CorpusView(self.index, dict.fromkeys(url for url in urls if url))
+        self._touch(view.sources)
+        with self._views_lock:
+            self._views.add(view)
+        return view
@@ -0,0 +1,229 @@
+'''
+Script that implements the embedding stage of the news indexing pipeline.
+Chunks are de-duplicated by content hash before the embedding model is called, the remaining ones are sent in batches
+sized by a token budget with a bounded no of batches in flight, and vectors are persisted in a single SQLite file rather
+than one small file per chunk. Every call reports chunks/sec & the cache hit ratio.
+'''
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from common.tracing import span
+from langchain_core.embeddings import Embeddings
+
+
+@dataclass
+class EmbeddingStats:
+    """
+    Throughput metrics of one or more embedding calls.
+    """
+    chunks: int = 0 # chunks requested
+    unique: int = 0 # distinct chunk texts among them
+    cache_hits: int = 0 # distinct texts served from the store
+    embedded: int = 0 # distinct texts sent to the embedding model
+    batches: int = 0 # requests made to the embedding model
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cache_hits / self.unique if self.unique else 0.0
+
+    def __iadd__(self, other):
+        self.chunks += other.chunks
+        self.unique += other.unique
+        self.cache_hits += other.cache_hits
+        self.embedded += other.embedded
+        self.batches += other.batches
+        self.seconds += other.seconds
+        return self
+
+    def as_dict(self) -> dict:
+        return {
+            'chunks': self.chunks, 'unique': self.unique, 'cache_hits': self.cache_hits, 'embedded': self.embedded,
+            'batches': self.batches, 'seconds': round(self.seconds, 4),
+            'chunks_per_sec': round(self.chunks_per_sec, 2), 'hit_ratio': round(self.hit_ratio, 4),
+        }
+
+
+class SQLiteEmbeddingStore:
+    """
+    Content-addressed embedding store holding float32 vectors as blobs in a single SQLite file.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets other workers read while one of them writes
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self._conn.commit()
+
+    def get_many(self, keys : List[str]) -> Dict[str, np.ndarray]:
+        '''
+        :param keys: content hashes to look up.
+        :return: mapping of the keys found to their vectors.
+        '''
+        found = {}
+        with self._lock:
+            # stay well below SQLite's limit on the no of bound parameters
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def put_many(self, items : Iterable):
+        '''
+        :param items: (content hash, vector) pairs to store.
+        :return:
+        '''
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)', rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def estimate_tokens(text : str) -> int:
+    '''
+    Function that estimates the no of tokens of a text (~4 characters per token for English with OpenAI tokenizers).
+    :param text: chunk text.
+    :return: estimated token count.
+    '''
+    return len(text) // 4 + 1
+
+
+class EmbeddingPipeline(Embeddings):
+    """
+    Drop-in langchain Embeddings wrapper that de-duplicates, batches & caches calls to the underlying embedding model.
+    """
+    def __init__(
+        self,
+        embedder : Embeddings,
+        store_path = "./cache/embeddings.sqlite",
+        namespace : str = '',
+        token_budget : int = 8000,
+        max_batch_size : int = 256,
+        max_concurrency : int = 4,
+    ):
+        '''
+        :param embedder: underlying embedding model e.g. OpenAIEmbeddings.
+        :param store_path: SQLite file the vectors are persisted in.
+        :param namespace: prefix of the content hash, typically the embedding model name so that models never share vectors.
+        :param token_budget: max estimated tokens sent in one request to the embedding model.
+        :param max_batch_size: max no of texts sent in one request to the embedding model.
+        :param max_concurrency: max no of requests in flight.
+        '''
+        self.embedder = embedder
+        self.store = SQLiteEmbeddingStore(store_path)
+        self.namespace = namespace
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+
+        self.last_stats = EmbeddingStats()
+        self.stats = EmbeddingStats()
+
+    def key(self, text : str) -> str:
+        return hashlib.sha256(f'{self.namespace}\0{text}'.encode('utf-8')).hexdigest()
+
+    def make_batches(self, texts : List[str]) -> List[List[str]]:
+        '''
+        Function that groups texts into batches whose estimated token count stays within the token budget.
+        A single text above the budget goes out on its own.
+        :param texts: texts to embed.
+        :return: list of batches.
+        '''
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (batch_tokens + tokens > self.token_budget or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed_documents(self, texts : List[str]) -> List[List[float]]:
+        '''
+        Function that embeds chunks, only calling the embedding model for texts neither seen before nor repeated in this call.
+        :param texts: chunk texts.
+        :return: one embedding per text, in order.
+        '''
+        with span('embedding.embed_documents', chunks=len(texts)) as embed_span:
+            vectors = self._embed_documents(texts, embed_span)
+            embed_span.set(unique=self.last_stats.unique, cache_hits=self.last_stats.cache_hits, batches=self.last_stats.batches)
+        return vectors
+
+    def _embed_batch(self, batch : List[str], parent) -> List[List[float]]:
+        # batches run on pool threads, hence the parent span is passed explicitly
+        with span('embedding.batch', parent=parent, texts=len(batch), tokens=sum(estimate_tokens(text) for text in batch)):
+            return self.embedder.embed_documents(batch)
+
+    def _embed_documents(self, texts : List[str], embed_span) -> List[List[float]]:
+        '''
+        :param embed_span: span of the call, parent of the batch spans.
+        '''
+        start = time.perf_counter()
+        stats = EmbeddingStats(chunks=len(texts))
+
+        # de-duplicate identical chunks (e.g. boilerplate repeated across articles) before anything else
+        keys = [self.key(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        stats.unique = len(unique)
+
+        vectors = self.store.get_many(list(unique))
+        stats.cache_hits = len(vectors)
+
+        missing = [key for key in unique if key not in vectors]
+        if missing:
+            batches = self.make_batches([unique[key] for key in missing])
+            stats.batches = len(batches)
+            stats.embedded = len(missing)
+
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(batches)))) as pool:
+                results = list(pool.map(lambda batch: self._embed_batch(batch, embed_span), batches))
+
+            new_vectors = zip(missing, (vector for batch in results for vector in batch))
+            new_vectors = [(key, np.asarray(vector, dtype=np.float32)) for key, vector in new_vectors]
+            self.store.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        stats.seconds = time.perf_counter() - start
+        self.last_stats = stats
+        self.stats += stats
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text : str) -> List[float]:
+        '''
+        Queries are rarely repeated verbatim hence they go straight to the embedding model.
+        :param text: user query.
+        :return: query embedding.
+        '''
+        with span('embedding.query', tokens=estimate_tokens(text)):
+            return self.embedder.embed_query(text)
@@ -0,0 +1,163 @@
+'''
+Script that implements a BM25 inverted index over the chunks of the news corpus.
+It is built at indexing time next to the vector index, scores a query without any embedding call and catches the exact
+entity names & numbers that dense retrieval tends to miss.
+'''
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+# words, plus numbers kept whole with their separators e.g. 3.5, 1,200 or 2024-25
+TOKEN_PATTERN = re.compile(r"\w+(?:[.,\-]\w+)*")
+
+
+def tokenize(text : str) -> List[str]:
+    '''
+    Function that lower-cases & splits text into word/number tokens.
+    :param text: chunk or query text.
+    :return: list of tokens.
+    '''
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index in CSR layout: the postings (row, term frequency) of term i are
+    rows[offsets[i]:offsets[i+1]] & tfs[offsets[i]:offsets[i+1]].
+    """
+    def __init__(self, terms, offsets, rows, tfs, doc_lengths, k1 : float = 1.5, b : float = 0.75):
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n = len(doc_lengths)
+        avgdl = float(doc_lengths.mean()) if n else 0.0
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # per-row length normalisation of BM25, pre-computed once
+        self.norm = (k1 * (1 - b + b * doc_lengths / avgdl)).astype(np.float32) if n else np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts : Iterable[str], **kwargs):
+        '''
+        Builds the inverted index from chunk texts, row i of the index being the i-th text.
+        :param texts: chunk texts in row order.
+        :return: BM25 index.
+        '''
+        postings = {}
+        doc_lengths = []
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [posting for term in terms for posting in postings[term]]
+        rows = np.fromiter((row for row, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((tf for _, tf in flat), dtype=np.float32, count=len(flat))
+
+        return cls(terms, offsets, rows, tfs, np.asarray(doc_lengths, dtype=np.float32), **kwargs)
+
+    @classmethod
+    def _from_postings(cls, terms : List[str], posting_terms, rows, tfs, doc_lengths, **kwargs):
+        '''
+        Lays postings out in CSR, grouped by term & rows kept in their order within a term. Terms left without postings
+        are dropped.
+        :param terms: sorted terms.
+        :param posting_terms: index in terms of every posting.
+        :return: BM25 index.
+        '''
+        # stable sort keeps the rows of a term ascending
+        order = np.argsort(posting_terms, kind='stable')
+        counts = np.bincount(posting_terms, minlength=len(terms))
+        used = counts > 0
+        offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts[used])
+        return cls([term for term, kept in zip(terms, used) if kept], offsets, rows[order], tfs[order], doc_lengths, **kwargs)
+
+    def _posting_terms(self) -> np.ndarray:
+        '''
+        :return: index in terms of every posting.
+        '''
+        return np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+
+    def extend(self, texts : Iterable[str]) -> 'BM25Index':
+        '''
+        Appends rows without re-tokenizing the existing ones: only the new texts are tokenized and their postings merged in.
+        :param texts: chunk texts of the new rows, in row order.
+        :return: new BM25 index, this one is left untouched.
+        '''
+        added = BM25Index.build(texts)
+        terms = sorted(set(self.term_ids) | set(added.term_ids))
+        term_ids = {term: i for i, term in enumerate(terms)}
+        old_ids = np.array([term_ids[term] for term in self.terms], dtype=np.int64)
+        new_ids = np.array([term_ids[term] for term in added.terms], dtype=np.int64)
+
+        # the new rows come after the existing ones, hence appending their postings keeps every term's rows ascending
+        return self._from_postings(
+            terms,
+            np.concatenate([old_ids[self._posting_terms()], new_ids[added._posting_terms()]]),
+            np.concatenate([self.rows, added.rows + len(self)]).astype(np.int32),
+            np.concatenate([self.tfs, added.tfs]).astype(np.float32),
+            np.concatenate([self.doc_lengths, added.doc_lengths]).astype(np.float32),
+            k1=self.k1, b=self.b,
+        )
+
+    def select(self, keep : np.ndarray) -> 'BM25Index':
+        '''
+        Keeps a subset of the rows, renumbered in order, without re-tokenizing anything.
+        :param keep: boolean mask over rows.
+        :return: new BM25 index, this one is left untouched.
+        '''
+        keep = np.asarray(keep, dtype=bool)
+        new_rows = np.cumsum(keep) - 1
+        kept = keep[self.rows]
+        return self._from_postings(
+            self.terms, self._posting_terms()[kept], new_rows[self.rows[kept]].astype(np.int32), self.tfs[kept],
+            self.doc_lengths[keep], k1=self.k1, b=self.b,
+        )
+
+    def save(self, path):
+        '''
+        Persists the index as a single .npz file.
+        :return:
+        '''
+        terms = np.array(self.terms, dtype=str)
+        with open(path, 'wb') as f:
+            np.savez(f, terms=terms, offsets=self.offsets, rows=self.rows, tfs=self.tfs, doc_lengths=self.doc_lengths)
+
+    @classmethod
+    def load(cls, path : Path, **kwargs):
+        with np.load(path) as data:
+            return cls(data['terms'].tolist(), data['offsets'], data['rows'], data['tfs'], data['doc_lengths'], **kwargs)
+
+    def scores(self, query : str) -> np.ndarray:
+        '''
+        Scores every row against the query.
+        :param query: user query.
+        :return: BM25 score per row (0 for rows sharing no term with the query).
+        '''
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.term_ids.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            rows, tfs = self.rows[start:end], self.tfs[start:end]
+            # rows are unique within a term's postings hence plain fancy-index addition is safe
+            scores[rows] += self.idf[i] * tfs * (self.k1 + 1) / (tfs + self.norm[rows])
+        return scores
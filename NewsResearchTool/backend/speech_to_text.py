@@ -2,14 +2,21 @@
 Script that performs STT(Speech To Text) using ASSEMBLYAI model.
 This is used to convert audio recording of user's query to question which then is fed to the LLM model along with URLs to fetch
 token response.
+Recordings are decoded, resampled to 16kHz & trimmed of silence in memory (see audio_ingest), no temp file is written.
+AssemblyAI jobs are polled with a backoff starting at a fraction of a second and the whole transcription has a hard deadline.
+If AssemblyAI hasn't answered after a short delay (or fails) a local Whisper model, preloaded in a background thread at
+startup, races it and whichever transcript comes first wins.
 '''
 import os
-import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-import whisper
-import tempfile
+import io
 from dotenv import load_dotenv
 import assemblyai as aai
+from NewsResearchTool.backend.audio_ingest import AudioClip, load_audio
+from common.tracing import span
 
 load_dotenv('.env')
 
@@ -17,69 +24,173 @@ load_dotenv('.env')
 aai.settings.api_key = os.getenv('ASSEMBLYAI_API_KEY')
 openai_api_key = os.getenv('OPENAI_API_KEY')
 
+# seconds before the whole transcription gives up & seconds AssemblyAI gets on its own before Whisper joins the race
+STT_TIMEOUT = float(os.getenv('STT_TIMEOUT', '30'))
+STT_WHISPER_DELAY = float(os.getenv('STT_WHISPER_DELAY', '4'))
+
+# AssemblyAI polling backoff: first poll after POLL_INITIAL sec, then x POLL_FACTOR up to POLL_MAX sec between polls
+POLL_INITIAL = 0.25
+POLL_FACTOR = 1.5
+POLL_MAX = 2.0
+
+# the model is loaded by one thread only & whisper's model isn't documented to be thread-safe, hence one transcription at a time
+whisper_load_lock = threading.Lock()
+whisper_run_lock = threading.Lock()
+
+# blocking SDK & Whisper calls run on this pool rather than the event loop's default executor, which asyncio.run waits for
+# on exit, hence the hard deadline holds even while a losing Whisper run is still finishing in the background
+stt_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='stt')
+
+def run_blocking(func, *args):
+    '''
+    :return: awaitable result of func(*args) run on the STT thread pool.
+    '''
+    return asyncio.get_running_loop().run_in_executor(stt_executor, func, *args)
+
 @lru_cache
+def _load_whisper_model():
+    # torch & whisper are only imported when the fallback is loaded, not when this module is
+    import whisper
+
+    return whisper.load_model('base')
+
 def load_whisper_model():
     '''
     Function that loads 'base' WHISPER model from disk to be used as a failsafe option in case AssemblyAI fails to transcribe audio.
     :return:
     '''
-    return whisper.load_model('base')
+    with whisper_load_lock:
+        return _load_whisper_model()
 
-def save_audio_file(audio):
+def preload_whisper_model() -> threading.Thread:
     '''
-    Function that saves audio file to disk in a temporary file. Whisper expects input audio to not be in bytes but as a file
-    path such as file.mp3/file.wav etc.
-    :param audio: Audio bytes fetched from frontend stored in RAM.
-    :return:
+    Function that loads the Whisper model in a background thread so that the fallback is warm by the time AssemblyAI fails
+    instead of stalling for seconds right then.
+    :return: loading thread.
     '''
-    # Whisper requires the audio file to exist so long it doesn't convert audio bytes to text hence we set delete=False below.
-    with tempfile.NamedTemporaryFile(suffix='.wav',delete=False) as f:
-        # writes entire audio byte like data from buffer in RAM to .wav file
-        f.write(audio.getbuffer())
-        # output file path to .wav
-        return f.name
+    thread = threading.Thread(target=load_whisper_model, name='whisper-preload', daemon=True)
+    thread.start()
+    return thread
 
-def transcribe_audio(audio)->str:
+async def transcribe_with_assemblyai(clip : AudioClip) -> str:
     '''
-    Function that uses AssemblyAI model which if fails uses Whisper model to convert audio containing user question to text.
+    Function that transcribes audio with AssemblyAI without blocking the event loop.
+    :param clip: decoded audio, uploaded as 16kHz PCM16 WAV bytes straight from memory.
     :return: text captured from audio.
     '''
-    # get audio file path
-    audio_file_path = save_audio_file(audio)
+    # transcribe audio to text using universal-2 model
+    config = aai.TranscriptionConfig(
+        speech_models=["universal-2"],
+        language='en' # or "universal-3-pro"
+    )
 
-    try:
-        # -----------------------------------------------------ASSEMBLY AI TRANSCRIPTION --------------------------------------------------
-        # transcribe audio to text using universal-2 model
-        config = aai.TranscriptionConfig(
-            speech_models=["universal-2"],
-            language='en' # or "universal-3-pro"
-        )
-
-        # Assembly AI creates a job to transcribe the audio file with status=queued by default in background.
+    # Assembly AI creates a job (upload + queue) to transcribe the audio file in background & returns right away.
+    with span('stt.assemblyai', audio_seconds=round(clip.duration, 2)) as stt_span:
         transcriber = aai.Transcriber(config=config)
-        job = transcriber.transcribe(audio_file_path)
+        job = await run_blocking(transcriber.submit, io.BytesIO(clip.to_wav_bytes()))
 
-        # since transcription is asynchronous in nature we wait for sometime before fetching the job to check whether it got completed or errored out
-        while job.status not in ["completed", "error"]:
-            # wait 1 sec prior to fetching job
-            time.sleep(1)
+        # short audio is usually done within a second, hence polls start fast & back off for longer recordings
+        delay = POLL_INITIAL
+        polls = 0
+        while job.status not in (aai.TranscriptStatus.completed, aai.TranscriptStatus.error):
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_FACTOR, POLL_MAX)
             # fetch updated job which's assumed to contain the converted text from audio & status
-            job = transcriber.get_transcript(job.id)
+            job = await run_blocking(aai.Transcript.get_by_id, job.id)
+            polls += 1
+        stt_span.set(polls=polls)
 
-        # if job errored out use whisper model to transcribe audio.
-        if job.status == "completed":
-            result = job.text.strip()
+    if job.status == aai.TranscriptStatus.error:
+        raise RuntimeError(f"AssemblyAI transcription failed: {job.error}")
+    return (job.text or '').strip()
 
-        return result
-    except Exception as e:
+async def transcribe_with_whisper(clip : AudioClip) -> str:
+    '''
+    Function that transcribes audio with the local Whisper model in a worker thread.
+    :param clip: decoded 16kHz audio, fed to Whisper as an array without going through ffmpeg.
+    :return: text captured from audio.
+    '''
+    # a run can't be interrupted once Whisper started, but one cancelled (lost the race or timed out) while it waited for
+    # the model or behind another run is skipped, hence the next fallback doesn't queue behind transcriptions nobody awaits
+    cancelled = threading.Event()
 
-        # ----------------------------------------------- WHISPER FALLBACK -------------------------------------------------------------
+    def run():
+        if cancelled.is_set():
+            return ''
         whisper_model = load_whisper_model()
-        job = whisper_model.transcribe(audio_file_path,language="en",fp16=False,temperature=0.0,condition_on_previous_text=False)
-        result = job['text'].strip()
+        with whisper_run_lock:
+            if cancelled.is_set():
+                return ''
+            job = whisper_model.transcribe(clip.samples,language="en",fp16=False,temperature=0.0,condition_on_previous_text=False)
+        return job['text'].strip()
 
-        return result
+    with span('stt.whisper', audio_seconds=round(clip.duration, 2)) as whisper_span:
+        try:
+            return await run_blocking(run)
+        except asyncio.CancelledError:
+            cancelled.set()
+            whisper_span.set(cancelled=True)
+            raise
+
+async def race_transcriptions(clip : AudioClip, whisper_delay : float = STT_WHISPER_DELAY) -> str:
+    '''
+    Function that starts AssemblyAI and, after whisper_delay seconds or as soon as AssemblyAI fails, Whisper as well.
+    The first transcript wins & the other attempt is cancelled.
+    :param clip: decoded audio.
+    :param whisper_delay: seconds AssemblyAI runs alone.
+    :return: text captured from audio.
+    '''
+    primary = asyncio.create_task(transcribe_with_assemblyai(clip))
+    done, _ = await asyncio.wait({primary}, timeout=whisper_delay)
+    if primary in done and primary.exception() is None:
+        return primary.result()
+
+    # ----------------------------------------------- WHISPER FALLBACK -------------------------------------------------------------
+    pending = {asyncio.create_task(transcribe_with_whisper(clip))}
+    errors = [primary.exception()] if primary in done else []
+    if primary not in done:
+        pending.add(primary)
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
     finally:
-        # clean up the temp audio file stored in disc
-        os.remove(audio_file_path)
+        for task in pending:
+            task.cancel()
+    raise errors[-1]
+
+async def atranscribe_audio(audio, timeout : float = STT_TIMEOUT, whisper_delay : float = STT_WHISPER_DELAY) -> str:
+    '''
+    Function that uses AssemblyAI model raced by a local Whisper model to convert audio containing user question to text.
+    :param audio: Audio bytes fetched from frontend stored in RAM.
+    :param timeout: hard deadline in seconds, asyncio.TimeoutError is raised beyond it.
+    :param whisper_delay: seconds AssemblyAI runs alone before Whisper joins.
+    :return: text captured from audio.
+    '''
+    async def transcribe():
+        # decode, resample & trim the recording in memory
+        with span('stt.decode') as decode_span:
+            clip = await run_blocking(load_audio, audio)
+            decode_span.set(audio_seconds=round(clip.duration, 2))
+        if clip.duration == 0:
+            # nothing but silence
+            return ''
+        return await race_transcriptions(clip, whisper_delay)
+
+    with span('stt.transcribe', timeout=timeout):
+        return await asyncio.wait_for(transcribe(), timeout=timeout)
+
+def transcribe_audio(audio)->str:
+    '''
+    Function that uses AssemblyAI model which if fails uses Whisper model to convert audio containing user question to text.
+    :return: text captured from audio.
+    '''
+    return asyncio.run(atranscribe_audio(audio))
 
+# warm up the fallback at startup, WHISPER_PRELOAD=0 skips it e.g. on machines that never fall back
+if os.getenv('WHISPER_PRELOAD', '1') == '1':
+    preload_whisper_model()
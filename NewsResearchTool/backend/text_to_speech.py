@@ -1,32 +1,62 @@
 '''
 Script that converts response generated by LLM to speech.
+Sentences are synthesized concurrently and played in order as they land through a ring buffer feeding the audio device
+(see tts_pipeline), hence the first sentence is heard while the rest of the answer is still being synthesized.
 '''
 from dotenv import load_dotenv
-from cartesia import Cartesia
 import os
-from openai import AsyncOpenAI
 # from openai.helpers import LocalAudioPlayer
 import asyncio
 import textwrap
-from typing import List
-import sounddevice as sd
+import time
+from typing import List, Optional
+from NewsResearchTool.backend.tts_pipeline import PcmRingBuffer, sentence_chunks, speak_pipelined, SAMPLE_RATE
+from NewsResearchTool.backend.tts_cache import TTSCache, tts_cache_key
+from functools import lru_cache
+from common.tracing import current_span, span
+from common.resources import get_async_openai
 
 # load .env
 load_dotenv()
-openai = AsyncOpenAI()
 
-def setup_audio_stream_pcm():
-    return sd.RawOutputStream(samplerate=24000,channels=1,dtype="int16",blocksize=0)
+# TTS settings, part of the cache key of every chunk
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_VOICE = "alloy"
+TTS_FORMAT = "pcm"
+
+@lru_cache
+def get_tts_cache():
+    '''
+    Function that opens the on-disk audio cache ONCE per process. Size cap in MB via TTS_CACHE_MAX_MB & compression of
+    new entries via TTS_CACHE_COMPRESS=1.
+    :return: content-addressed PCM cache.
+    '''
+    return TTSCache(
+        cache_dir="./cache/tts/",
+        max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024,
+        compress=os.getenv("TTS_CACHE_COMPRESS") == "1",
+    )
+
+def setup_audio_stream_pcm(callback=None):
+    # the audio device library is only loaded once something is played
+    import sounddevice as sd
+
+    return sd.RawOutputStream(samplerate=SAMPLE_RATE,channels=1,dtype="int16",blocksize=0,callback=callback)
 
 class AudioPlayer:
     """
     Plays raw PCM16 audio bytes to local speakers.
-    Designed for non-realtime (buffered) TTS playback.
+    Either buffered (blocking writes) or streaming, where the device pulls audio from a ring buffer as it plays.
     """
-    def __init__(self):
-        self.stream = setup_audio_stream_pcm()
-        self.stream.start()
+    def __init__(self, ring_buffer : Optional[PcmRingBuffer] = None):
+        '''
+        :param ring_buffer: ring buffer the device plays from. Without it audio is written to the device directly.
+        '''
+        self.ring_buffer = ring_buffer
         self.sample_size = 2  # PCM16
+        self._carry = b""  # odd byte left over by a chunk, prepended to the next one
+        self.stream = setup_audio_stream_pcm(callback=self._fill if ring_buffer is not None else None)
+        self.stream.start()
 
     # ---------- BUFFERED MODE ----------
     def play_pcm_bytes(self, pcm_bytes: bytes):
@@ -37,11 +67,39 @@ class AudioPlayer:
         playable = pcm_bytes[:-remainder] if remainder else pcm_bytes
         self.stream.write(playable)
 
+    # ---------- STREAMING MODE ----------
+    def _fill(self, outdata, frames, time_info, status):
+        # runs on the audio thread, silence is played whenever the pipeline falls behind
+        self.ring_buffer.read_into(outdata)
+
+    def write(self, pcm_bytes: bytes):
+        """
+        Queue PCM audio bytes for playback, keeping whole samples. Blocks while the ring buffer is full.
+        """
+        if self.ring_buffer is None:
+            self.play_pcm_bytes(pcm_bytes)
+            return
+        data = self._carry + pcm_bytes if self._carry else pcm_bytes
+        remainder = len(data) % self.sample_size
+        self._carry = data[-remainder:] if remainder else b""
+        self.ring_buffer.write(data[:-remainder] if remainder else data)
+
+    def drain(self, timeout: Optional[float] = None):
+        """
+        Wait until every queued byte has been played.
+        """
+        if self.ring_buffer is not None:
+            self.ring_buffer.wait_empty(timeout)
+            # the device still holds its last block
+            time.sleep(self.stream.latency + 0.05)
+
     def close(self):
         '''
         Close audio device
         :return:
         '''
+        if self.ring_buffer is not None:
+            self.ring_buffer.finish()
         self.stream.stop()
         self.stream.close()
 
@@ -57,34 +115,61 @@ def smart_chunk(llm_response,maxchars=4500)->List[str]:
 
     return textwrap.wrap(llm_response, width=maxchars, break_long_words=False, break_on_hyphens=False)
 
-async def text_to_speech(llm_response)->None:
+async def synthesize_pcm(chunk : str) -> bytes:
     '''
-    Function that converts response generated by LLM to speech.
-    It uses OPENAI's TTS service to convert LLM's response to speech that has a hard-limit of 2000 tokens hence we chunk LLM's response and
-    then feed.
-    :param llm_response: text response generated by LLM.
-    :return:
+    Function that synthesizes one chunk of text with OPENAI's TTS service.
+    :param chunk: text below the hard-limit of the model.
+    :return: PCM16 24kHz mono bytes.
     '''
-    # create chunks of llm response to prevent going over the hard limit of 2000 tokens
-    chunks = smart_chunk(llm_response)
-    final_audio = b""
-
-    # setup local audio player
-    audio_player = AudioPlayer()
-
-    for chunk in chunks:
-        response = await openai.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            voice="alloy",
-            input=chunk,
-            response_format="pcm",
-        )
+    response = await get_async_openai().audio.speech.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=chunk,
+        response_format=TTS_FORMAT,
+    )
+    return response.read()  # BYTES, not stream
 
-        pcm_bytes = response.read()  # BYTES, not stream
-        final_audio += pcm_bytes
+async def cached_synthesize_pcm(chunk : str):
+    '''
+    Function that returns the audio of a chunk from the on-disk cache, synthesizing & caching it on a miss.
+    :param chunk: text below the hard-limit of the model.
+    :return: PCM16 24kHz mono audio, memory-mapped when it comes from the cache.
+    '''
+    cache = get_tts_cache()
+    key = tts_cache_key(TTS_MODEL, TTS_VOICE, TTS_FORMAT, chunk)
+    pcm = cache.get(key)
+    # called inside the 'tts.chunk' span of the chunk
+    if current_span() is not None:
+        current_span().set(cache='miss' if pcm is None else 'hit')
+    if pcm is None:
+        pcm = await synthesize_pcm(chunk)
+        await asyncio.to_thread(cache.put, key, pcm)
+    return pcm
 
-    # play audio once
-    audio_player.play_pcm_bytes(final_audio)
+async def text_to_speech(llm_response, max_concurrency : int = 3):
+    '''
+    Function that converts response generated by LLM to speech.
+    It uses OPENAI's TTS service to convert LLM's response to speech that has a hard-limit of 2000 tokens hence we chunk LLM's response
+    on sentence boundaries, synthesize up to max_concurrency chunks at a time and play each one as soon as it and the ones
+    before it are ready.
+    :param llm_response: text response generated by LLM.
+    :param max_concurrency: max no of chunks synthesized at the same time.
+    :return: stats of the synthesis e.g. time to first audio.
+    '''
+    # first chunk is one short sentence, the next ones grow up to the hard limit of 2000 tokens
+    chunks = sentence_chunks(llm_response, first_chars=200, max_chars=4500)
 
-    # close audio player
-    audio_player.close()
\ No newline at end of file
+    with span('tts.text_to_speech', chars=len(llm_response), chunks=len(chunks)) as tts_span:
+        # setup local audio player that plays from a preallocated ring buffer while the rest is being synthesized
+        audio_player = AudioPlayer(ring_buffer=PcmRingBuffer())
+        try:
+            # chunks synthesized before (replayed or overlapping answers) are played from disk without a network call
+            stats = await speak_pipelined(chunks, cached_synthesize_pcm, audio_player, max_concurrency=max_concurrency)
+            tts_span.set(first_audio_ms=None if stats.first_audio_seconds is None else round(stats.first_audio_seconds * 1000, 1))
+            # let the buffered audio play out
+            with span('tts.playback_drain'):
+                await asyncio.to_thread(audio_player.drain)
+        finally:
+            # close audio player
+            audio_player.close()
+    return stats
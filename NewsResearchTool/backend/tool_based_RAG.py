@@ -1,69 +1,103 @@
 '''
 Script that demonstrates usage of tool-based RAG agent to fetch answers to user queries pertaining to news articles from some
 popular websites.
+The chat model, embeddings, corpus & agents are created on first use, hence importing this module is cheap.
 '''
-from langchain_community.document_loaders import UnstructuredURLLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.vectorstores import InMemoryVectorStore
-from langchain.agents import create_agent
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_classic.embeddings import CacheBackedEmbeddings
 from dotenv import load_dotenv
 from pathlib import Path
 from langchain_core.tools import tool
 import os
-from langchain_classic.storage import LocalFileStore
-from functools import lru_cache
+from common.resources import get_chat_model, get_embeddings, resource
+from NewsResearchTool.backend.vector_index import MmapVectorIndex
+from NewsResearchTool.backend.corpus_manager import NewsCorpus
+from NewsResearchTool.backend.article_loader import ArticleLoader
+from NewsResearchTool.backend.embedding_pipeline import EmbeddingPipeline
+from NewsResearchTool.backend.agent_registry import AgentRegistry
+from NewsResearchTool.backend.context_packer import conversation, pack_context
+from common.streaming import iter_text_deltas, aiter_text_deltas
+from common.tracing import SpanCallbackHandler, span
+import asyncio
+import time
 
 #.env path
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# fetch API key
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# directory holding the persistent memory-mapped vector index
+index_root = Path("./cache/vector_index/")
 
-# create a cache in disk to store embeddings of text once generated
-store = LocalFileStore("./cache/")
+# compiled RAG agents keyed on the set of articles they retrieve from. Size cap configurable via NEWS_AGENT_CACHE_SIZE.
+agent_registry = AgentRegistry(max_size=int(os.getenv("NEWS_AGENT_CACHE_SIZE", "8")))
 
-# create model
-model = ChatOpenAI(
-    model='gpt-5.2',
-    api_key=openai_api_key,
-    temperature=0.3, # higher number indicates more randomness in the model's output
-    max_tokens=500, #defines the no of words in the model's response
-    timeout=30 # max time in sec to wait for model's response
-)
+@resource
+def get_article_loader():
+    '''
+    Function that creates the article loader ONCE per process so that its HTML parsing process pool is re-used.
+    :return: concurrent article loader backed by an on-disk HTTP cache.
+    '''
+    return ArticleLoader(cache_dir="./cache/http/", max_workers=8, per_host_limit=2)
 
-@lru_cache
-def index_documents_to_vector_db(urls : tuple):
+def load_articles(urls : list):
     '''
-    Function that fetches articles using urls, converts them to fixed-size vectors and store them in vector database
-    for fast retrieval using similarity search.
-    parameters: urls (tuples of strings)
-    :return: vector database
+    Function that fetches articles using urls concurrently & creates one langchain document per article with attributes such as page_content & metadata.
+    :param urls: list of article urls.
+    :return: list of langchain documents.
     '''
+    return get_article_loader().load(urls)
 
-    # initialize url loader with the URLs of all the news articles & create langchain documents. Each document has attributes such as page_content & metadata.
-    url_loader = UnstructuredURLLoader(list(urls))
-    news_docs = url_loader.load()
+@resource
+def get_news_corpus():
+    '''
+    Function that opens the persistent news corpus ONCE per process. The vector database lives on disk as a memory-mapped
+    matrix so it survives restarts and is shared between workers.
+    :return: corpus manager over the vector database.
+    '''
 
-    # use text-splitter to create chunks/document-splits for easy indexing later on from vector database
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,chunk_overlap=200,length_function=len,add_start_index=True)
-    chunks = text_splitter.split_documents(news_docs)
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
     # setup embedding model to convert chunks/document-splits to numerical fixed-sized vectors
-    embedding = OpenAIEmbeddings(api_key=openai_api_key)
+    embedding = get_embeddings()
 
-    # wrap embedding with cache so that for repeated docs embeddings are fetched from cache rather than re-generated.
-    cached_embedder = CacheBackedEmbeddings.from_bytes_store(underlying_embeddings=embedding,document_embedding_cache=store,namespace=embedding.model)
+    # wrap embedding with a de-duplicating, batching pipeline so that repeated chunks are fetched from a single SQLite
+    # store in disk rather than re-generated.
+    cached_embedder = EmbeddingPipeline(embedding, store_path="./cache/embeddings.sqlite", namespace=embedding.model, token_budget=8000, max_concurrency=4)
 
-    # setup lightweight vector database with embeddings & add documents to the database such that they get automatically converted to vectors
-    vector_store = InMemoryVectorStore(embedding=cached_embedder)
-    ids = vector_store.add_documents(chunks)
+    # use text-splitter to create chunks/document-splits for easy indexing later on from vector database
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,chunk_overlap=200,length_function=len,add_start_index=True)
+
+    # articles no session searches anymore stay indexed for NEWS_ARTICLE_TTL hours, at most NEWS_MAX_ARTICLES of them
+    # (0 for no cap). The embedding store makes re-indexing an evicted article cheap.
+    vector_store = MmapVectorIndex(index_root / 'news', embedding=cached_embedder)
+    max_articles = int(os.getenv('NEWS_MAX_ARTICLES', '200'))
+    return NewsCorpus(
+        vector_store, loader=load_articles, splitter=text_splitter,
+        idle_ttl=float(os.getenv('NEWS_ARTICLE_TTL', '1')) * 3600, max_sources=max_articles or None,
+    )
+
+def index_documents_to_vector_db(urls : tuple):
+    '''
+    Function that fetches articles using urls, converts them to fixed-size vectors and store them in vector database
+    for fast retrieval using similarity search. Only articles not indexed yet are fetched & embedded, articles no session
+    searched for a while are evicted and the returned store only searches the given urls.
+    parameters: urls (tuples of strings)
+    :return: vector database restricted to the given urls
+    '''
+    corpus = get_news_corpus()
+    corpus.sync(urls)
 
-    return vector_store
+    return corpus.view(urls)
 
-def create_retrieve_tool(vector_store):
+def create_retrieve_tool(vector_store, mode='hybrid', k=2, alpha=0.5, token_budget=None):
+    '''
+    Function that creates the retrieval tool of the RAG agent over the given vector store.
+    :param vector_store: corpus view to search.
+    :param mode: 'vector' (dense only), 'hybrid' (BM25 fused with dense scores) or 'lexical' (BM25 only, no embedding call).
+    :param k: no of chunks returned per tool call.
+    :param alpha: weight of the dense score in hybrid mode.
+    :param token_budget: max no of tokens of context per tool call, NEWS_CONTEXT_TOKENS (800) by default.
+    :return: langchain tool.
+    '''
+    token_budget = token_budget or int(os.getenv('NEWS_CONTEXT_TOKENS', '800'))
 
     @tool
     def retrieve_context_with_tool_based_rag(query : str):
@@ -73,46 +107,92 @@ def create_retrieve_tool(vector_store):
         :return: relevant documents from vector database
         '''
 
-        # fetch the most relevant document form database basis query
-        retrieved_docs = vector_store.similarity_search(query,k=2)
+        # fetch the most relevant document form database basis query. Hybrid search also catches exact names & numbers.
+        with span('retrieval.search', mode=mode, k=k) as search_span:
+            retrieved_docs = [doc for doc, _ in vector_store.search(query, k=k, mode=mode, alpha=alpha)]
+            search_span.set(results=len(retrieved_docs))
 
-        # create output from each relevant documents as Source: Document link; Content: Document content.
-        serialized = "\n\n".join(f"Source: {doc.metadata}\n Content: {doc.page_content}" for doc in retrieved_docs)
+        # overlapping chunks merged into passages under their url only, minus what earlier calls of this run returned,
+        # packed best first into the token budget
+        with span('retrieval.pack', token_budget=token_budget) as pack_span:
+            context, stats = pack_context(retrieved_docs, token_budget=token_budget)
+            pack_span.set(**stats.as_dict())
 
-        return serialized
+        if not context and retrieved_docs:
+            return "No new content: the relevant passages were already retrieved above."
+        return context
 
     return retrieve_context_with_tool_based_rag
 
-def call_rag_agent(query : str, urls):
+def build_rag_agent(vector_store):
     '''
-    Function that creates RAG agent for user query.
-    :param query: user query
-    :param urls: url of news articles to fetch data from
-    :return: LLM RAG agent output just like chat bot does with text appearing progressively.
+    Function that compiles the RAG agent along with its retrieval tool over the given vector store.
+    :param vector_store: corpus view the agent retrieves from.
+    :return: compiled agent.
     '''
 
-    # build vector store ONCE
-    vector_store = index_documents_to_vector_db(urls)
+    from langchain.agents import create_agent
 
     # create retrieval tool that captures vector_store
     retrieve_tool = create_retrieve_tool(vector_store)
 
-    output = ""
-
     # setup RAG agent
-    agent = create_agent(
-        model=model,
+    return create_agent(
+        model=get_chat_model(),
         tools=[retrieve_tool],
         system_prompt="""
         You are a news research agent that displays response as per user query.
         Please SHOW response source such as the news article URL the response is gathered from at the end as well.
         """)
 
-    for token,metadata in agent.stream({"messages":[{"role":"user","content":query}]}, stream_mode="messages"):
-        node = metadata['langgraph_node']
-        content = token.content_blocks
-
-        if node == 'model' and content and content[0].get('text', ''):
-            # capture progressively increasing response
-            output += content[0]['text']
-            yield output
\ No newline at end of file
+def call_rag_agent(query : str, urls):
+    '''
+    Function that runs the RAG agent for user query. The agent is compiled once per set of article urls and re-used.
+    The run is traced as a 'news.call_rag_agent' span with article loading, embedding, the agent's node steps, model &
+    tool calls and retrieval nested under it.
+    :param query: user query
+    :param urls: url of news articles to fetch data from
+    :return: generator of text deltas of the LLM RAG agent output, rendered progressively by the frontend just like a chat bot.
+    '''
+    with span('news.call_rag_agent', question_chars=len(query), urls=len(urls)) as request_span:
+        # build vector store ONCE
+        with span('news.index_documents'):
+            vector_store = index_documents_to_vector_db(urls)
+
+        # fetch compiled agent for this set of articles. The order of urls doesn't matter to retrieval hence a frozenset key.
+        with span('news.get_agent'):
+            agent = agent_registry.get(frozenset(vector_store.sources), lambda: build_rag_agent(vector_store))
+
+        start = time.perf_counter()
+        try:
+            # retrieved text is given to the agent once per question, however many times it calls the tool
+            with conversation():
+                # yield only the new text of every chunk, the frontend accumulates it
+                config = {'callbacks': [SpanCallbackHandler(request_span)]}
+                yield from iter_text_deltas(agent.stream({"messages":[{"role":"user","content":query}]}, stream_mode="messages", config=config))
+        finally:
+            agent_registry.record_answer(time.perf_counter() - start)
+
+async def acall_rag_agent(query : str, urls):
+    '''
+    Async version of call_rag_agent. Articles are loaded & embedded and the agent is compiled in worker threads, hence
+    concurrent questions served from one event loop don't block each other meanwhile.
+    :param query: user query
+    :param urls: url of news articles to fetch data from
+    :return: async generator of text deltas of the LLM RAG agent output.
+    '''
+    with span('news.call_rag_agent', question_chars=len(query), urls=len(urls)) as request_span:
+        with span('news.index_documents'):
+            vector_store = await asyncio.to_thread(index_documents_to_vector_db, urls)
+
+        with span('news.get_agent'):
+            agent = await asyncio.to_thread(agent_registry.get, frozenset(vector_store.sources), lambda: build_rag_agent(vector_store))
+
+        start = time.perf_counter()
+        try:
+            with conversation():
+                config = {'callbacks': [SpanCallbackHandler(request_span)]}
+                async for delta in aiter_text_deltas(agent.astream({"messages":[{"role":"user","content":query}]}, stream_mode="messages", config=config)):
+                    yield delta
+        finally:
+            agent_registry.record_answer(time.perf_counter() - start)
@@ -0,0 +1,128 @@
+'''
+Script that caches synthesized speech on disk. Every chunk of PCM audio is stored under the hash of what produced it
+(model, voice, format & chunk text), hence replayed or overlapping answers are played straight from a memory-mapped file
+without calling the TTS endpoint again. The cache is bounded in size and evicts the least recently played chunks first.
+'''
+import hashlib
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+RAW_SUFFIX = '.pcm'
+COMPRESSED_SUFFIX = '.pcm.z'
+
+
+def tts_cache_key(model : str, voice : str, response_format : str, text : str) -> str:
+    '''
+    :return: content address of the audio of a chunk of text.
+    '''
+    return hashlib.sha256('\0'.join((model, voice, response_format, text)).encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Size-bounded, content-addressed on-disk cache of synthesized audio with LRU eviction.
+    """
+    def __init__(self, cache_dir = "./cache/tts/", max_bytes : int = 256 * 1024 * 1024, compress : bool = False):
+        '''
+        :param cache_dir: directory holding one file per chunk.
+        :param max_bytes: max total size of the files, least recently played chunks are evicted beyond it.
+        :param compress: store new entries zlib-compressed. Saves disk on answers with pauses but costs a decompression
+                         (no mmap) on every hit. Entries written either way are readable.
+        '''
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # recency index rebuilt from the modification times, which are bumped on every hit
+        self._entries = OrderedDict() # key -> (path, size)
+        self._bytes = 0
+        files = [path for path in self.cache_dir.iterdir() if path.name.endswith((RAW_SUFFIX, COMPRESSED_SUFFIX))]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.name.split('.')[0]] = (path, size)
+            self._bytes += size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key : str) -> Optional[Union[mmap.mmap, bytes]]:
+        '''
+        :param key: content address from tts_cache_key.
+        :return: PCM audio, memory-mapped for uncompressed entries, or None if the chunk was never synthesized.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path, size = entry
+
+        try:
+            os.utime(path)
+            if path.name.endswith(COMPRESSED_SUFFIX):
+                return zlib.decompress(path.read_bytes())
+            if size == 0:
+                return b""
+            with open(path, 'rb') as f:
+                # the mapping stays valid after the file is closed, pages are read lazily while the audio plays
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, zlib.error):
+            # evicted or corrupted by another process
+            with self._lock:
+                self._forget(key)
+            return None
+
+    def put(self, key : str, pcm : bytes):
+        '''
+        Stores the audio of a chunk & evicts the least recently played chunks beyond max_bytes.
+        :param key: content address from tts_cache_key.
+        :param pcm: PCM audio bytes.
+        :return:
+        '''
+        data = zlib.compress(pcm, 1) if self.compress else pcm
+        path = self.cache_dir / (key + (COMPRESSED_SUFFIX if self.compress else RAW_SUFFIX))
+        if len(data) > self.max_bytes:
+            return
+
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous[0] != path:
+                # stored before with the other compression setting
+                previous[0].unlink(missing_ok=True)
+            self._forget(key)
+            self._entries[key] = (path, len(data))
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                oldest_path, _ = self._entries[oldest]
+                self._forget(oldest)
+                try:
+                    oldest_path.unlink()
+                except OSError:
+                    # e.g. still memory-mapped for playback on Windows, removed on a later eviction
+                    pass
+
+    def _forget(self, key : str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
@@ -0,0 +1,200 @@
+'''
+Script that pipelines text to speech: the answer is split on sentence boundaries with a short first chunk, chunk syntheses
+are requested concurrently (bounded) and played in order as soon as each one lands. PCM audio is written into a
+preallocated ring buffer that the audio device drains, hence playback starts after the first short sentence is
+synthesized instead of after the whole answer.
+'''
+import asyncio
+import re
+import textwrap
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from common.tracing import span
+
+SAMPLE_RATE = 24000 # OpenAI TTS returns 24kHz mono PCM16
+SAMPLE_SIZE = 2
+
+# end of a sentence: ., ! or ? optionally followed by closing quotes/brackets, then whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+def split_sentences(text : str) -> List[str]:
+    '''
+    :param text: text to split.
+    :return: sentences of the text without surrounding whitespace.
+    '''
+    return [sentence.strip() for sentence in SENTENCE_END.split(text.strip()) if sentence.strip()]
+
+
+def sentence_chunks(text : str, first_chars : int = 200, max_chars : int = 4500) -> List[str]:
+    '''
+    Function that packs sentences into TTS chunks. The first chunk is a single short sentence so that audio starts early,
+    later chunks double in size up to max_chars so that a long answer doesn't turn into many requests.
+    Sentences longer than the current limit are wrapped on whitespace like smart_chunk does.
+    :param text: text response generated by LLM.
+    :param first_chars: max no of characters of the first chunk.
+    :param max_chars: max no of characters of any chunk, below the hard limit of the TTS model.
+    :return: list of chunks in reading order.
+    '''
+    chunks = []
+    current = ''
+    limit = first_chars
+    for sentence in split_sentences(text):
+        pieces = [sentence] if len(sentence) <= limit else textwrap.wrap(sentence, width=limit, break_long_words=False, break_on_hyphens=False)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > limit:
+                chunks.append(current)
+                current = ''
+                limit = min(limit * 2, max_chars)
+            current = f"{current} {piece}" if current else piece
+            # the first chunk is never more than one sentence
+            if not chunks:
+                chunks.append(current)
+                current = ''
+                limit = min(limit * 2, max_chars)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class PcmRingBuffer:
+    """
+    Fixed-size, thread-safe byte ring buffer between the synthesis pipeline (writer) and the audio device (reader).
+    The writer blocks while the buffer is full, the reader never blocks and gets silence on underrun.
+    """
+    def __init__(self, capacity : int = SAMPLE_RATE * SAMPLE_SIZE * 30):
+        '''
+        :param capacity: size of the buffer in bytes, 30 seconds of 24kHz PCM16 by default.
+        '''
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._size = 0
+        self._finished = False
+        self._started = False # underruns only count once audio started flowing
+        self._condition = threading.Condition()
+        self.underruns = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data : bytes):
+        '''
+        Copies data into the buffer, waiting for the reader whenever the buffer is full.
+        :param data: PCM bytes.
+        :return:
+        '''
+        data = memoryview(data).cast('B')
+        offset = 0
+        while offset < len(data):
+            with self._condition:
+                while self._size == self.capacity and not self._finished:
+                    self._condition.wait()
+                if self._finished:
+                    return
+                n = min(len(data) - offset, self.capacity - self._size)
+                end = (self._start + self._size) % self.capacity
+                first = min(n, self.capacity - end)
+                self._view[end:end + first] = data[offset:offset + first]
+                self._view[:n - first] = data[offset + first:offset + n]
+                self._size += n
+                self._started = True
+                offset += n
+                self._condition.notify_all()
+
+    def read_into(self, out) -> int:
+        '''
+        Fills out with buffered bytes and the rest with silence. Called from the audio callback hence it never waits.
+        :param out: writable buffer e.g. the outdata of a sounddevice callback.
+        :return: no of buffered bytes copied.
+        '''
+        out = memoryview(out).cast('B')
+        with self._condition:
+            n = min(len(out), self._size)
+            first = min(n, self.capacity - self._start)
+            out[:first] = self._view[self._start:self._start + first]
+            out[first:n] = self._view[:n - first]
+            self._start = (self._start + n) % self.capacity
+            self._size -= n
+            if n < len(out) and self._started and not self._finished:
+                self.underruns += 1
+            self._condition.notify_all()
+        out[n:] = bytes(len(out) - n)
+        return n
+
+    def finish(self):
+        '''
+        Marks the end of the audio, pending writes are dropped.
+        :return:
+        '''
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def wait_empty(self, timeout : Optional[float] = None) -> bool:
+        '''
+        :param timeout: max seconds to wait.
+        :return: True once every buffered byte was read.
+        '''
+        with self._condition:
+            return self._condition.wait_for(lambda: self._size == 0, timeout)
+
+
+@dataclass
+class TTSStats:
+    chunks: int = 0
+    bytes: int = 0
+    first_audio_seconds: Optional[float] = None # from the request to the first PCM handed to the sink
+    synthesis_seconds: float = 0.0 # from the request to the last PCM handed to the sink
+
+    def as_dict(self) -> dict:
+        return {
+            'chunks': self.chunks, 'bytes': self.bytes, 'synthesis_seconds': round(self.synthesis_seconds, 3),
+            'first_audio_seconds': None if self.first_audio_seconds is None else round(self.first_audio_seconds, 3),
+        }
+
+
+async def speak_pipelined(
+    chunks : List[str],
+    synthesize : Callable[[str], Awaitable[bytes]],
+    sink,
+    max_concurrency : int = 3,
+) -> TTSStats:
+    '''
+    Function that synthesizes chunks concurrently and hands their PCM to the sink in reading order as soon as each is ready.
+    :param chunks: text chunks in reading order e.g. from sentence_chunks.
+    :param synthesize: async callable returning the PCM16 bytes of a chunk.
+    :param sink: object with write(pcm) (may block e.g. while the ring buffer is full) such as AudioPlayer.
+    :param max_concurrency: max no of syntheses in flight.
+    :return: stats of the run.
+    '''
+    start = time.perf_counter()
+    stats = TTSStats(chunks=len(chunks))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(index, chunk):
+        async with semaphore:
+            with span('tts.chunk', index=index, chars=len(chunk)) as chunk_span:
+                pcm = await synthesize(chunk)
+                chunk_span.set(bytes=len(pcm))
+                return pcm
+
+    # tasks start in order, hence the semaphore lets the earliest chunks through first
+    tasks = [asyncio.create_task(run(index, chunk)) for index, chunk in enumerate(chunks)]
+    try:
+        for task in tasks:
+            pcm = await task
+            # writing may block on a full ring buffer, which must not stall the syntheses in flight
+            await asyncio.to_thread(sink.write, pcm)
+            if stats.first_audio_seconds is None:
+                stats.first_audio_seconds = time.perf_counter() - start
+            stats.bytes += len(pcm)
+    finally:
+        for task in tasks:
+            task.cancel()
+    stats.synthesis_seconds = time.perf_counter() - start
+    return stats
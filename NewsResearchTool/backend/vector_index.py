@@ -0,0 +1,436 @@
+'''
+Script that implements a persistent, memory-mapped vector index for the chunks of news articles.
+Vectors are stored as one contiguous float32 matrix in a memory-mapped file while chunk text & metadata live in a JSON sidecar.
+Since the matrix is memory-mapped, several Streamlit workers can share one corpus through the OS page cache and a restart
+doesn't need to re-embed or re-load anything.
+'''
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from NewsResearchTool.backend.lexical_index import BM25Index
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers are only serialised within one process
+    fcntl = None
+
+SEARCH_MODES = ('vector', 'hybrid', 'lexical')
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Rows of the index as of one commit, read together so that a search never scores the rows of one commit with the
+    vectors or BM25 index of another.
+    """
+    records: List[dict]
+    vectors: np.ndarray
+    source_ids: Dict[str, int]
+    source_codes: np.ndarray
+    lexical: Optional[BM25Index] = None
+
+
+class MmapVectorIndex:
+    """
+    Persistent vector index with NumPy-vectorized top-k cosine search, plus a BM25 inverted index over the same rows for
+    lexical & hybrid search.
+    Layout of the index directory:
+        vectors-<version>.f32 -> row-major float32 matrix of L2-normalised embeddings (one row per chunk)
+        lexical-<version>.npz -> BM25 inverted index over the chunk texts
+        meta.json             -> dimension, names of the current vector & lexical files and the chunk records (id, text, metadata) in row order
+    The sidecar is always replaced atomically after the vectors are flushed, so readers never see rows without metadata.
+    Writers of every process hold an exclusive lock on index_dir/.lock (fcntl.flock) while they refresh, write & commit,
+    hence several workers can add to & delete from one index. Without fcntl (Windows) only one process may write.
+    Deletes rewrite the surviving rows into a new vector file, hence readers still mapping the old file are unaffected.
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, index_dir, embedding):
+        '''
+        :param index_dir: directory holding the vector matrix & metadata sidecar. Created if missing.
+        :param embedding: langchain embedding model used to embed chunks & queries.
+        '''
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.embedding = embedding
+        self.vectors_path = None
+        self.lexical_path = None
+        self.meta_path = self.index_dir / self.META_FILE
+        self.lock_path = self.index_dir / '.lock'
+
+        # guards the in-memory state, which readers take a snapshot of. Writers also hold it (see _write_lock)
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self.dim = None
+        self._records = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._source_codes = np.empty(0, dtype=np.int64)
+        self._source_ids = {}
+        self._lexical = None
+
+        self._refresh()
+
+    def __len__(self):
+        return len(self._snapshot().records)
+
+    # ---------- LOADING ----------
+    def _refresh(self):
+        '''
+        Reloads metadata & re-maps the vector file whenever another writer (thread or process) committed new rows.
+        :return:
+        '''
+        try:
+            stat = self.meta_path.stat()
+        except FileNotFoundError:
+            return
+        # the sidecar is replaced by a new file on every commit, hence its inode tells two commits apart even when they
+        # fall within one tick of the file system's clock
+        mtime = (stat.st_ino, stat.st_mtime_ns)
+        if mtime == self._meta_mtime:
+            return
+
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.dim = meta['dim']
+        self._records = meta['records']
+        self.vectors_path = self.index_dir / meta['vectors']
+        self.lexical_path = self.index_dir / meta['lexical'] if meta.get('lexical') else None
+        self._lexical = None
+
+        # integer code of every row's source url so that source filters become one vectorized comparison
+        self._source_ids = {}
+        self._source_codes = np.fromiter(
+            (self._source_ids.setdefault(r['metadata'].get('source'), len(self._source_ids)) for r in self._records),
+            dtype=np.int64, count=len(self._records),
+        )
+
+        # np.memmap can't map an empty file hence an empty matrix stands in for a fresh index
+        if self._records:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self._records), self.dim))
+        else:
+            self._vectors = np.empty((0, self.dim or 0), dtype=np.float32)
+        self._meta_mtime = mtime
+
+    def _write_meta(self):
+        '''
+        Atomically replaces the metadata sidecar.
+        :return:
+        '''
+        tmp_path = self.meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dim': self.dim,
+                'vectors': self.vectors_path.name,
+                'lexical': self.lexical_path.name if self.lexical_path else None,
+                'records': self._records,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def _write_lexical(self, lexical : BM25Index) -> Optional[Path]:
+        '''
+        Saves the BM25 index of the new rows into a new file. Called at indexing time before the sidecar is replaced so
+        that the inverted index always matches the rows of the vector file. Writers update the index incrementally (only
+        added texts are tokenized) but the file is still rewritten whole, which is cheap next to embedding the chunks.
+        :param lexical: BM25 index matching the rows about to be committed.
+        :return: path of the previous lexical file which can be removed once the sidecar points to the new one.
+        '''
+        old_path = self.lexical_path
+        self.lexical_path = self.index_dir / f'lexical-{uuid.uuid4().hex}.npz'
+        lexical.save(self.lexical_path)
+        return old_path
+
+    def _load_lexical(self) -> BM25Index:
+        '''
+        :return: BM25 index of the rows in memory, loaded from disk on first use. The caller holds the lock.
+        '''
+        if self._lexical is None:
+            if self.lexical_path is not None and self.lexical_path.exists():
+                self._lexical = BM25Index.load(self.lexical_path)
+            else:
+                # index written before lexical search existed
+                self._lexical = BM25Index.build(record['text'] for record in self._records)
+        return self._lexical
+
+    def _snapshot(self, lexical : bool = False) -> Snapshot:
+        '''
+        Refreshes the index & reads its state at once under the lock, hence never halfway through a write or a refresh.
+        :param lexical: include the BM25 index, loaded from disk on first use.
+        :return: snapshot of the current rows.
+        '''
+        with self._lock:
+            self._refresh()
+            return Snapshot(
+                self._records, self._vectors, self._source_ids, self._source_codes,
+                self._load_lexical() if lexical else None,
+            )
+
+    def lexical_index(self) -> BM25Index:
+        '''
+        :return: BM25 index of the current rows, loaded from disk on first use.
+        '''
+        return self._snapshot(lexical=True).lexical
+
+    @staticmethod
+    def _normalize(vectors : np.ndarray) -> np.ndarray:
+        '''
+        L2-normalises vectors so that cosine similarity reduces to a dot product at query time.
+        :param vectors: 1D or 2D array of embeddings.
+        :return: normalised float32 array.
+        '''
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _new_vectors_path(index_dir : Path) -> Path:
+        return index_dir / f'vectors-{uuid.uuid4().hex}.f32'
+
+    def sources(self) -> Dict[str, dict]:
+        '''
+        Lists the sources (article urls) present in the index.
+        :return: mapping of source to the metadata of its first chunk.
+        '''
+        sources = {}
+        for record in self._snapshot().records:
+            sources.setdefault(record['metadata'].get('source'), record['metadata'])
+        return sources
+
+    # ---------- WRITING ----------
+    @contextmanager
+    def _write_lock(self):
+        '''
+        Context manager serialising writers across threads & processes. The file lock is taken first, hence readers of
+        this process only wait while a writer of this process actually writes, not while it waits for another process.
+        Every write must refresh under it, so that it appends to & rewrites the rows last committed by any process.
+        '''
+        with open(self.lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                # released when the file is closed, even if the writer fails
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            with self._lock:
+                yield
+
+    def add_documents(self, documents : List[Document]) -> List[str]:
+        '''
+        Embeds documents and appends them to the index.
+        :param documents: langchain documents (chunks) to be indexed.
+        :return: ids of the newly added chunks.
+        '''
+        if not documents:
+            return []
+        vectors = self.embedding.embed_documents([doc.page_content for doc in documents])
+        return self.add_vectors(documents, vectors)
+
+    def add_vectors(self, documents : List[Document], vectors) -> List[str]:
+        '''
+        Appends pre-computed embeddings with their documents to the index.
+        :param documents: langchain documents (chunks) the vectors belong to.
+        :param vectors: one embedding per document.
+        :return: ids of the newly added chunks.
+        '''
+        vectors = self._normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(documents):
+            raise ValueError('Expected exactly one embedding per document.')
+
+        with self._write_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f'Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}.')
+
+            ids = [doc.id or uuid.uuid4().hex for doc in documents]
+            row_bytes = self.dim * np.dtype(np.float32).itemsize
+
+            if self.vectors_path is None:
+                self.vectors_path = self._new_vectors_path(self.index_dir)
+
+            # drop any rows left behind by an interrupted write before appending
+            mode = 'r+b' if self.vectors_path.exists() else 'w+b'
+            with open(self.vectors_path, mode) as f:
+                f.truncate(len(self._records) * row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            lexical = self._load_lexical().extend(doc.page_content for doc in documents)
+            self._records = self._records + [
+                {'id': chunk_id, 'text': doc.page_content, 'metadata': doc.metadata}
+                for chunk_id, doc in zip(ids, documents)
+            ]
+            old_lexical = self._write_lexical(lexical)
+            self._write_meta()
+            self._meta_mtime = None
+            self._refresh()
+            # the refresh dropped the BM25 index in memory, the one just written is kept instead of loading it back
+            self._lexical = lexical
+            if old_lexical is not None:
+                old_lexical.unlink(missing_ok=True)
+
+        return ids
+
+    def delete_sources(self, sources : Iterable[str]) -> int:
+        '''
+        Removes every chunk belonging to the given sources by rewriting the surviving rows into a new vector file.
+        :param sources: article urls to drop.
+        :return: no of chunks removed.
+        '''
+        with self._write_lock():
+            self._refresh()
+            codes = [self._source_ids[s] for s in set(sources) if s in self._source_ids]
+            if not codes:
+                return 0
+
+            keep = ~np.isin(self._source_codes, codes)
+            old_path = self.vectors_path
+            self.vectors_path = self._new_vectors_path(self.index_dir)
+            with open(self.vectors_path, 'wb') as f:
+                f.write(np.ascontiguousarray(self._vectors[keep]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            lexical = self._load_lexical().select(keep)
+            self._records = [record for record, kept in zip(self._records, keep) if kept]
+            old_lexical = self._write_lexical(lexical)
+            self._write_meta()
+            self._meta_mtime = None
+            self._refresh()
+            self._lexical = lexical
+
+            # readers that still map the old file keep a valid mapping until they refresh
+            os.remove(old_path)
+            if old_lexical is not None:
+                old_lexical.unlink(missing_ok=True)
+
+        return int((~keep).sum())
+
+    # ---------- SEARCH ----------
+    def source_mask(self, sources : Optional[Iterable[str]], snapshot : Optional[Snapshot] = None) -> Optional[np.ndarray]:
+        '''
+        Builds a boolean row mask selecting the chunks of the given sources.
+        :param sources: article urls to keep or None to keep all rows.
+        :param snapshot: rows the mask applies to, the current ones by default.
+        :return: boolean mask over rows or None when no filter applies.
+        '''
+        if sources is None:
+            return None
+        snapshot = snapshot or self._snapshot()
+        codes = [snapshot.source_ids[s] for s in set(sources) if s in snapshot.source_ids]
+        return np.isin(snapshot.source_codes, codes)
+
+    def _top_k(self, snapshot : Snapshot, scores : np.ndarray, k : int, mask : Optional[np.ndarray]) -> List[Tuple[Document, float]]:
+        '''
+        Selects the k best scoring rows, restricted to the mask if given.
+        :return: list of (document, score) sorted best first.
+        '''
+        n = len(scores) if mask is None else int(mask.sum())
+        if n == 0 or k <= 0:
+            return []
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, n)
+
+        # argpartition finds the top-k in O(n) & only those k get sorted
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(self._to_document(snapshot.records[i]), float(scores[i])) for i in top]
+
+    @staticmethod
+    def _min_max(scores : np.ndarray, mask : Optional[np.ndarray]) -> np.ndarray:
+        '''
+        Rescales scores to [0, 1] over the candidate rows so that cosine & BM25 scores can be summed.
+        '''
+        candidates = scores if mask is None else scores[mask]
+        if candidates.size == 0:
+            return scores
+        low, high = candidates.min(), candidates.max()
+        if high == low:
+            return np.zeros_like(scores)
+        return (scores - low) / (high - low)
+
+    def similarity_search_by_vector_with_score(self, embedding, k : int = 4, sources : Optional[Iterable[str]] = None) -> List[Tuple[Document, float]]:
+        '''
+        Returns top-k chunks by cosine similarity to the given embedding.
+        :param embedding: query embedding.
+        :param k: no of chunks to return.
+        :param sources: optional article urls to restrict the search to.
+        :return: list of (document, cosine similarity) sorted best first.
+        '''
+        snapshot = self._snapshot()
+        if not snapshot.records:
+            return []
+        return self._top_k(snapshot, snapshot.vectors @ self._normalize(embedding), k, self.source_mask(sources, snapshot))
+
+    def similarity_search_with_score(self, query : str, k : int = 4, sources : Optional[Iterable[str]] = None) -> List[Tuple[Document, float]]:
+        '''
+        Embeds the query & returns top-k chunks along with their cosine similarity.
+        :param query: user query.
+        :param k: no of chunks to return.
+        :param sources: optional article urls to restrict the search to.
+        :return: list of (document, cosine similarity) sorted best first.
+        '''
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, sources=sources)
+
+    def similarity_search(self, query : str, k : int = 4, sources : Optional[Iterable[str]] = None) -> List[Document]:
+        '''
+        Embeds the query & returns top-k chunks by cosine similarity.
+        :param query: user query.
+        :param k: no of chunks to return.
+        :param sources: optional article urls to restrict the search to.
+        :return: list of documents sorted best first.
+        '''
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, sources=sources)]
+
+    def search(self, query : str, k : int = 4, sources : Optional[Iterable[str]] = None, mode : str = 'vector', alpha : float = 0.5) -> List[Tuple[Document, float]]:
+        '''
+        Returns top-k chunks for a query using dense, lexical or hybrid scoring.
+            vector  -> cosine similarity of embeddings (one embedding call)
+            lexical -> BM25 over the inverted index, no embedding call at all
+            hybrid  -> alpha * cosine + (1 - alpha) * BM25, both min-max scaled over the candidate rows
+        :param query: user query.
+        :param k: no of chunks to return.
+        :param sources: optional article urls to restrict the search to.
+        :param mode: one of 'vector', 'hybrid' or 'lexical'.
+        :param alpha: weight of the dense score in hybrid mode.
+        :return: list of (document, score) sorted best first.
+        '''
+        if mode not in SEARCH_MODES:
+            raise ValueError(f'Unknown search mode {mode!r}, expected one of {SEARCH_MODES}.')
+        if mode == 'vector':
+            return self.similarity_search_with_score(query, k=k, sources=sources)
+
+        # the query is embedded before taking the snapshot, which waits for any write in progress
+        query_vector = self._normalize(self.embedding.embed_query(query)) if mode == 'hybrid' else None
+        snapshot = self._snapshot(lexical=True)
+        if not snapshot.records:
+            return []
+        mask = self.source_mask(sources, snapshot)
+        lexical_scores = snapshot.lexical.scores(query)
+        if mode == 'lexical':
+            # rows sharing no term with the query carry no signal
+            matched = lexical_scores > 0
+            return self._top_k(snapshot, lexical_scores, k, matched if mask is None else mask & matched)
+
+        dense_scores = snapshot.vectors @ query_vector
+        fused = alpha * self._min_max(dense_scores, mask) + (1 - alpha) * self._min_max(lexical_scores, mask)
+        return self._top_k(snapshot, fused, k, mask)
+
+    @staticmethod
+    def _to_document(record : dict) -> Document:
+        return Document(id=record['id'], page_content=record['text'], metadata=record['metadata'])
@@ -3,11 +3,36 @@ Script that creates an UI that answers questions basis news articles with the he
 '''
 
 import streamlit as st
-from NewsResearchTool.backend.tool_based_RAG import call_rag_agent, index_documents_to_vector_db
-from NewsResearchTool.backend.speech_to_text import transcribe_audio
-from NewsResearchTool.backend.text_to_speech import text_to_speech
+from NewsResearchTool.backend.tool_based_RAG import call_rag_agent, index_documents_to_vector_db, agent_registry, get_news_corpus
+from common.resources import get_chat_model, warm_up
+from common.serving import RemoteStream, ServiceBusy, ServiceError, post_json, service_url
+from common.streaming import render_stream
+from common.tracing import get_tracer, timing_table, trace
 import asyncio
 
+def index_articles(urls : list):
+    '''
+    Function that fetches & indexes the articles of the urls, in the agent service when AGENT_SERVICE_URL is set.
+    Streamlit re-runs the script on every interaction, hence the urls are only indexed when they differ from the ones
+    this session indexed last. A busy or failing service is reported on the page & retried on the next run.
+    :param urls: article urls.
+    '''
+    url_set = frozenset(urls)
+    if st.session_state.get('indexed_urls') == url_set:
+        return
+    try:
+        if service_url():
+            post_json('/news/index', {'urls': urls})
+        else:
+            index_documents_to_vector_db(tuple(urls))
+    except ServiceBusy as e:
+        st.warning(f'The service is busy, the articles will be indexed with the question. Retry in {e.retry_after}s.')
+        return
+    except ServiceError as e:
+        st.error(f'The articles could not be indexed: {e}')
+        return
+    st.session_state.indexed_urls = url_set
+
 st.markdown("""
 <style>
 /* Force audio input to match text_input height */
@@ -54,7 +79,7 @@ with st.sidebar:
 
         # fetch articles from urls and store them in vector database upon having pressed the submit button and presence of at least one url.
         if submitted and urls:
-            index_documents_to_vector_db(tuple(urls))
+            index_articles(urls)
 
 with st.container(border=True):
     col1, col2 = st.columns([5,2])
@@ -69,7 +94,12 @@ with st.container(border=True):
         # in case audio exists transcribe it to text and place it in question tab.
         if audio:
             with st.spinner('Processing Audio...'):
-                st.session_state.text_question = transcribe_audio(audio)
+                # speech modules (AssemblyAI, Whisper & torch) are only imported once audio is recorded
+                from NewsResearchTool.backend.speech_to_text import transcribe_audio
+                try:
+                    st.session_state.text_question = transcribe_audio(audio)
+                except asyncio.TimeoutError:
+                    st.warning('Transcription timed out. Please type the question or record it again.')
 
     # setup question input
     with col1:
@@ -79,25 +109,56 @@ with st.container(border=True):
 
     # check if both question and urls are present in which case fetch LLM response
     if st.session_state.text_question and urls and submitted:
-        # set empty container to write answer to.
-        placeholder = st.empty()
-        full_response = ""
-        for response in call_rag_agent(question,tuple(urls)):
-            placeholder.write(response)
-            full_response = response
-
-        # convert response to audio
-        asyncio.run(text_to_speech(full_response))
+        # one trace per question: loading, embedding, agent steps, tool calls & speech are timed as nested spans
+        with trace('news.question', urls=len(urls)) as request_span:
+            # set empty container to write answer to.
+            placeholder = st.empty()
+            # with AGENT_SERVICE_URL set the agent runs in the shared agent service, this script only renders its stream
+            deltas = RemoteStream('/news/answer', {'question': question, 'urls': urls}) if service_url() else call_rag_agent(question,tuple(urls))
+            try:
+                # deltas are coalesced into a few frames per second instead of re-rendering the answer on every token
+                full_response, stream_stats = render_stream(deltas, placeholder.write, fps=12)
+            except ServiceBusy as e:
+                st.warning(f'The service is busy, please try again in {e.retry_after}s.')
+                st.stop()
+
+            if service_url():
+                st.caption(stream_stats.caption())
+            else:
+                # show how much time goes into agent setup versus answering
+                stats = agent_registry.stats
+                st.caption(f"Agent setup: {stats.avg_build_seconds:.2f}s avg ({stats.builds} builds, {stats.hits} re-used) | Answer: {stats.avg_answer_seconds:.2f}s avg | {stream_stats.caption()}")
+
+            # convert response to audio
+            from NewsResearchTool.backend.text_to_speech import text_to_speech
+            asyncio.run(text_to_speech(full_response))
+
+        # where the time of this question went: the local spans (speech) followed by those of the service if the agent ran there
+        timings = timing_table(get_tracer().get_trace(request_span.trace_id))
+        if service_url():
+            timings += deltas.done.get('timings', [])
+        with st.expander(f"⏱️ Timings ({request_span.seconds:.2f}s)"):
+            st.dataframe(timings, hide_index=True)
 
     elif st.session_state.text_question and not urls:
         st.write('No valid url provided.Please provide url and try again')
     elif not st.session_state.text_question and urls:
-        index_documents_to_vector_db(tuple(urls))
-
-
-
-
-
-
-
-
+        index_articles(urls)
+
+@st.cache_resource
+def start_warm_up():
+    '''
+    Function that loads the heavy resources in the background ONCE per process after the first page rendered: chat model,
+    news corpus & the speech modules (importing speech_to_text preloads Whisper).
+    :return: warm-up thread.
+    '''
+    def load_speech_modules():
+        import NewsResearchTool.backend.speech_to_text
+        import NewsResearchTool.backend.text_to_speech
+
+    # a thin client only runs the speech modules locally, the service holds the model & corpus
+    if service_url():
+        return warm_up(load_speech_modules, name='news-warm-up')
+    return warm_up(get_chat_model, get_news_corpus, load_speech_modules, name='news-warm-up')
+
+start_warm_up()
@@ -0,0 +1,185 @@
+'''
+Script that caches final answers of the SQL agent so that repeated business questions are answered without any LLM round-trip.
+Questions are matched on normalized text and optionally on embedding similarity, entries expire after a TTL or get evicted
+in LRU order and the whole cache is invalidated as soon as the content of the database changes.
+'''
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+
+from common.streaming import chunk_text
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def normalize_question(question : str) -> str:
+    '''
+    Function that normalizes a question so that case, punctuation & spacing differences still hit the cache.
+    :param question: user question.
+    :return: normalized question e.g. 'What is the total revenue for Levi?' -> 'what is the total revenue for levi'
+    '''
+    return ' '.join(WORD_PATTERN.findall(question.lower()))
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    created_at: float
+    embedding: Optional[np.ndarray] = None
+
+
+class AnswerCache:
+    """
+    Thread-safe answer cache shared by every Streamlit session of the process.
+    """
+    def __init__(
+        self,
+        max_entries : int = 256,
+        ttl : float = 3600,
+        embedder = None,
+        similarity_threshold : float = 0.92,
+        key_terms : Iterable[str] = (),
+        version_probe : Optional[Callable[[], object]] = None,
+        probe_interval : float = 5.0,
+    ):
+        '''
+        :param max_entries: max no of answers kept; the least recently used one is evicted first.
+        :param ttl: seconds an answer stays valid.
+        :param embedder: optional langchain embedding model enabling paraphrase matches.
+        :param similarity_threshold: min cosine similarity of two questions for a paraphrase match.
+        :param key_terms: words that must match exactly for a paraphrase match e.g. brand names, so that
+                          'revenue for Levi' is never served for 'revenue for Nike'. Numbers always must match.
+        :param version_probe: callable returning a fingerprint of the database; a new value clears the cache.
+        :param probe_interval: min seconds between two database probes.
+        '''
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.key_terms = {normalize_question(term) for term in key_terms}
+        self.version_probe = version_probe
+        self.probe_interval = probe_interval
+
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._probed_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _signature(self, normalized : str) -> frozenset:
+        '''
+        Terms of a question that a paraphrase is not allowed to change.
+        '''
+        words = normalized.split()
+        terms = {word for word in words if any(ch.isdigit() for ch in word) or word in self.key_terms}
+        # multi-word key terms such as 'van huesen'
+        terms.update(term for term in self.key_terms if ' ' in term and term in normalized)
+        return frozenset(terms)
+
+    def _check_version(self):
+        '''
+        Clears the cache when the database changed since the last probe.
+        '''
+        if self.version_probe is None or time.monotonic() - self._probed_at < self.probe_interval:
+            return
+        version = self.version_probe()
+        self._probed_at = time.monotonic()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _embed(self, normalized : str) -> Optional[np.ndarray]:
+        if self.embedder is None:
+            return None
+        vector = np.asarray(self.embedder.embed_query(normalized), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, question : str) -> Optional[str]:
+        '''
+        Looks up a completed answer for the question.
+        :param question: user question.
+        :return: cached answer or None on a miss.
+        '''
+        normalized = normalize_question(question)
+        now = time.time()
+
+        with self._lock:
+            self._check_version()
+
+            # drop expired answers, oldest first
+            while self._entries and now - next(iter(self._entries.values())).created_at > self.ttl:
+                self._entries.popitem(last=False)
+
+            entry = self._entries.get(normalized)
+            if entry is not None and now - entry.created_at > self.ttl:
+                del self._entries[normalized]
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(normalized)
+            if entry is None and self.embedder is not None and self._entries:
+                entry = self._closest(normalized)
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.answer
+
+    def _closest(self, normalized : str) -> Optional[CachedAnswer]:
+        '''
+        Finds the most similar cached question whose key terms are identical to the given one.
+        '''
+        signature = self._signature(normalized)
+        now = time.time()
+        candidates = [
+            (key, entry) for key, entry in self._entries.items()
+            if entry.embedding is not None and now - entry.created_at <= self.ttl and self._signature(key) == signature
+        ]
+        if not candidates:
+            return None
+
+        query = self._embed(normalized)
+        similarities = np.stack([entry.embedding for _, entry in candidates]) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        key, entry = candidates[best]
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, question : str, answer : str):
+        '''
+        Stores the completed answer of a question.
+        :return:
+        '''
+        normalized = normalize_question(question)
+        embedding = self._embed(normalized)
+        with self._lock:
+            self._entries[normalized] = CachedAnswer(answer, time.time(), embedding)
+            self._entries.move_to_end(normalized)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def replay(answer : str, chunk_chars : int = 64) -> Iterator[str]:
+        '''
+        Replays a cached answer the way the agent streams it, i.e. as text deltas.
+        :param answer: cached answer.
+        :param chunk_chars: approx no of characters per delta. Deltas end on whitespace.
+        :return: generator of deltas.
+        '''
+        return chunk_text(answer, chunk_chars)
@@ -0,0 +1,176 @@
+'''
+Script that sets up the pooled database engine shared by every Streamlit session of the SQL agent.
+The pool is sized explicitly (size, overflow, pre-ping & recycle), each query gets a server/driver-level timeout and result
+sets are capped at a max no of rows by a LIMIT the database applies. Tool calls of concurrent user questions run in
+worker threads, each on its own pooled connection, so that they don't serialize on one connection.
+'''
+import os
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+
+
+def build_db_uri() -> str:
+    '''
+    Function that builds the database URI from the environment. DB_URI wins if set e.g. sqlite:///atliq_tshirts.db for
+    a local stand-in, otherwise the MySQL URI is assembled from DB_USER, DB_PASSWORD, DB_HOST, DB_PORT & DB_NAME.
+    :return: SQLAlchemy database URI.
+    '''
+    if os.getenv('DB_URI'):
+        return os.getenv('DB_URI')
+    user = os.getenv('DB_USER')
+    password = os.getenv('DB_PASSWORD')
+    host = os.getenv('DB_HOST')
+    port = os.getenv('DB_PORT')
+    db_name = os.getenv('DB_NAME', 'atliq_tshirts')
+    return f'mysql+mysqlconnector://{user}:{password}@{host}:{port}/{db_name}'
+
+
+def _setting(value, env_name : str, default):
+    '''
+    Resolves a pool setting: explicit value first, then the environment variable, then the default.
+    '''
+    if value is not None:
+        return value
+    return type(default)(os.getenv(env_name, default))
+
+
+def create_db_engine(
+    uri : str,
+    pool_size : Optional[int] = None,
+    max_overflow : Optional[int] = None,
+    pool_timeout : Optional[float] = None,
+    pool_recycle : Optional[int] = None,
+    connect_timeout : Optional[int] = None,
+    query_timeout : Optional[float] = None,
+):
+    '''
+    Function that creates a pooled SQLAlchemy engine with a per-query timeout. Settings not given are read from
+    DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (10), DB_POOL_RECYCLE (1800), DB_CONNECT_TIMEOUT (10) &
+    DB_QUERY_TIMEOUT (15).
+    :param uri: database URI.
+    :param pool_size: no of connections kept open in the pool.
+    :param max_overflow: extra connections opened under load on top of pool_size.
+    :param pool_timeout: seconds to wait for a free connection before giving up.
+    :param pool_recycle: seconds after which a connection is re-opened, staying below MySQL's wait_timeout.
+    :param connect_timeout: seconds to wait while connecting to the server.
+    :param query_timeout: seconds a single query may run. 0 disables it.
+    :return: SQLAlchemy engine.
+    '''
+    pool_size = _setting(pool_size, 'DB_POOL_SIZE', 5)
+    max_overflow = _setting(max_overflow, 'DB_MAX_OVERFLOW', 10)
+    pool_timeout = _setting(pool_timeout, 'DB_POOL_TIMEOUT', 10.0)
+    pool_recycle = _setting(pool_recycle, 'DB_POOL_RECYCLE', 1800)
+    connect_timeout = _setting(connect_timeout, 'DB_CONNECT_TIMEOUT', 10)
+    query_timeout = _setting(query_timeout, 'DB_QUERY_TIMEOUT', 15.0)
+    url = make_url(uri)
+
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # an in-memory database only exists within one connection hence it is shared by every thread
+            engine = create_engine(url, poolclass=StaticPool, connect_args={'check_same_thread': False})
+        else:
+            engine = create_engine(
+                url, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout, pool_pre_ping=True,
+                connect_args={'timeout': connect_timeout, 'check_same_thread': False},
+            )
+        if query_timeout:
+            _install_sqlite_query_timeout(engine, query_timeout)
+        return engine
+
+    connect_args = {'connection_timeout': connect_timeout} if url.get_driver_name() == 'mysqlconnector' else {}
+    engine = create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=True, # transparently replaces connections dropped by the server
+        connect_args=connect_args,
+    )
+    if query_timeout and url.get_backend_name() == 'mysql':
+        @event.listens_for(engine, 'connect')
+        def set_max_execution_time(dbapi_connection, connection_record):
+            # MySQL aborts SELECT statements running longer than this on the server side
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(query_timeout * 1000)}")
+            cursor.close()
+    return engine
+
+
+def _install_sqlite_query_timeout(engine, query_timeout : float):
+    '''
+    SQLite has no statement timeout, hence a progress handler interrupts statements running past their deadline.
+    '''
+    @event.listens_for(engine, 'connect')
+    def install_progress_handler(dbapi_connection, connection_record):
+        info = connection_record.info
+        info['deadline'] = None
+        dbapi_connection.set_progress_handler(
+            lambda: int(info['deadline'] is not None and time.monotonic() > info['deadline']), 10000
+        )
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_deadline(conn, cursor, statement, parameters, context, executemany):
+        conn.info['deadline'] = time.monotonic() + query_timeout
+
+
+def cap_rows(sql : str, max_rows : int, dialect : str) -> str:
+    '''
+    Function that makes the database itself stop at max_rows rows: a LIMIT is added to a query without one & a larger
+    LIMIT is lowered. Drivers buffer the whole result set by default (mysqlconnector has no server-side cursor under
+    SQLAlchemy), hence fetching fewer rows alone doesn't keep the rest out of memory.
+    :param sql: SQL statement.
+    :param max_rows: max no of rows.
+    :param dialect: SQL dialect e.g. 'mysql'.
+    :return: statement with the row cap, unchanged if it isn't a single query or can't be parsed.
+    '''
+    import sqlglot
+    from sqlglot import exp
+
+    try:
+        statements = sqlglot.parse(sql, read=dialect)
+    except Exception:
+        return sql
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+        return sql
+
+    statement = statements[0]
+    limit = statement.args.get('limit')
+    if limit is not None and limit.expression.is_int and int(limit.expression.name) <= max_rows:
+        return sql
+    return statement.limit(max_rows).sql(dialect=dialect)
+
+
+class PooledSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase over a pooled engine that caps the no of rows fetched per query.
+    """
+    def __init__(self, engine, max_rows : Optional[int] = None, **kwargs):
+        '''
+        :param engine: pooled SQLAlchemy engine.
+        :param max_rows: max no of rows returned per query (DB_MAX_ROWS, 1000 by default). SQL queries get a LIMIT of at
+                         most max_rows (see cap_rows) hence the database never sends the remaining rows.
+        '''
+        super().__init__(engine, **kwargs)
+        self.max_rows = _setting(max_rows, 'DB_MAX_ROWS', 1000)
+
+    def _execute(self, command, fetch = "all", *, parameters : Optional[Dict[str, Any]] = None, execution_options : Optional[Dict[str, Any]] = None) -> Sequence[Dict[str, Any]]:
+        '''
+        Executes SQL command on a pooled connection, fetching at most max_rows rows.
+        '''
+        if fetch not in ('all', 'one'):
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+
+        if isinstance(command, str):
+            command = text(cap_rows(command, self.max_rows, self.dialect))
+        with self._engine.begin() as connection:
+            cursor = connection.execute(command, parameters or {}, execution_options=execution_options or {})
+            if not cursor.returns_rows:
+                return []
+            rows = cursor.fetchmany(1 if fetch == 'one' else self.max_rows)
+            return [row._asdict() for row in rows]
@@ -0,0 +1,31 @@
+'''
+Script that probes the state of the AtliQ database so that caches built on top of it know when they went stale.
+'''
+import hashlib
+from typing import Dict, Iterable
+
+from sqlalchemy import text
+
+
+def table_checksums(engine, tables : Iterable[str]) -> Dict[str, str]:
+    '''
+    Function that fingerprints the content of the given tables. MySQL computes it server-side with CHECKSUM TABLE,
+    other dialects (e.g. the SQLite stand-in) hash the rows, which is fine for small databases.
+    :param engine: SQLAlchemy engine of the database.
+    :param tables: names of the tables to fingerprint.
+    :return: mapping of table name to checksum.
+    '''
+    tables = list(tables)
+    with engine.connect() as conn:
+        if engine.dialect.name == 'mysql':
+            rows = conn.execute(text(f"CHECKSUM TABLE {', '.join(tables)}")).fetchall()
+            # CHECKSUM TABLE reports tables as <database>.<table>
+            return {name.split('.')[-1]: str(checksum) for name, checksum in rows}
+
+        checksums = {}
+        for table in tables:
+            digest = hashlib.sha256()
+            for row in conn.execute(text(f"SELECT * FROM {table}")):
+                digest.update(repr(tuple(row)).encode('utf-8'))
+            checksums[table] = digest.hexdigest()
+        return checksums
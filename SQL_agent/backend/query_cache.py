@@ -0,0 +1,241 @@
+'''
+Script that wraps the sql_db_query tool of the SQL agent with a result-set cache.
+Every generated statement is normalized & fingerprinted (literals replaced by '?'), identical statements are answered from a
+size-bounded LRU cache that is invalidated per table, and hit/miss & execution-time stats are kept per fingerprint so that
+it shows which queries deserve an index or a materialized summary.
+'''
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from langchain_core.tools import tool
+
+from common.tracing import span
+
+# string literals, quoted identifiers, numbers, words and single symbols in that order of precedence
+TOKEN_PATTERN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\d+(?:\.\d+)?|\w+|\S""")
+COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", flags=re.S)
+TABLE_PATTERN = re.compile(r"\b(?:from|join)\s+([`\"]?[\w.]+[`\"]?)", flags=re.I)
+
+
+def tokenize_sql(sql : str) -> List[str]:
+    '''
+    :param sql: SQL statement.
+    :return: tokens of the statement without comments.
+    '''
+    return TOKEN_PATTERN.findall(COMMENT_PATTERN.sub(' ', sql))
+
+
+def normalize_sql(sql : str) -> str:
+    '''
+    Function that normalizes a statement so that whitespace, keyword case & a trailing ';' don't matter.
+    Literals keep their case since they are compared against the data.
+    :param sql: SQL statement.
+    :return: normalized statement used as the cache key.
+    '''
+    tokens = [token if token[0] in "'\"`" else token.lower() for token in tokenize_sql(sql)]
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return ' '.join(tokens)
+
+
+def fingerprint_sql(sql : str) -> str:
+    '''
+    Function that fingerprints a statement: literals become '?' & IN lists collapse to '(?)' so that the same query
+    shape asked for different brands, colors or limits shares one fingerprint.
+    :param sql: SQL statement.
+    :return: fingerprint.
+    '''
+    tokens = [('?' if token[0] == "'" or token[0].isdigit() else token) for token in normalize_sql(sql).split(' ')]
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", ' '.join(tokens))
+
+
+def referenced_tables(sql : str) -> Set[str]:
+    '''
+    :param sql: SQL statement.
+    :return: names of the tables a statement reads from (FROM & JOIN clauses).
+    '''
+    return {match.strip('`"').split('.')[-1].lower() for match in TABLE_PATTERN.findall(COMMENT_PATTERN.sub(' ', sql))}
+
+
+@dataclass
+class FingerprintStats:
+    fingerprint: str
+    example: str
+    hits: int = 0
+    misses: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def avg_seconds(self) -> float:
+        return self.total_seconds / self.misses if self.misses else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'fingerprint': self.fingerprint, 'example': self.example, 'hits': self.hits, 'misses': self.misses,
+            'avg_seconds': round(self.avg_seconds, 4), 'max_seconds': round(self.max_seconds, 4),
+            'total_seconds': round(self.total_seconds, 4),
+        }
+
+
+class QueryResultCache:
+    """
+    LRU cache of query results bounded by entry count & total result size, invalidated per table.
+    """
+    def __init__(
+        self,
+        execute : Callable[[str], str],
+        max_entries : int = 512,
+        max_bytes : int = 16 * 1024 * 1024,
+        ttl : Optional[float] = None,
+        table_probe : Optional[Callable[[], Dict[str, str]]] = None,
+        probe_interval : float = 5.0,
+    ):
+        '''
+        :param execute: callable running a statement & returning its result as text e.g. SQLDatabase.run_no_throw.
+        :param max_entries: max no of cached result sets.
+        :param max_bytes: max total size of the cached result sets.
+        :param ttl: optional seconds a result stays valid.
+        :param table_probe: callable returning a checksum per table. Entries reading a table whose checksum changed are dropped.
+        :param probe_interval: min seconds between two table probes.
+        '''
+        self.execute = execute
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.table_probe = table_probe
+        self.probe_interval = probe_interval
+
+        self.stats: Dict[str, FingerprintStats] = {}
+        self._entries = OrderedDict() # normalized sql -> (result, tables, created_at)
+        self._by_table: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._checksums = None
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------- INVALIDATION ----------
+    def _drop(self, key : str):
+        result, tables, _ = self._entries.pop(key)
+        self._bytes -= len(result)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+    def invalidate_tables(self, tables : Iterable[str]):
+        '''
+        Drops every cached result that reads from any of the given tables.
+        :param tables: table names.
+        :return:
+        '''
+        with self._lock:
+            for table in tables:
+                for key in list(self._by_table.pop(table.lower(), ())):
+                    if key in self._entries:
+                        self._drop(key)
+
+    def _check_tables(self):
+        if self.table_probe is None or time.monotonic() - self._probed_at < self.probe_interval:
+            return
+        self._probed_at = time.monotonic()
+        checksums = self.table_probe()
+        if self._checksums is not None:
+            changed = [table for table, checksum in checksums.items() if self._checksums.get(table) != checksum]
+            if changed:
+                self.invalidate_tables(changed)
+        self._checksums = checksums
+
+    # ---------- LOOKUP ----------
+    def run(self, sql : str) -> str:
+        '''
+        Function that answers a statement from the cache or executes it & caches the result. Errors are never cached.
+        :param sql: SQL statement generated by the agent.
+        :return: result as text.
+        '''
+        with span('sql.query', sql=sql) as query_span:
+            result = self._run(sql, query_span)
+            query_span.set(result_chars=len(result) if isinstance(result, str) else None)
+        return result
+
+    def _run(self, sql : str, query_span) -> str:
+        self._check_tables()
+        key = normalize_sql(sql)
+        fingerprint = fingerprint_sql(sql)
+        query_span.set(fingerprint=fingerprint)
+
+        with self._lock:
+            stats = self.stats.setdefault(fingerprint, FingerprintStats(fingerprint, key))
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                stats.hits += 1
+                query_span.set(cache='hit')
+                return entry[0]
+
+        start = time.perf_counter()
+        result = self.execute(sql)
+        elapsed = time.perf_counter() - start
+        query_span.set(cache='miss', error=isinstance(result, str) and result.startswith('Error'))
+
+        with self._lock:
+            stats.misses += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+
+            if isinstance(result, str) and not result.startswith('Error') and len(result) <= self.max_bytes:
+                if key in self._entries:
+                    self._drop(key)
+                tables = referenced_tables(sql)
+                self._entries[key] = (result, tables, time.time())
+                self._bytes += len(result)
+                for table in tables:
+                    self._by_table.setdefault(table, set()).add(key)
+                while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                    self._drop(next(iter(self._entries)))
+        return result
+
+    def report(self, top : int = 20) -> List[dict]:
+        '''
+        :param top: no of fingerprints returned.
+        :return: stats of the fingerprints that cost the most database time, most expensive first.
+        '''
+        with self._lock:
+            ranked = sorted(self.stats.values(), key=lambda s: s.total_seconds, reverse=True)
+            return [s.as_dict() for s in ranked[:top]]
+
+
+def create_cached_query_tool(query_cache : QueryResultCache, validate : Optional[Callable] = None):
+    '''
+    Function that creates a drop-in replacement of the toolkit's sql_db_query tool answering through the result cache.
+    :param query_cache: query result cache.
+    :param validate: optional callable returning a ValidationResult (see sql_validator). Statements not proven read-only
+                     or rejected by it never reach the database and the statement it returns (e.g. with LIMIT) is run.
+    :return: langchain tool.
+    '''
+
+    @tool("sql_db_query")
+    def query_database(query : str) -> str:
+        '''Execute a SQL query against the database and get back the result..
+        If the query is not correct, an error message will be returned.
+        If an error is returned, rewrite the query, check the query, and try again.'''
+        if validate is not None:
+            result = validate(query)
+            if not result.read_only:
+                return f"Error: {result.reason or 'only read-only SELECT queries are allowed.'}"
+            if result.status == 'rejected':
+                return result.as_message()
+            query = result.sql
+        return query_cache.run(query)
+
+    return query_database
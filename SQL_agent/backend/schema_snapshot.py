@@ -0,0 +1,206 @@
+'''
+Script that builds an in-memory snapshot of the AtliQ database schema: tables, columns, enum values (brand/color/size),
+keys and a few sample rows. The snapshot is built once at startup, refreshed only when the DDL changes and is rendered
+into the agent's system prompt so that the agent never has to list tables or reflect the schema before answering.
+'''
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.tools import tool
+from sqlalchemy import inspect, text
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    type: str
+    nullable: bool
+    enum_values: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: List[ColumnInfo]
+    primary_key: List[str]
+    foreign_keys: List[str] # rendered as 'column -> table(column)'
+    sample_columns: List[str]
+    sample_rows: List[tuple]
+
+
+@dataclass
+class SchemaSnapshot:
+    tables: Dict[str, TableInfo]
+    fingerprint: str
+    built_at: float
+
+    def enum_values(self) -> List[str]:
+        '''
+        :return: every enum value of every column e.g. brand names, colors & sizes.
+        '''
+        return [value for table in self.tables.values() for column in table.columns for value in column.enum_values]
+
+    def columns(self) -> Dict[str, List[str]]:
+        '''
+        :return: mapping of table name to its column names.
+        '''
+        return {name: [column.name for column in table.columns] for name, table in self.tables.items()}
+
+    def render_table(self, name : str) -> str:
+        '''
+        Renders one table as a CREATE TABLE like definition followed by its sample rows.
+        :param name: table name.
+        :return: text description of the table.
+        '''
+        table = self.tables[name]
+        lines = [f"CREATE TABLE {name} ("]
+        definitions = []
+        for column in table.columns:
+            column_type = f"ENUM({', '.join(repr(v) for v in column.enum_values)})" if column.enum_values else column.type
+            definitions.append(f"\t{column.name} {column_type}{'' if column.nullable else ' NOT NULL'}")
+        if table.primary_key:
+            definitions.append(f"\tPRIMARY KEY ({', '.join(table.primary_key)})")
+        definitions.extend(f"\tFOREIGN KEY {fk}" for fk in table.foreign_keys)
+        lines.append(',\n'.join(definitions))
+        lines.append(')')
+
+        if table.sample_rows:
+            lines.append(f"/*\n{len(table.sample_rows)} rows from {name} table:")
+            lines.append('\t'.join(table.sample_columns))
+            lines.extend('\t'.join(str(value) for value in row) for row in table.sample_rows)
+            lines.append('*/')
+        return '\n'.join(lines)
+
+    def render(self) -> str:
+        '''
+        :return: text description of every table, ready to be injected into a prompt.
+        '''
+        return '\n\n'.join(self.render_table(name) for name in self.tables)
+
+
+def ddl_fingerprint(engine) -> str:
+    '''
+    Function that fingerprints the DDL of the database with a single cheap catalog query.
+    :param engine: SQLAlchemy engine of the database.
+    :return: hex digest that changes whenever a table or column is created, altered or dropped.
+    '''
+    with engine.connect() as conn:
+        if engine.dialect.name == 'mysql':
+            rows = conn.execute(text(
+                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION"
+            )).fetchall()
+        elif engine.dialect.name == 'sqlite':
+            rows = conn.execute(text("SELECT type, name, sql FROM sqlite_master ORDER BY name")).fetchall()
+        else:
+            rows = sorted((table, tuple(str(c['type']) for c in inspect(conn).get_columns(table))) for table in inspect(conn).get_table_names())
+    return hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+
+
+def build_schema_snapshot(engine, sample_rows : int = 3, include_tables : Optional[List[str]] = None) -> SchemaSnapshot:
+    '''
+    Function that reflects the database once & captures everything the agent needs to write queries.
+    :param engine: SQLAlchemy engine of the database.
+    :param sample_rows: no of sample rows captured per table.
+    :param include_tables: optional subset of tables to capture.
+    :return: schema snapshot.
+    '''
+    fingerprint = ddl_fingerprint(engine)
+    inspector = inspect(engine)
+    tables = {}
+
+    with engine.connect() as conn:
+        for name in inspector.get_table_names():
+            if include_tables is not None and name not in include_tables:
+                continue
+
+            columns = [
+                ColumnInfo(
+                    name=column['name'],
+                    type=str(column['type']),
+                    nullable=column.get('nullable', True),
+                    enum_values=list(getattr(column['type'], 'enums', None) or []),
+                )
+                for column in inspector.get_columns(name)
+            ]
+            foreign_keys = [
+                f"({', '.join(fk['constrained_columns'])}) REFERENCES {fk['referred_table']}({', '.join(fk['referred_columns'])})"
+                for fk in inspector.get_foreign_keys(name)
+            ]
+
+            rows = []
+            if sample_rows:
+                result = conn.execute(text(f"SELECT * FROM {name} LIMIT {int(sample_rows)}"))
+                rows = [tuple(row) for row in result]
+
+            tables[name] = TableInfo(
+                name=name,
+                columns=columns,
+                primary_key=inspector.get_pk_constraint(name).get('constrained_columns') or [],
+                foreign_keys=foreign_keys,
+                sample_columns=[column.name for column in columns],
+                sample_rows=rows,
+            )
+
+    return SchemaSnapshot(tables=tables, fingerprint=fingerprint, built_at=time.time())
+
+
+class SchemaCache:
+    """
+    Holds the current schema snapshot and rebuilds it only when the DDL fingerprint changes.
+    """
+    def __init__(self, engine, refresh_interval : float = 60, sample_rows : int = 3, include_tables : Optional[List[str]] = None):
+        '''
+        :param engine: SQLAlchemy engine of the database.
+        :param refresh_interval: min seconds between two DDL fingerprint checks.
+        :param sample_rows: no of sample rows captured per table.
+        :param include_tables: optional subset of tables to capture.
+        '''
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.sample_rows = sample_rows
+        self.include_tables = include_tables
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._snapshot = build_schema_snapshot(engine, sample_rows, include_tables)
+
+    def get(self) -> SchemaSnapshot:
+        '''
+        :return: current snapshot, rebuilt first if the DDL changed since it was taken.
+        '''
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.refresh_interval:
+                self._checked_at = time.monotonic()
+                if ddl_fingerprint(self.engine) != self._snapshot.fingerprint:
+                    self._snapshot = build_schema_snapshot(self.engine, self.sample_rows, self.include_tables)
+            return self._snapshot
+
+
+def create_schema_tools(schema_cache : SchemaCache) -> list:
+    '''
+    Function that creates in-memory replacements of the toolkit's sql_db_list_tables & sql_db_schema tools. They keep
+    the same names so the agent can still call them, but they answer from the snapshot instead of reflecting MySQL.
+    :param schema_cache: schema cache to answer from.
+    :return: list of langchain tools.
+    '''
+
+    @tool("sql_db_list_tables")
+    def list_tables(tool_input : str = "") -> str:
+        '''Input is an empty string, output is a comma-separated list of tables in the database.'''
+        return ', '.join(schema_cache.get().tables)
+
+    @tool("sql_db_schema")
+    def table_schema(table_names : str) -> str:
+        '''Input to this tool is a comma-separated list of tables, output is the schema and sample rows for those tables.
+        Example Input: table1, table2, table3'''
+        snapshot = schema_cache.get()
+        names = [name.strip() for name in table_names.split(',') if name.strip()]
+        unknown = [name for name in names if name not in snapshot.tables]
+        if unknown:
+            return f"Error: table_names {set(unknown)} not found in database"
+        return '\n\n'.join(snapshot.render_table(name) for name in names)
+
+    return [list_tables, table_schema]
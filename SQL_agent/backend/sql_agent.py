@@ -1,58 +1,122 @@
 '''
 Script that creates a retail SQL agent to form a Q&A tool where questions relate to information stored in a retail database related to t-shirts.
 The SQL agent created connects to the requisite database and pulls data from the necessary columns using necessary SQL queries.
+Nothing is connected or built at import: the engine, summary tables, toolkit, caches & agent are created on first use (or
+by warm_up_sql_agent in the background) hence the frontend renders before the database is reached.
 '''
 # import necessary libraries/frameworks/modules
-from langchain_community.utilities import SQLDatabase
-from langchain.agents import create_agent
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain.agents.structured_output import ProviderStrategy
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from pathlib import Path
-from functools import lru_cache
+from common.resources import get_chat_model, get_embeddings, resource, warm_up
+from common.streaming import iter_text_deltas, aiter_text_deltas
+from common.tracing import SpanCallbackHandler, span
+import asyncio
+import threading
 
 #.env path
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# fetch API key
-openai_api_key = os.getenv("OPENAI_API_KEY")
+@resource
+def get_engine():
+    '''
+    Function that sets up pooled connections to MYSQL database Atliq_tshirt using the DB credentials (DB_USER, DB_PASSWORD,
+    DB_HOST, DB_PORT) of database atliq_tshirts or DB_URI if set. Pool size, timeouts & row cap are configurable via
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_QUERY_TIMEOUT & DB_MAX_ROWS.
+    :return: pooled engine.
+    '''
+    from SQL_agent.backend.db_engine import build_db_uri, create_db_engine
 
-# fetch necessary DB credentials
-user = os.getenv('DB_USER')
-password = os.getenv('DB_PASSWORD')
-localhost = os.getenv('DB_HOST')
-port = os.getenv('DB_PORT')
+    return create_db_engine(build_db_uri())
 
-# choose database
-db_name = 'atliq_tshirts'
+@resource
+def get_summary_tables():
+    '''
+    Function that sets up the pre-aggregated summaries of t_shirts & discounts per brand, color & size and starts their
+    background refresh. SQL_SUMMARY_TABLES=0 turns them off.
+    :return: summary tables.
+    '''
+    from SQL_agent.backend.summary_tables import SummaryTables
 
-# create DB URI with above credentials
-db_uri = f'mysql+mysqlconnector://{user}:{password}@{localhost}:{port}/{db_name}'
+    summary_tables = SummaryTables(get_engine(), probe_interval=30)
+    if os.getenv('SQL_SUMMARY_TABLES', '1') == '1' and summary_tables.setup():
+        summary_tables.start()
+    return summary_tables
 
-# setup connection to MYSQL database Atliq_tshirt using above URI
-db = SQLDatabase.from_uri(db_uri)
+@resource
+def get_db():
+    '''
+    :return: langchain SQL database over the pooled engine.
+    '''
+    from SQL_agent.backend.db_engine import PooledSQLDatabase
 
-# setup OPENAI model
-model = ChatOpenAI(
-    model='gpt-5.2',
-    api_key=openai_api_key,
-    temperature=0.3, # higher number indicates more randomness in the model's output
-    max_tokens=500, #defines the no of words in the model's response
-    timeout=30 # max time in sec to wait for model's response
-)
+    # summary tables are created before the database is reflected so that the agent sees them
+    get_summary_tables()
+    return PooledSQLDatabase(get_engine())
 
-# setup toolkit for db interaction
-mysql_toolkit = SQLDatabaseToolkit(db=db,llm=model)
+@resource
+def get_schema_cache():
+    '''
+    :return: snapshot of tables, columns, enums, keys & sample rows taken ONCE and re-taken only when the DDL changes.
+    '''
+    from SQL_agent.backend.schema_snapshot import SchemaCache
+
+    get_summary_tables()
+    return SchemaCache(get_engine(), refresh_interval=60, sample_rows=3)
+
+def table_versions():
+    '''
+    :return: checksums of the tables, which change whenever their content does.
+    '''
+    from SQL_agent.backend.db_state import table_checksums
 
-# Get the different tools for the model to interact and fetch results from the database such as sql_db_query, sql_db_query_checker, sql_db_list_tables & sql_db_schema.
-tools = mysql_toolkit.get_tools()
+    return table_checksums(get_engine(), get_db().get_usable_table_names())
+
+@resource
+def get_query_cache():
+    '''
+    Function that creates the cache of query results keyed on the normalized SQL & invalidated per table when its checksum
+    changes. It also keeps hit/miss & execution-time stats per query fingerprint (see query_cache.report()).
+    :return: query result cache.
+    '''
+    from SQL_agent.backend.query_cache import QueryResultCache
+
+    return QueryResultCache(
+        get_db().run_no_throw,
+        max_entries=512,
+        max_bytes=16 * 1024 * 1024,
+        table_probe=table_versions,
+    )
+
+def validate_query(sql):
+    '''
+    Function that validates a generated query locally against the cached schema: DML/DDL is rejected, table & column
+    names are checked and LIMIT top_k is added when missing.
+    :param sql: SQL statement generated by the agent.
+    :return: validation result.
+    '''
+    from SQL_agent.backend.sql_validator import validate_sql
+
+    return validate_sql(sql, get_schema_cache().get().columns(), dialect=get_db().dialect, top_k=5)
+
+@resource
+def get_tools():
+    '''
+    Function that gets the different tools for the model to interact and fetch results from the database.
+    sql_db_query validates every statement locally & answers through the query result cache while sql_db_list_tables &
+    sql_db_schema are served from the in-memory schema snapshot instead of reflecting MySQL on every call. The toolkit's
+    sql_db_query_checker isn't offered: every query is validated before it runs, hence checking it costs a round-trip.
+    :return: list of tools.
+    '''
+    from SQL_agent.backend.query_cache import create_cached_query_tool
+    from SQL_agent.backend.schema_snapshot import create_schema_tools
+
+    return [create_cached_query_tool(get_query_cache(), validate=validate_query)] + create_schema_tools(get_schema_cache())
 
 # setup a detailed system prompt to customise agent behaviour.
-system_prompt = """
+system_prompt_template = """
 You are an agent designed to interact with a SQL database.
 Given an input question, create a syntactically correct {dialect} query to run,
 then look at the results of the query and return the answer. Unless the user
@@ -63,14 +127,16 @@ You can order the results by a relevant column to return the most interesting
 examples in the database. Never query for all the columns from a specific table,
 only ask for the relevant columns given the question.
 
-You MUST double check your query before executing it. If you get an error while
-executing a query, rewrite the query and try again.
+Every query is validated before it is executed, hence there is no need to double
+check it yourself. If you get an error while executing a query, rewrite the query
+and try again.
 
 DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the
-database.
+database. They are rejected.
 
-To start you should ALWAYS look at the tables in the database to see what you
-can query. DO NOT skip this step.
+The complete schema of the database along with sample rows is given at the end.
+It is always up to date, so DO NOT list the tables or query the schema before
+answering. Write the query straight away.
 
 NEVER expose internal identifiers such as IDs, primary keys, or surrogate keys. ALWAYS return human-readable attributes instead.
 
@@ -78,8 +144,6 @@ NEVER show texts wrapped with ** around. ALWAYS display clean texts in response.
 
 NOTE that the price column in t_shirts table has the unit of Rs.
 
-Then you should query the schema of the most relevant tables.
-
 Few-Shot Examples:
 
 User: What is the total revenue for Levi brand? 
@@ -101,35 +165,133 @@ FROM t_shirts ts
 JOIN discounts d ON d.t_shirt_id = ts.t_shirt_id
 ORDER BY d.pct_discount ASC
 LIMIT 1;
-""".format(
-    dialect=db.dialect,
-    top_k=5,
-)
+
+Database schema:
+
+{schema}
+
+{summaries}
+"""
+
+def build_system_prompt(snapshot):
+    '''
+    Function that renders the system prompt with the schema snapshot injected.
+    :param snapshot: schema snapshot of the database.
+    :return: system prompt.
+    '''
+    return system_prompt_template.format(
+        dialect=get_db().dialect,
+        top_k=5,
+        schema=snapshot.render(),
+        summaries=get_summary_tables().describe(),
+    )
 
 # setup & run the agent with structured output
 class Output(BaseModel):
     answer : str = Field(description='Final answer to user query')
 
-# setup agent
-sql_agent = create_agent(
-    model=model,
-    tools=tools,
-    system_prompt=system_prompt
-)
-@lru_cache
+# agent, built on first use & re-built when the schema changes
+sql_agent = None
+sql_agent_fingerprint = None
+system_prompt = None
+sql_agent_lock = threading.Lock()
+
+def get_sql_agent():
+    '''
+    Function that returns the SQL agent, creating it on first use and re-creating it with a fresh schema prompt if the DDL
+    changed since it was built.
+    :return: SQL agent.
+    '''
+    global sql_agent, sql_agent_fingerprint, system_prompt
+    snapshot = get_schema_cache().get()
+    with sql_agent_lock:
+        if sql_agent is None or snapshot.fingerprint != sql_agent_fingerprint:
+            from langchain.agents import create_agent
+
+            system_prompt = build_system_prompt(snapshot)
+            sql_agent = create_agent(model=get_chat_model(), tools=get_tools(), system_prompt=system_prompt)
+            sql_agent_fingerprint = snapshot.fingerprint
+        return sql_agent
+
+@resource
+def get_answer_cache():
+    '''
+    Function that creates the cache of completed answers. It is cleared whenever the content of the tables changes &
+    paraphrase matching through embeddings is enabled with SQL_ANSWER_CACHE_SEMANTIC=1.
+    :return: answer cache.
+    '''
+    from SQL_agent.backend.answer_cache import AnswerCache
+
+    return AnswerCache(
+        max_entries=256,
+        ttl=float(os.getenv('SQL_ANSWER_CACHE_TTL', '3600')),
+        embedder=get_embeddings() if os.getenv('SQL_ANSWER_CACHE_SEMANTIC') == '1' else None,
+        similarity_threshold=0.92,
+        # a paraphrase must name the same brand, color & size (enum values of the schema) to be served the same answer
+        key_terms=get_schema_cache().get().enum_values(),
+        version_probe=table_versions,
+    )
+
+def warm_up_sql_agent():
+    '''
+    Function that connects to the database & builds the agent in a background thread, e.g. once the page rendered.
+    :return: warm-up thread.
+    '''
+    return warm_up(get_sql_agent, get_answer_cache, name='sql-agent-warm-up')
+
 def fetch_response(query : str):
     '''
-    Function that runs the SQL agent given a user query and returns the answer.
-    :return:
+    Function that runs the SQL agent given a user query and streams the answer as text deltas (render them with
+    common.streaming.StreamRenderer). Answers to questions asked before are replayed from the answer cache without
+    running the agent. The run is traced as a 'sql.fetch_response' span with the agent's node steps, model & tool calls
+    and SQL executions nested under it.
+    :return: generator of text deltas.
     '''
-    result = ""
-    for token,metadata in sql_agent.stream({"messages":[{"role":"user","content":query}]},stream_mode="messages"):
-        node = metadata['langgraph_node']
-        content = token.content_blocks
+    with span('sql.fetch_response', question_chars=len(query)) as request_span:
+        # summaries are refreshed in the background, this only restarts a lost refresher thread
+        get_summary_tables().start()
+        cached = get_answer_cache().get(query)
+        request_span.set(answer_cache='hit' if cached is not None else 'miss')
+        if cached is not None:
+            yield from get_answer_cache().replay(cached)
+            return
+
+        parts = []
+        config = {'callbacks': [SpanCallbackHandler(request_span)]}
+        for delta in iter_text_deltas(get_sql_agent().stream({"messages":[{"role":"user","content":query}]},stream_mode="messages",config=config)):
+            parts.append(delta)
+            yield delta
+
+        # only completed answers get cached, an interrupted stream never reaches this point
+        if parts:
+            get_answer_cache().put(query, ''.join(parts))
+
+async def afetch_response(query : str):
+    '''
+    Async version of fetch_response. Tool calls run in worker threads on their own pooled connections, hence concurrent
+    user questions served from one event loop don't serialize on a single connection. The blocking steps around the run
+    (database probes of the caches, semantic lookup, building the agent) run in worker threads as well, so that a slow
+    database never stalls the other streams of the event loop.
+    :return: async generator of text deltas.
+    '''
+    with span('sql.fetch_response', question_chars=len(query)) as request_span:
+        await asyncio.to_thread(lambda: get_summary_tables().start())
+        cached = await asyncio.to_thread(lambda: get_answer_cache().get(query))
+        request_span.set(answer_cache='hit' if cached is not None else 'miss')
+        if cached is not None:
+            for delta in get_answer_cache().replay(cached):
+                yield delta
+            return
+
+        parts = []
+        config = {'callbacks': [SpanCallbackHandler(request_span)]}
+        agent = await asyncio.to_thread(get_sql_agent)
+        async for delta in aiter_text_deltas(agent.astream({"messages":[{"role":"user","content":query}]},stream_mode="messages",config=config)):
+            parts.append(delta)
+            yield delta
 
-        if node == 'model' and content and content[0].get('text',''):
-            result += content[0]['text']
-            yield result
+        if parts:
+            await asyncio.to_thread(get_answer_cache().put, query, ''.join(parts))
 
 
 # if __name__ == '__main__':
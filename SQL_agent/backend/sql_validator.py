@@ -0,0 +1,111 @@
+'''
+Script that validates SQL generated by the agent locally with a SQL parser (sqlglot) before it reaches the database.
+It deterministically rejects anything that isn't a read-only SELECT, checks table & column names against the cached
+schema snapshot and injects LIMIT top_k when missing. The agent needs no LLM-based query checker, which saves one model
+round-trip per query and turns "no DML" into a guarantee. Queries the local checks can't settle (inconclusive) are run as
+they are, any error of the database goes back to the agent.
+'''
+from dataclasses import dataclass
+from typing import Dict, List
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+OK = 'ok'
+REJECTED = 'rejected'
+INCONCLUSIVE = 'inconclusive'
+
+# statements & clauses that write to the database or its files
+WRITE_NODES = tuple(
+    node for node in (
+        getattr(exp, name, None) for name in (
+            'Insert', 'Update', 'Delete', 'Merge', 'Create', 'Drop', 'Alter', 'AlterTable', 'TruncateTable',
+            'Command', 'Into', 'Set', 'Grant', 'Revoke', 'Use', 'LoadData', 'Transaction', 'Commit', 'Rollback', 'Lock',
+        )
+    ) if node is not None
+)
+
+
+@dataclass
+class ValidationResult:
+    status: str # ok, rejected or inconclusive
+    sql: str # statement to run, with LIMIT injected if it was missing
+    reason: str = ''
+    read_only: bool = False # True once the parser proved the statement is a plain query
+
+    def as_message(self) -> str:
+        '''
+        :return: message returned to the agent by the query tool (sql_db_query).
+        '''
+        if self.status == REJECTED:
+            return f"Error: {self.reason}"
+        return self.sql
+
+
+def validate_sql(sql : str, schema_columns : Dict[str, List[str]], dialect : str = 'mysql', top_k : int = 5) -> ValidationResult:
+    '''
+    Function that validates a statement generated by the agent.
+    :param sql: SQL statement.
+    :param schema_columns: mapping of table name to its column names, taken from the schema snapshot.
+    :param dialect: sqlglot dialect of the database e.g. 'mysql' or 'sqlite'.
+    :param top_k: LIMIT injected into queries without one.
+    :return: validation result.
+    '''
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read=dialect) if statement is not None]
+    except ParseError as e:
+        return ValidationResult(INCONCLUSIVE, sql, f"query could not be parsed: {e}")
+
+    if len(statements) != 1:
+        return ValidationResult(REJECTED, sql, "exactly one SELECT statement is allowed per query.")
+    statement = statements[0]
+
+    # ---------- READ-ONLY ----------
+    if not isinstance(statement, (exp.Select, exp.Union, exp.Intersect, exp.Except)):
+        return ValidationResult(REJECTED, sql, f"only SELECT queries are allowed, got {statement.key.upper()}. DO NOT make any DML or DDL statements.")
+    write = statement.find(*WRITE_NODES)
+    if write is not None:
+        return ValidationResult(REJECTED, sql, f"{write.key.upper()} is not allowed, queries must be read-only.")
+
+    # ---------- TABLES & COLUMNS ----------
+    tables = {name.lower(): [column.lower() for column in columns] for name, columns in schema_columns.items()}
+    ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+
+    aliases = {}
+    for table in statement.find_all(exp.Table):
+        name = table.name.lower()
+        if name in ctes:
+            continue
+        if name not in tables:
+            return ValidationResult(REJECTED, sql, f"table '{table.name}' does not exist. Available tables: {', '.join(schema_columns)}.", read_only=True)
+        aliases[(table.alias or table.name).lower()] = name
+
+    # aliases of derived tables & projections can be referenced like columns
+    derived = ctes | {subquery.alias.lower() for subquery in statement.find_all(exp.Subquery) if subquery.alias}
+    projections = {alias.alias.lower() for alias in statement.find_all(exp.Alias)}
+    unresolved = []
+    for column in statement.find_all(exp.Column):
+        name, qualifier = column.name.lower(), column.table.lower()
+        if not name or name == '*':
+            continue
+        if qualifier:
+            if qualifier in derived:
+                continue
+            if qualifier not in aliases:
+                return ValidationResult(REJECTED, sql, f"unknown table or alias '{column.table}' in column '{column.sql()}'.", read_only=True)
+            if name not in tables[aliases[qualifier]]:
+                return ValidationResult(REJECTED, sql, f"column '{column.name}' does not exist in table '{aliases[qualifier]}'. Its columns are: {', '.join(tables[aliases[qualifier]])}.", read_only=True)
+        elif name not in projections and not any(name in tables[table] for table in aliases.values()):
+            unresolved.append(column.name)
+
+    if unresolved:
+        # with derived tables the column may come from them, which isn't resolved locally
+        status = INCONCLUSIVE if derived else REJECTED
+        return ValidationResult(status, sql, f"unknown column(s): {', '.join(sorted(set(unresolved)))}.", read_only=True)
+
+    # ---------- LIMIT ----------
+    if top_k and not statement.args.get('limit'):
+        statement = statement.limit(top_k)
+        return ValidationResult(OK, statement.sql(dialect=dialect), read_only=True)
+    return ValidationResult(OK, sql, read_only=True)
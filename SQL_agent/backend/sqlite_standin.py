@@ -0,0 +1,97 @@
+'''
+Script that loads SQL_agent/database/atliq_schema.sql into SQLite so that the SQL agent, its caches and benchmarks can run
+locally without a MySQL server. The MySQL DDL is translated (AUTO_INCREMENT, ENUM, UNIQUE KEY) and the PopulateTShirts
+stored procedure is emulated in Python with a seeded random generator.
+
+Usage from the project root:
+    python -m SQL_agent.backend.sqlite_standin atliq_tshirts.db
+    DB_URI=sqlite:///atliq_tshirts.db python -m streamlit run SQL_agent/frontend/app.py
+'''
+import argparse
+import itertools
+import random
+import re
+import sqlite3
+from pathlib import Path
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / 'database' / 'atliq_schema.sql'
+
+BRANDS = ('Van Huesen', 'Levi', 'Nike', 'Adidas')
+COLORS = ('Red', 'Blue', 'Black', 'White')
+SIZES = ('XS', 'S', 'M', 'L', 'XL')
+
+
+def translate_schema(sql : str, unique_brand_color_size : bool = True) -> str:
+    '''
+    Function that translates the CREATE TABLE statements of the MySQL schema to SQLite.
+    :param sql: content of atliq_schema.sql.
+    :param unique_brand_color_size: keep the UNIQUE (brand, color, size) key. Dropped for scaled-up synthetic data.
+    :return: SQLite DDL.
+    '''
+    statements = re.findall(r"CREATE TABLE .*?\n\);", sql, flags=re.S)
+    ddl = []
+    for statement in statements:
+        statement = re.sub(r"\bINT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT", statement)
+        # ENUM('a', 'b') -> TEXT CHECK (column IN ('a', 'b'))
+        statement = re.sub(r"(\w+) ENUM\(([^)]*)\)", r"\1 TEXT CHECK (\1 IN (\2))", statement)
+        if unique_brand_color_size:
+            statement = re.sub(r"UNIQUE KEY \w+ \(", "UNIQUE (", statement)
+        else:
+            statement = re.sub(r",\s*UNIQUE KEY \w+ \([^)]*\)", "", statement)
+        ddl.append(statement)
+    return '\n'.join(ddl)
+
+
+def generate_t_shirts(rows : int, unique_brand_color_size : bool = True, seed : int = 42):
+    '''
+    Function that emulates the PopulateTShirts stored procedure: random brand/color/size with price in [10, 50] and
+    stock in [10, 100]. With the unique key only the 80 distinct brand/color/size combinations can exist.
+    :param rows: no of t-shirts to generate.
+    :param unique_brand_color_size: generate each brand/color/size combination at most once.
+    :param seed: random seed so that the stand-in is reproducible.
+    :return: list of (brand, color, size, price, stock_quantity) tuples.
+    '''
+    rng = random.Random(seed)
+    if unique_brand_color_size:
+        combinations = list(itertools.product(BRANDS, COLORS, SIZES))
+        rng.shuffle(combinations)
+        combinations = combinations[:rows]
+    else:
+        combinations = [(rng.choice(BRANDS), rng.choice(COLORS), rng.choice(SIZES)) for _ in range(rows)]
+    return [(brand, color, size, rng.randint(10, 50), rng.randint(10, 100)) for brand, color, size in combinations]
+
+
+def create_atliq_sqlite(path = ':memory:', rows : int = 100, unique_brand_color_size : bool = True, seed : int = 42) -> sqlite3.Connection:
+    '''
+    Function that creates & populates the AtliQ database in SQLite.
+    :param path: database file or ':memory:'.
+    :param rows: no of t-shirts to generate.
+    :param unique_brand_color_size: keep the UNIQUE (brand, color, size) key of the MySQL schema.
+    :param seed: random seed of the generated data.
+    :return: open sqlite3 connection.
+    '''
+    sql = SCHEMA_PATH.read_text(encoding='utf-8')
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(translate_schema(sql, unique_brand_color_size))
+    conn.executemany(
+        "INSERT INTO t_shirts (brand, color, size, price, stock_quantity) VALUES (?, ?, ?, ?, ?)",
+        generate_t_shirts(rows, unique_brand_color_size, seed),
+    )
+
+    # the discounts insert of the schema is plain SQL hence it runs as is
+    discounts = re.search(r"INSERT INTO discounts.*?;", sql, flags=re.S)
+    if discounts:
+        conn.execute(discounts.group(0))
+    conn.commit()
+    return conn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create a SQLite copy of the AtliQ T-shirt database.')
+    parser.add_argument('path', help='SQLite database file to create')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    create_atliq_sqlite(args.path, rows=args.rows, seed=args.seed).close()
+    print(f'Created {args.path}')
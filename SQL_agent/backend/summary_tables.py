@@ -0,0 +1,254 @@
+'''
+Script that maintains materialized summary tables of the AtliQ database. Most questions asked to the SQL agent are
+aggregates of t_shirts joined with discounts (revenue by brand, stock by color & size, discounted value ...), hence they
+are pre-aggregated per brand, color & size and the agent is told to query these small tables instead of the base rows.
+
+Summaries are refreshed incrementally by a background thread: the aggregates are recomputed only when the content of
+t_shirts or discounts changed and only the groups whose values differ are inserted, updated or deleted, so readers never
+see an empty summary and no question waits on a refresh.
+'''
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from SQL_agent.backend.db_state import table_checksums
+
+logger = logging.getLogger(__name__)
+
+BASE_TABLES = ('t_shirts', 'discounts')
+
+# finest grain of the summaries. Every measure is additive hence coarser summaries are rolled up from it without
+# scanning the base tables again.
+GRAIN = ('brand', 'color', 'size')
+
+# measures kept for every group. Revenue follows the definition used by the agent i.e. stock sold at the price with the
+# discount applied when there is one. 100.0 keeps the division a float on SQLite as well.
+MEASURES = (
+    ('skus', 'INT', "COUNT(*)"),
+    ('stock_quantity', 'INT', "SUM(ts.stock_quantity)"),
+    ('inventory_value', 'DECIMAL(14,2)', "SUM(ts.stock_quantity * ts.price)"),
+    ('discounted_revenue', 'DECIMAL(14,2)', "SUM(ts.stock_quantity * ts.price * (1 - COALESCE(d.pct_discount, 0) / 100.0))"),
+    ('discounted_skus', 'INT', "COUNT(d.t_shirt_id)"),
+)
+
+
+@dataclass(frozen=True)
+class SummaryDefinition:
+    name: str
+    group_by: Tuple[str, ...]
+    description: str
+
+
+SUMMARY_DEFINITIONS = (
+    SummaryDefinition('summary_brand_color_size', ('brand', 'color', 'size'), 'one row per brand, color & size'),
+    SummaryDefinition('summary_brand', ('brand',), 'one row per brand'),
+    SummaryDefinition('summary_color_size', ('color', 'size'), 'one row per color & size across brands'),
+)
+
+
+@dataclass
+class RefreshReport:
+    inserted: Dict[str, int] = field(default_factory=dict)
+    updated: Dict[str, int] = field(default_factory=dict)
+    deleted: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+def aggregate_query(group_by : Sequence[str]) -> str:
+    '''
+    :param group_by: group columns of t_shirts.
+    :return: SELECT computing the measures per group from the base tables.
+    '''
+    groups = ', '.join(f"ts.{column}" for column in group_by)
+    measures = ', '.join(f"{expression} AS {name}" for name, _, expression in MEASURES)
+    return (
+        f"SELECT {groups}, {measures} FROM t_shirts ts "
+        f"LEFT JOIN discounts d ON d.t_shirt_id = ts.t_shirt_id GROUP BY {groups}"
+    )
+
+
+def create_table_ddl(definition : SummaryDefinition) -> str:
+    '''
+    :param definition: summary definition.
+    :return: CREATE TABLE statement of the summary, keyed on its group columns.
+    '''
+    columns = [f"{column} VARCHAR(32) NOT NULL" for column in definition.group_by]
+    columns += [f"{name} {column_type} NOT NULL" for name, column_type, _ in MEASURES]
+    columns.append(f"PRIMARY KEY ({', '.join(definition.group_by)})")
+    return f"CREATE TABLE IF NOT EXISTS {definition.name} ({', '.join(columns)})"
+
+
+def _normalize(row : Sequence, group_size : int) -> tuple:
+    # MySQL returns DECIMAL sums as Decimal & SQLite as float, hence measures are compared rounded to cents
+    return tuple(row[:group_size]) + tuple(round(float(value or 0), 2) for value in row[group_size:])
+
+
+def _unrounded(row : Sequence, group_size : int) -> tuple:
+    # measures as returned by the database (exact Decimal on MySQL), rounded only once rolled up
+    return tuple(row[:group_size]) + tuple(value or 0 for value in row[group_size:])
+
+
+def rollup(grain_rows : Sequence[tuple], group_by : Sequence[str]) -> Dict[tuple, tuple]:
+    '''
+    Function that sums the measures of the finest grain up to the given group columns.
+    :param grain_rows: unrounded rows of aggregate_query(GRAIN), rounding them first would add up to several paise of
+                       error per group.
+    :param group_by: group columns, a subset of GRAIN.
+    :return: mapping of group key to its row (group values followed by the measures rounded to cents).
+    '''
+    positions = [GRAIN.index(column) for column in group_by]
+    totals = {}
+    for row in grain_rows:
+        key = tuple(row[i] for i in positions)
+        measures = row[len(GRAIN):]
+        previous = totals.get(key)
+        totals[key] = measures if previous is None else tuple(a + b for a, b in zip(previous, measures))
+    return {key: key + tuple(round(float(value), 2) for value in measures) for key, measures in totals.items()}
+
+
+class SummaryTables:
+    """
+    Creates the summary tables and keeps them in sync with t_shirts & discounts.
+    """
+    def __init__(self, engine, definitions : Sequence[SummaryDefinition] = SUMMARY_DEFINITIONS, probe_interval : float = 30):
+        '''
+        :param engine: SQLAlchemy engine of the database.
+        :param definitions: summaries to maintain. Their group columns must be a subset of GRAIN.
+        :param probe_interval: seconds between two checks of the base tables by the background refresher (see start()).
+        '''
+        self.engine = engine
+        self.definitions = list(definitions)
+        self.probe_interval = probe_interval
+        self.enabled = False
+        self._checksums = None
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def setup(self) -> bool:
+        '''
+        Function that creates the missing summary tables & fills them. A database user without CREATE privileges only
+        disables the summaries, the agent keeps querying the base tables.
+        :return: True if the summaries are available.
+        '''
+        try:
+            with self.engine.begin() as conn:
+                for definition in self.definitions:
+                    conn.execute(text(create_table_ddl(definition)))
+            self.refresh(force=True)
+            self.enabled = True
+        except Exception as e:
+            logger.warning("Summary tables are disabled: %s", e)
+            self.enabled = False
+        return self.enabled
+
+    def refresh(self, force : bool = False) -> Optional[RefreshReport]:
+        '''
+        Function that brings every summary up to date, writing only the groups that changed.
+        :param force: refresh even if the base tables did not change since the last refresh.
+        :return: report of the rows written or None if nothing changed.
+        '''
+        with self._lock:
+            checksums = table_checksums(self.engine, BASE_TABLES)
+            if not force and checksums == self._checksums:
+                return None
+
+            start = time.perf_counter()
+            report = RefreshReport()
+            # one transaction hence readers see either the previous or the new summaries, never a mix
+            with self.engine.begin() as conn:
+                grain = [_unrounded(row, len(GRAIN)) for row in conn.execute(text(aggregate_query(GRAIN)))]
+                for definition in self.definitions:
+                    self._refresh_one(conn, definition, rollup(grain, definition.group_by), report)
+            report.seconds = time.perf_counter() - start
+            self._checksums = checksums
+            return report
+
+    def start(self) -> bool:
+        '''
+        Function that starts the background thread probing the base tables every probe_interval seconds & refreshing the
+        summaries when they changed, hence questions never wait on a refresh. Once the thread runs this is a mere flag
+        check, cheap enough for the request path to restart a refresher lost e.g. in a forked worker.
+        :return: True if the refresher runs.
+        '''
+        if not self.enabled:
+            return False
+        if self._refresher is None or not self._refresher.is_alive():
+            with self._refresher_lock:
+                if self._refresher is None or not self._refresher.is_alive():
+                    self._stopped.clear()
+                    self._refresher = threading.Thread(target=self._refresh_periodically, name='summary-refresh', daemon=True)
+                    self._refresher.start()
+        return True
+
+    def stop(self):
+        '''
+        Function that stops the background refresher after its current probe.
+        '''
+        self._stopped.set()
+
+    def _refresh_periodically(self):
+        while not self._stopped.wait(self.probe_interval):
+            try:
+                report = self.refresh()
+                if report is not None:
+                    logger.info("Summary tables refreshed in %.2fs", report.seconds)
+            except Exception as e:
+                # a failed refresh leaves the previous summaries in place, the next probe retries
+                logger.warning("Summary tables refresh failed: %s", e)
+
+    def _refresh_one(self, conn, definition : SummaryDefinition, fresh : Dict[tuple, tuple], report : RefreshReport):
+        size = len(definition.group_by)
+        measures = [name for name, _, _ in MEASURES]
+        current = {
+            row[:size]: row
+            for row in (_normalize(r, size) for r in conn.execute(text(f"SELECT {', '.join(list(definition.group_by) + measures)} FROM {definition.name}")))
+        }
+
+        group_params = lambda key: {f"g{i}": value for i, value in enumerate(key)}
+        measure_params = lambda row: {name: value for name, value in zip(measures, row[size:])}
+        where = ' AND '.join(f"{column} = :g{i}" for i, column in enumerate(definition.group_by))
+
+        inserts = [{**group_params(key), **measure_params(row)} for key, row in fresh.items() if key not in current]
+        updates = [{**group_params(key), **measure_params(row)} for key, row in fresh.items() if key in current and current[key] != row]
+        deletes = [group_params(key) for key in current if key not in fresh]
+
+        if deletes:
+            conn.execute(text(f"DELETE FROM {definition.name} WHERE {where}"), deletes)
+        if updates:
+            assignments = ', '.join(f"{name} = :{name}" for name in measures)
+            conn.execute(text(f"UPDATE {definition.name} SET {assignments} WHERE {where}"), updates)
+        if inserts:
+            columns = list(definition.group_by) + measures
+            values = [f":g{i}" for i in range(size)] + [f":{name}" for name in measures]
+            conn.execute(text(f"INSERT INTO {definition.name} ({', '.join(columns)}) VALUES ({', '.join(values)})"), inserts)
+
+        report.inserted[definition.name] = len(inserts)
+        report.updated[definition.name] = len(updates)
+        report.deleted[definition.name] = len(deletes)
+
+    def describe(self) -> str:
+        '''
+        :return: description of the summaries injected into the agent's system prompt, empty if they are disabled.
+        '''
+        if not self.enabled:
+            return ''
+        lines = [
+            "Pre-aggregated summary tables are kept up to date from t_shirts & discounts. PREFER them over aggregating",
+            "the base tables whenever the question only needs totals per brand, color and/or size:",
+        ]
+        for definition in self.definitions:
+            columns = ', '.join(list(definition.group_by) + [name for name, _, _ in MEASURES])
+            lines.append(f"- {definition.name}({columns}): {definition.description}")
+        lines += [
+            "skus is the no of t-shirts in the group, inventory_value is SUM(stock_quantity * price) without discounts,",
+            "discounted_revenue is SUM(stock_quantity * price * (1 - pct_discount/100)) with missing discounts as 0 and",
+            "discounted_skus is the no of t-shirts having a discount. Use the base tables for anything else e.g. prices",
+            "of individual t-shirts or the discount of a given t-shirt.",
+        ]
+        return '\n'.join(lines)
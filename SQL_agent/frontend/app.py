@@ -4,7 +4,10 @@ given a user question.
 '''
 
 import streamlit as st
-from SQL_agent.backend.sql_agent import fetch_response
+from SQL_agent.backend.sql_agent import fetch_response, warm_up_sql_agent
+from common.serving import RemoteStream, ServiceBusy, service_url
+from common.streaming import render_stream
+from common.tracing import get_tracer, timing_table, trace
 
 import streamlit as st
 
@@ -17,7 +20,33 @@ with st.form(key='question_form', clear_on_submit=False,enter_to_submit=True):
 
     # if there is a question fetch response and display it in chatbot style by running the RAG SQL-Agent in the backend.
     if question and submitted:
-        placeholder = st.empty()
-        for response in fetch_response(question):
-            placeholder.markdown(response)
+        # one trace per question: the agent's steps, model & tool calls and SQL executions are timed as nested spans
+        with trace('sql.question') as request_span:
+            placeholder = st.empty()
+            # with AGENT_SERVICE_URL set the agent runs in the shared agent service, this script only renders its stream
+            deltas = RemoteStream('/sql/answer', {'question': question}) if service_url() else fetch_response(question)
+            try:
+                # deltas are coalesced into a few frames per second instead of re-rendering the markdown on every token
+                response, stats = render_stream(deltas, placeholder.markdown, fps=12)
+            except ServiceBusy as e:
+                st.warning(f'The service is busy, please try again in {e.retry_after}s.')
+                st.stop()
+        st.caption(stats.caption())
 
+        # where the time of this question went, measured by the service when the agent runs there
+        timings = deltas.done.get('timings', []) if service_url() else timing_table(get_tracer().get_trace(request_span.trace_id))
+        with st.expander(f"⏱️ Timings ({request_span.seconds:.2f}s)"):
+            st.dataframe(timings, hide_index=True)
+
+@st.cache_resource
+def start_warm_up():
+    '''
+    Function that connects to the database & builds the agent in the background ONCE per process, after the first page
+    rendered instead of before it.
+    :return: warm-up thread.
+    '''
+    return warm_up_sql_agent()
+
+# nothing to warm up in a thin client, the service holds the agent
+if not service_url():
+    start_warm_up()
@@ -0,0 +1,339 @@
+'''
+Script that benchmarks the three apps end to end offline. Before any app module is imported, ChatOpenAI & OpenAIEmbeddings
+are swapped for a scripted fake chat model (tool calls & word-by-word streaming with configurable latencies) and the
+deterministic fake embedder, the SQL agent runs against a SQLite copy of atliq_schema.sql, articles come from a local HTTP
+server and the TTS endpoint & audio device are replaced by fakes. The real code paths are driven in between:
+fetch_response, index_documents_to_vector_db, call_rag_agent, generate_restaurant_and_menu & text_to_speech.
+
+Every scenario reports p50/p95/mean latency, time to first token (first audio for TTS), tokens/sec, throughput and the
+peak RSS of the process so far (a high-water mark, hence scenarios run later include the memory of earlier ones). Results
+are saved as JSON and compared against a previous run so that regressions show up between commits. Apps whose optional
+dependencies aren't installed (e.g. unstructured, sounddevice) are reported as skipped.
+
+Run from the project root:
+    python -m benchmarks.apps --iterations 20 --out benchmark_results.json
+    python -m benchmarks.apps --only sql,restaurant --compare benchmark_results.json --out new_results.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# the working directory changes to a scratch directory below, hence the project root is put on the path explicitly
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from benchmarks.fakes import ArticleServer, FakeEmbeddings, FakeTTS, NullAudioSink, ScriptedChatModel, tool_call
+from common.streaming import render_stream
+
+APPS = ('sql', 'news', 'restaurant', 'tts')
+
+FILLER = ('according', 'to', 'the', 'latest', 'data', 'this', 'figure', 'reflects', 'current', 'stock', 'levels', 'and',
+          'applied', 'discounts', 'across', 'every', 'brand', 'in', 'the', 'inventory')
+
+# question -> SQL the scripted model answers it with, filled by the SQL scenarios
+SQL_QUESTIONS: Dict[str, str] = {}
+
+
+# ---------- SCRIPTED MODEL ----------
+def filler(words : int, seed : int = 0) -> str:
+    return ' '.join(random.Random(seed).choices(FILLER, k=words))
+
+
+def app_script(answer_words : int):
+    '''
+    Function that creates the script of the fake chat model, which behaves like the real model would for each app: it
+    calls the tool the agent offers first, then answers with about answer_words words built on the tool result.
+    :param answer_words: length of the text answers.
+    :return: script(messages, tool_names) -> AIMessage.
+    '''
+    def script(messages, tool_names : List[str]) -> AIMessage:
+        question = next((m.content for m in messages if isinstance(m, HumanMessage)), '')
+        observed = messages[-1].content if isinstance(messages[-1], ToolMessage) else None
+
+        if 'RestaurantMenu' in tool_names:
+            seed = len(question)
+            return tool_call('RestaurantMenu', {
+                'restaurant_name': f"The {filler(2, seed).title()} House",
+                'menu_items': [f"{word.title()} Special" for word in filler(8, seed).split()],
+            })
+        if 'sql_db_query' in tool_names and observed is None:
+            return tool_call('sql_db_query', {'query': SQL_QUESTIONS.get(question, 'SELECT COUNT(*) FROM t_shirts')})
+        if 'retrieve_context_with_tool_based_rag' in tool_names and observed is None:
+            return tool_call('retrieve_context_with_tool_based_rag', {'query': question})
+        if observed is not None:
+            return AIMessage(content=f"The result is {observed[:120]} {filler(answer_words, len(question))}")
+        if 'comma separated' in question:
+            # menu step of the sequential restaurant chain
+            return AIMessage(content=','.join(f"{word.title()} Special" for word in filler(8, len(question)).split()))
+        return AIMessage(content=f"The {filler(2, len(question)).title()} House")
+
+    return script
+
+
+def install_fakes(args) -> dict:
+    '''
+    Function that replaces the OpenAI chat & embedding clients with fakes. It must run before the app modules are imported
+    since they create their clients at import time.
+    :return: the fakes, to read their counters.
+    '''
+    import langchain_openai
+
+    model = ScriptedChatModel(script=app_script(args.answer_words), first_token_latency=args.first_token_latency, per_token_latency=args.per_token_latency)
+    embeddings = FakeEmbeddings(request_latency=args.embed_latency)
+    langchain_openai.ChatOpenAI = lambda **kwargs: model
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: embeddings
+    return {'model': model, 'embeddings': embeddings}
+
+
+def prepare_environment(workdir : Path):
+    '''
+    Function that points the apps at local stand-ins: a SQLite AtliQ database, no API keys, no Whisper preload & a scratch
+    working directory so that the ./cache/ directories of a run start empty.
+    '''
+    from SQL_agent.backend.sqlite_standin import create_atliq_sqlite
+
+    db_path = workdir / 'atliq_tshirts.db'
+    create_atliq_sqlite(db_path).close()
+    os.environ.update({
+        'DB_URI': f'sqlite:///{db_path}',
+        'OPENAI_API_KEY': 'sk-fake',
+        'SQL_ANSWER_CACHE_SEMANTIC': '0',
+        'WHISPER_PRELOAD': '0',
+    })
+    os.chdir(workdir)
+
+
+# ---------- MEASUREMENT ----------
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def percentile(values : List[float], q : float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def stream(deltas) -> dict:
+    '''
+    :return: ttft & tokens of a stream of text deltas, consumed the way the frontends render it.
+    '''
+    _, stats = render_stream(deltas, lambda text: None)
+    return {'ttft': stats.ttft, 'tokens': stats.tokens, 'tokens_per_sec': stats.tokens_per_sec}
+
+
+def measure(iterations : int, run : Callable[[int], Optional[dict]]) -> dict:
+    '''
+    Function that runs a scenario iterations times and summarizes it.
+    :param iterations: no of runs.
+    :param run: run(i) performs run i & may return {'ttft', 'tokens', 'tokens_per_sec'} (see stream).
+    :return: latency percentiles, first token, throughput & peak RSS.
+    '''
+    latencies, ttfts, rates, tokens = [], [], [], 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        run_start = time.perf_counter()
+        stats = run(i)
+        # the return values of the app functions themselves are ignored, only stream/speak stats are kept
+        stats = stats if isinstance(stats, dict) else {}
+        latencies.append(time.perf_counter() - run_start)
+        if stats.get('ttft') is not None:
+            ttfts.append(stats['ttft'])
+        if stats.get('tokens_per_sec'):
+            rates.append(stats['tokens_per_sec'])
+        tokens += stats.get('tokens', 0)
+    wall = time.perf_counter() - start
+
+    summary = {
+        'iterations': iterations,
+        'p50': round(statistics.median(latencies), 6),
+        'p95': round(percentile(latencies, 0.95), 6),
+        'mean': round(statistics.fmean(latencies), 6),
+        'throughput_per_sec': round(iterations / wall, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    if ttfts:
+        summary.update({'ttft_p50': round(statistics.median(ttfts), 6), 'ttft_p95': round(percentile(ttfts, 0.95), 6)})
+    if rates:
+        summary['tokens_per_sec'] = round(statistics.fmean(rates), 1)
+    if tokens:
+        summary['tokens'] = tokens
+    return summary
+
+
+# ---------- SCENARIOS ----------
+def bench_sql(args) -> dict:
+    from SQL_agent.backend import sql_agent
+    from SQL_agent.backend.sqlite_standin import BRANDS, COLORS, SIZES
+
+    combos = [(brand, color, size) for brand in BRANDS for color in COLORS for size in SIZES]
+
+    def fresh(i):
+        # a new question every run: the answer cache misses & the agent runs (model -> sql_db_query -> model)
+        brand, color, size = combos[i % len(combos)]
+        question = f"How many {color} {brand} t-shirts of size {size} are in stock? (run {i})"
+        SQL_QUESTIONS[question] = (
+            f"SELECT SUM(stock_quantity) FROM t_shirts WHERE brand = '{brand}' AND color = '{color}' AND size = '{size}'"
+        )
+        return stream(sql_agent.fetch_response(question))
+
+    repeated = "What is the total value of the inventory of all t-shirts?"
+    SQL_QUESTIONS[repeated] = "SELECT SUM(stock_quantity * price) FROM t_shirts"
+    stream(sql_agent.fetch_response(repeated))
+
+    return {
+        'sql.fetch_response.fresh': measure(args.iterations, fresh),
+        'sql.fetch_response.cached': measure(args.iterations, lambda i: stream(sql_agent.fetch_response(repeated))),
+    }
+
+
+def bench_news(args) -> dict:
+    # parse_html needs unstructured, fail early rather than inside the parsing pool
+    import unstructured.partition.html  # noqa: F401
+    from NewsResearchTool.backend import tool_based_RAG
+
+    results = {}
+    with ArticleServer(latency=args.http_latency) as server:
+        def urls(i):
+            return tuple(server.url(i * args.articles + n) for n in range(args.articles))
+
+        # new articles every run: download, parse, split & embed
+        results['news.index.cold'] = measure(args.iterations, lambda i: tool_based_RAG.index_documents_to_vector_db(urls(i)))
+        # the same articles again: nothing to fetch or embed
+        tool_based_RAG.index_documents_to_vector_db(urls(0))
+        results['news.index.warm'] = measure(args.iterations, lambda i: tool_based_RAG.index_documents_to_vector_db(urls(0)))
+
+        question = "What did analysts say about Tata Motors quarterly profit?"
+        results['news.call_rag_agent'] = measure(args.iterations, lambda i: stream(tool_based_RAG.call_rag_agent(f"{question} ({i})", urls(0))))
+    return results
+
+
+def bench_restaurant(args) -> dict:
+    from Fictitious_restaurant_with_menu.backend import restaurant_and_menu_generator_server as server
+
+    cuisines = server.CUISINES
+    return {
+        'restaurant.structured': measure(args.iterations, lambda i: server.generate_restaurant_and_menu(cuisines[i % len(cuisines)])),
+        'restaurant.sequential': measure(args.iterations, lambda i: server.generate_restaurant_and_menu(cuisines[i % len(cuisines)], structured=False)),
+        'restaurant.batch': measure(max(1, args.iterations // 5), lambda i: server.generate_restaurant_batch(cuisines)),
+    }
+
+
+def bench_tts(args) -> dict:
+    from NewsResearchTool.backend import text_to_speech as tts
+
+    fake_tts = FakeTTS(request_latency=args.tts_latency)
+    tts.synthesize_pcm = fake_tts.synthesize
+    tts.AudioPlayer = lambda ring_buffer: NullAudioSink(ring_buffer, speed=0)
+
+    def answer(first_seed):
+        sentences = (filler(random.Random(seed).randint(8, 25), seed).capitalize() for seed in range(first_seed, first_seed + args.sentences))
+        return '. '.join(sentences) + '.'
+
+    def speak(text):
+        stats = asyncio.run(tts.text_to_speech(text))
+        return {'ttft': stats.first_audio_seconds}
+
+    results = {}
+    # every run speaks a new answer hence every chunk is synthesized
+    results['tts.text_to_speech.cold'] = measure(args.iterations, lambda i: speak(answer(1000 + i * args.sentences)))
+    # the same answer again, played from the on-disk cache
+    speak(answer(0))
+    results['tts.text_to_speech.warm'] = measure(args.iterations, lambda i: speak(answer(0)))
+    return results
+
+
+BENCHMARKS = {'sql': bench_sql, 'news': bench_news, 'restaurant': bench_restaurant, 'tts': bench_tts}
+
+
+# ---------- REPORT ----------
+def compare(current : dict, previous : dict, threshold : float) -> List[str]:
+    '''
+    Function that compares the p50, p95 & first token of every scenario with a previous run.
+    :param threshold: relative slowdown above which a metric is flagged as a regression.
+    :return: report lines.
+    '''
+    lines = []
+    for scenario, metrics in current['results'].items():
+        before = previous.get('results', {}).get(scenario)
+        if before is None:
+            lines.append(f"{scenario:<34} new")
+            continue
+        for metric in ('p50', 'p95', 'ttft_p50'):
+            if metric not in metrics or not before.get(metric):
+                continue
+            change = metrics[metric] / before[metric] - 1
+            # sub-millisecond paths (cache hits) are too noisy to flag on a relative change alone
+            flag = '  REGRESSION' if change > threshold and metrics[metric] - before[metric] > 0.001 else ''
+            lines.append(f"{scenario:<34} {metric:<9} {before[metric]:>9.4f}s -> {metrics[metric]:>9.4f}s ({change:+.1%}){flag}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default=','.join(APPS), help=f"comma separated apps among {', '.join(APPS)}")
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--out', default=None, help='JSON file the results are written to')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown reported as a regression')
+    parser.add_argument('--first-token-latency', type=float, default=0.3, help='seconds before the fake model answers')
+    parser.add_argument('--per-token-latency', type=float, default=0.01, help='seconds between two streamed tokens')
+    parser.add_argument('--answer-words', type=int, default=60, help='length of the fake answers')
+    parser.add_argument('--embed-latency', type=float, default=0.05, help='seconds per fake embedding request')
+    parser.add_argument('--http-latency', type=float, default=0.05, help='seconds per article served')
+    parser.add_argument('--articles', type=int, default=3, help='articles per news question')
+    parser.add_argument('--tts-latency', type=float, default=0.3, help='seconds per fake TTS request')
+    parser.add_argument('--sentences', type=int, default=20, help='sentences of the spoken answers')
+    args = parser.parse_args()
+
+    # relative paths given on the command line are resolved before moving to the scratch directory
+    out = Path(args.out).resolve() if args.out else None
+    previous = json.loads(Path(args.compare).read_text(encoding='utf-8')) if args.compare else None
+
+    apps = [app.strip() for app in args.only.split(',') if app.strip()]
+    results, skipped = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_environment(Path(tmp))
+        fakes = install_fakes(args)
+        for app in apps:
+            try:
+                results.update(BENCHMARKS[app](args))
+            except ImportError as e:
+                skipped[app] = f"missing dependency: {e.name or e}"
+            except Exception as e:
+                # one broken app doesn't lose the numbers of the others
+                traceback.print_exc()
+                skipped[app] = f"failed: {type(e).__name__}: {e}"
+        os.chdir(REPO_ROOT)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'platform': platform.platform(),
+            'args': vars(args), 'model_calls': fakes['model'].calls, 'embedding_requests': fakes['embeddings'].requests,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+    print(json.dumps({'results': results, 'skipped': skipped}, indent=2))
+    if out:
+        out.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    if previous:
+        print('\n'.join(compare(report, previous, args.threshold)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Script that benchmarks the context the news retrieval tool hands to the RAG agent, offline.
+Articles are split like the app does (1000 characters, 200 overlap, start_index) into a vector index with the fake
+embedder, then conversations of a few tool calls each retrieve top-k chunks. The prompt tokens of the previous serialization
+(whole metadata dict & every chunk in full) are compared with pack_context (merged passages under their url, text of
+earlier calls left out, token budget), along with the time packing takes.
+
+Run from the project root:
+    python -m benchmarks.context_packing --conversations 50 --calls 3 --k 4
+'''
+import argparse
+import json
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.fakes import FakeEmbeddings, make_article
+from NewsResearchTool.backend.context_packer import _encoding, conversation, pack_context
+from NewsResearchTool.backend.vector_index import MmapVectorIndex
+
+TOPIC_WORDS = ['markets', 'shares', 'central', 'bank', 'interest', 'rates', 'analysts', 'growth', 'tata', 'motors', 'quarterly', 'profit', 'revenue']
+
+
+def article_text(index : int, flowing : bool) -> str:
+    '''
+    :param flowing: one block of text, as some pages parse, instead of paragraphs hence chunks overlap.
+    :return: plain text of a generated article.
+    '''
+    paragraphs = re.findall(r'<p>(.*?)</p>', make_article(index, paragraphs=16))
+    return (' ' if flowing else '\n\n').join(paragraphs)
+
+
+def run(args, flowing : bool) -> dict:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len, add_start_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = MmapVectorIndex(Path(tmp) / 'news', embedding=FakeEmbeddings(request_latency=0))
+        urls = [f'https://news.example.com/article/{i}' for i in range(args.articles)]
+        docs = [
+            Document(page_content=article_text(i, flowing), metadata={'source': url, 'title': f'Article {i}', 'language': 'en', 'content_hash': f'{i:064x}'})
+            for i, url in enumerate(urls)
+        ]
+        index.add_documents(splitter.split_documents(docs))
+
+        rng = random.Random(0)
+        raw, packed, pack_ms = [], [], []
+        for _ in range(args.conversations):
+            sources = rng.sample(urls, min(3, len(urls)))
+            raw_tokens = packed_tokens = 0
+            with conversation():
+                for _ in range(args.calls):
+                    query = ' '.join(rng.sample(TOPIC_WORDS, 3))
+                    retrieved = [doc for doc, _ in index.search(query, k=args.k, sources=sources, mode='lexical')]
+                    start = time.perf_counter()
+                    _, stats = pack_context(retrieved, token_budget=args.token_budget)
+                    pack_ms.append((time.perf_counter() - start) * 1000)
+                    raw_tokens += stats.raw_tokens
+                    packed_tokens += stats.tokens
+            raw.append(raw_tokens)
+            packed.append(packed_tokens)
+
+    return {
+        'raw_tokens_per_conversation': round(statistics.fmean(raw), 1),
+        'packed_tokens_per_conversation': round(statistics.fmean(packed), 1),
+        'reduction': round(1 - sum(packed) / sum(raw), 3),
+        'pack_ms_p50': round(statistics.median(pack_ms), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articles', type=int, default=10)
+    parser.add_argument('--conversations', type=int, default=50)
+    parser.add_argument('--calls', type=int, default=3, help='tool calls per conversation')
+    parser.add_argument('--k', type=int, default=4, help='chunks retrieved per tool call')
+    parser.add_argument('--token-budget', type=int, default=800, help='max tokens of context per tool call')
+    args = parser.parse_args()
+
+    results = {
+        # counts are estimated (~4 characters per token) when the tiktoken vocabulary can't be loaded
+        'tokenizer': 'tiktoken' if _encoding() is not None else 'estimate',
+        'paragraphs': run(args, flowing=False),
+        'flowing': run(args, flowing=True),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Script that benchmarks the news embedding stage offline with a deterministic fake embedder.
+It compares the previous setup (CacheBackedEmbeddings over a LocalFileStore, one file per chunk) with EmbeddingPipeline on
+a synthetic corpus where part of the chunks repeat across articles, both cold (empty cache) and warm (everything cached).
+
+Run from the project root:
+    python -m benchmarks.embedding_pipeline --articles 30 --chunks-per-article 40
+'''
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fakes import FakeEmbeddings
+from NewsResearchTool.backend.embedding_pipeline import EmbeddingPipeline
+
+
+def make_corpus(articles : int, chunks_per_article : int, shared_ratio : float, seed : int = 0):
+    '''
+    Function that builds ~1000 character chunks of which a share is repeated across articles (boilerplate, quotes).
+    :return: list of chunk texts.
+    '''
+    rng = random.Random(seed)
+    words = [f'word{i}' for i in range(5000)]
+    shared = [' '.join(rng.choices(words, k=160)) for _ in range(max(1, chunks_per_article // 4))]
+
+    chunks = []
+    for article in range(articles):
+        for i in range(chunks_per_article):
+            if rng.random() < shared_ratio:
+                chunks.append(rng.choice(shared))
+            else:
+                chunks.append(f'article {article} chunk {i} ' + ' '.join(rng.choices(words, k=160)))
+    return chunks
+
+
+def run_baseline(chunks, embedder, cache_dir):
+    from langchain_classic.embeddings import CacheBackedEmbeddings
+    from langchain_classic.storage import LocalFileStore
+
+    cached = CacheBackedEmbeddings.from_bytes_store(underlying_embeddings=embedder, document_embedding_cache=LocalFileStore(cache_dir), namespace='fake')
+    start = time.perf_counter()
+    cached.embed_documents(chunks)
+    seconds = time.perf_counter() - start
+    return {'seconds': round(seconds, 4), 'chunks_per_sec': round(len(chunks) / seconds, 2), 'files': sum(1 for _ in Path(cache_dir).iterdir())}
+
+
+def run_pipeline(chunks, embedder, store_path, token_budget, max_concurrency):
+    pipeline = EmbeddingPipeline(embedder, store_path=store_path, namespace='fake', token_budget=token_budget, max_concurrency=max_concurrency)
+    pipeline.embed_documents(chunks)
+    stats = pipeline.last_stats.as_dict()
+    pipeline.store.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articles', type=int, default=30)
+    parser.add_argument('--chunks-per-article', type=int, default=40)
+    parser.add_argument('--shared-ratio', type=float, default=0.2, help='share of chunks repeated across articles')
+    parser.add_argument('--token-budget', type=int, default=8000)
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--request-latency', type=float, default=0.05, help='fake embedder latency per request in seconds')
+    parser.add_argument('--skip-baseline', action='store_true', help='do not run the CacheBackedEmbeddings baseline')
+    args = parser.parse_args()
+
+    chunks = make_corpus(args.articles, args.chunks_per_article, args.shared_ratio)
+    results = {'chunks': len(chunks), 'unique_chunks': len(set(chunks))}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_baseline:
+            embedder = FakeEmbeddings(request_latency=args.request_latency)
+            results['baseline_cold'] = run_baseline(chunks, embedder, f'{tmp}/files')
+            results['baseline_cold']['embedder_requests'] = embedder.requests
+            results['baseline_warm'] = run_baseline(chunks, embedder, f'{tmp}/files')
+
+        embedder = FakeEmbeddings(request_latency=args.request_latency)
+        results['pipeline_cold'] = run_pipeline(chunks, embedder, f'{tmp}/embeddings.sqlite', args.token_budget, args.max_concurrency)
+        results['pipeline_cold']['embedder_requests'] = embedder.requests
+        results['pipeline_warm'] = run_pipeline(chunks, embedder, f'{tmp}/embeddings.sqlite', args.token_budget, args.max_concurrency)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+'''
+Script that holds deterministic stand-ins for the paid services used by the apps so that hot paths can be measured offline.
+'''
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic embedding model: the vector of a text is derived from its hash, so equal texts always get equal vectors.
+    A fixed latency per request plus a latency per text mimic the round-trip of a remote embedding endpoint.
+    """
+    model = 'fake-embedding' # namespace of the embedding store, like OpenAIEmbeddings.model
+
+    def __init__(self, size : int = 1536, request_latency : float = 0.05, per_text_latency : float = 0.0005):
+        self.size = size
+        self.request_latency = request_latency
+        self.per_text_latency = per_text_latency
+        self.requests = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text : str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        return np.random.default_rng(seed).standard_normal(self.size).astype(np.float32).tolist()
+
+    def embed_documents(self, texts : List[str]) -> List[List[float]]:
+        with self._lock:
+            self.requests += 1
+            self.texts += len(texts)
+        time.sleep(self.request_latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text : str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeTTS:
+    """
+    Text to speech stand-in returning silent PCM16 whose duration matches the text read at ~15 characters per second.
+    Latency grows with the length of the text like a remote synthesis endpoint.
+    """
+    def __init__(self, request_latency : float = 0.3, per_char_latency : float = 0.002, chars_per_second : float = 15, sample_rate : int = 24000):
+        self.request_latency = request_latency
+        self.per_char_latency = per_char_latency
+        self.chars_per_second = chars_per_second
+        self.sample_rate = sample_rate
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def synthesize(self, text : str) -> bytes:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.request_latency + self.per_char_latency * len(text))
+        finally:
+            self.in_flight -= 1
+        return bytes(int(len(text) / self.chars_per_second * self.sample_rate) * 2)
+
+
+class NullAudioSink:
+    """
+    Audio sink that plays nothing: a reader thread drains a ring buffer block by block, optionally at real-time speed,
+    and counts underruns the way the audio device callback would.
+    """
+    def __init__(self, ring_buffer, block_bytes : int = 960, speed : float = 1.0, sample_rate : int = 24000):
+        '''
+        :param ring_buffer: PcmRingBuffer the sink reads from.
+        :param block_bytes: bytes read per block, 20ms of 24kHz PCM16 by default.
+        :param speed: playback speed, 0 drains as fast as possible.
+        '''
+        self.ring_buffer = ring_buffer
+        self.block_bytes = block_bytes
+        self.block_seconds = block_bytes / 2 / sample_rate / speed if speed else 0
+        self.played = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        block = bytearray(self.block_bytes)
+        while not self._stop.is_set():
+            n = self.ring_buffer.read_into(block)
+            self.played += n
+            if self.block_seconds or not n:
+                time.sleep(self.block_seconds or 0.001)
+
+    def write(self, pcm : bytes):
+        self.ring_buffer.write(pcm)
+
+    def drain(self, timeout=None):
+        self.ring_buffer.wait_empty(timeout)
+
+    def close(self):
+        self.ring_buffer.finish()
+        self._stop.set()
+        self._thread.join()
+
+
+_tool_call_ids = itertools.count(1)
+
+def tool_call(name : str, args : dict) -> AIMessage:
+    '''
+    :return: assistant message calling the tool name with args, e.g. as the reply of a ScriptedChatModel script.
+    '''
+    return AIMessage(content='', tool_calls=[{'name': name, 'args': args, 'id': f'call_{next(_tool_call_ids)}', 'type': 'tool_call'}])
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model stand-in whose replies come from a script: script(messages, tool_names) returns the next AIMessage, either
+    a tool call (see tool_call) or a text answer. Text answers are streamed word by word after a first token latency,
+    like a remote model would, and bind_tools/with_structured_output work the way they do on ChatOpenAI.
+    """
+    script: Callable[[List[BaseMessage], List[str]], AIMessage]
+    first_token_latency: float = 0.3
+    per_token_latency: float = 0.01
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'scripted-fake'
+
+    def bind_tools(self, tools, *, tool_choice = None, **kwargs):
+        # tools are passed on as OpenAI function specs, the script only gets their names
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _reply(self, messages : List[BaseMessage], **kwargs) -> AIMessage:
+        self.calls += 1
+        tool_names = [t['function']['name'] for t in kwargs.get('tools') or []]
+        return self.script(messages, tool_names)
+
+    def _generate(self, messages : List[BaseMessage], stop = None, run_manager = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages, **kwargs)
+        time.sleep(self.first_token_latency + self.per_token_latency * len(reply.content.split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(self, messages : List[BaseMessage], stop = None, run_manager = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        reply = self._reply(messages, **kwargs)
+        time.sleep(self.first_token_latency)
+        if reply.tool_calls:
+            # tool calls arrive in one chunk, their arguments aren't shown to the user anyway
+            yield ChatGenerationChunk(message=AIMessageChunk(content='', tool_call_chunks=[
+                {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': i}
+                for i, call in enumerate(reply.tool_calls)
+            ]))
+            return
+        for i, word in enumerate(reply.content.split(' ')):
+            if i:
+                time.sleep(self.per_token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    # async versions wait on the event loop instead of a worker thread, like the async OpenAI client
+    async def _agenerate(self, messages : List[BaseMessage], stop = None, run_manager = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages, **kwargs)
+        await asyncio.sleep(self.first_token_latency + self.per_token_latency * len(reply.content.split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _astream(self, messages : List[BaseMessage], stop = None, run_manager = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages, **kwargs)
+        await asyncio.sleep(self.first_token_latency)
+        if reply.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content='', tool_call_chunks=[
+                {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': i}
+                for i, call in enumerate(reply.tool_calls)
+            ]))
+            return
+        for i, word in enumerate(reply.content.split(' ')):
+            if i:
+                await asyncio.sleep(self.per_token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def make_article(index : int, paragraphs : int = 12, seed : int = 0) -> str:
+    '''
+    :return: deterministic HTML news article, the same index always gives the same page.
+    '''
+    rng = random.Random(seed * 100003 + index)
+    words = ['markets', 'shares', 'rose', 'fell', 'after', 'the', 'central', 'bank', 'announced', 'interest', 'rates', 'would',
+             'stay', 'flat', 'analysts', 'expect', 'growth', 'tata', 'motors', 'quarterly', 'profit', 'revenue', 'crore', 'percent']
+    body = ''.join(
+        f"<p>{' '.join(rng.choices(words, k=rng.randint(40, 90))).capitalize()}.</p>\n" for _ in range(paragraphs)
+    )
+    return f"<html><head><title>Article {index}</title></head><body><h1>Article {index}</h1>\n{body}</body></html>"
+
+
+class ArticleServer:
+    """
+    Local HTTP server publishing generated news articles at /article/<index>, with an optional latency per response.
+    Responses carry an ETag so that the conditional requests of the HTTP cache get 304s.
+    """
+    def __init__(self, latency : float = 0.05, paragraphs : int = 12, host : str = '127.0.0.1'):
+        server = self
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                if not self.path.startswith('/article/') or not self.path.rsplit('/', 1)[-1].isdigit():
+                    self.send_error(404)
+                    return
+                body = make_article(int(self.path.rsplit('/', 1)[-1]), server.paragraphs).encode('utf-8')
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    def url(self, index : int) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/article/{index}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,113 @@
+'''
+Script that checks the import-time budget of the modules the Streamlit frontends import before their first page renders.
+Each module is imported in a fresh interpreter (best of a few runs) with no reachable database, and the run fails when
+the import takes longer than the budget or pulls in a module that must stay lazy (torch, Whisper, the audio device, the
+OpenAI clients, the database drivers). The heaviest direct imports are listed to show where the time goes.
+
+Run from the project root (exit status 1 when over budget, e.g. in CI):
+    python -m benchmarks.import_time --budget 1.5
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# modules imported by the frontends at the top of their script
+MODULES = (
+    'SQL_agent.backend.sql_agent',
+    'NewsResearchTool.backend.tool_based_RAG',
+    'Fictitious_restaurant_with_menu.backend.restaurant_and_menu_generator_server',
+)
+
+# created on first use only, importing any of them before the page renders is a regression
+LAZY_MODULES = (
+    'torch', 'whisper', 'assemblyai', 'sounddevice', 'openai', 'langchain_openai', 'langchain_community',
+    'langchain_text_splitters', 'sqlalchemy', 'mysql',
+)
+
+CHECK = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {lazy!r} if name in sys.modules]}}))
+'''
+
+
+def parse_importtime(stderr : str, top : int = 5) -> list:
+    '''
+    Function that extracts the heaviest direct imports of the module from the output of python -X importtime.
+    :return: [(module, cumulative ms)] sorted by cumulative time.
+    '''
+    direct = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nesting is shown by 2 spaces per level after the column separator, direct imports are at level 1
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if level == 1:
+            direct.append((name.strip(), round(int(cumulative) / 1000, 1)))
+    return sorted(direct, key=lambda item: -item[1])[:top]
+
+
+def measure(module : str, repeat : int) -> dict:
+    '''
+    Function that imports module in fresh interpreters.
+    :return: best import time, lazy modules that got loaded & heaviest direct imports of the fastest run.
+    '''
+    env = dict(
+        os.environ,
+        # a database that can't be reached: importing must not connect
+        DB_URI=f"sqlite:///{Path(tempfile.gettempdir()) / 'missing-dir' / 'atliq.db'}",
+        OPENAI_API_KEY='sk-fake',
+        WHISPER_PRELOAD='0',
+        PYTHONPATH=str(REPO_ROOT),
+    )
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', CHECK.format(module=module, lazy=LAZY_MODULES)],
+            capture_output=True, text=True, env=env, cwd=REPO_ROOT,
+        )
+        if proc.returncode != 0:
+            lines = [line for line in proc.stderr.splitlines() if line.strip() and not line.startswith('import time:')]
+            # the exception line of the traceback, some libraries print a hint after it
+            errors = [line for line in lines if 'Error' in line.split(':')[0]] or lines
+            error = errors[-1] if errors else f"exit status {proc.returncode}"
+            return {'module': module, 'error': error}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = {'module': module, 'seconds': round(result['seconds'], 3), 'loaded': result['loaded'], 'heaviest': parse_importtime(proc.stderr)}
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=1.5, help='max seconds to import each module')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per module, the fastest counts')
+    parser.add_argument('modules', nargs='*', default=list(MODULES))
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        if 'error' in result:
+            status = 'ERROR'
+        elif result['seconds'] > args.budget or result['loaded']:
+            status = 'OVER BUDGET' if result['seconds'] > args.budget else 'EAGER IMPORT'
+        else:
+            status = 'ok'
+        failed |= status != 'ok'
+        result['status'] = status
+        print(json.dumps(result))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+'''
+Script that load tests the agent service (service/app.py) offline. The service runs in-process under uvicorn with the fake
+chat model & embedder of benchmarks.apps, and 1, 2, 4, ... concurrent sessions ask it distinct questions through the thin
+client the frontends use (common.serving.RemoteStream). Throughput should grow with the no of sessions up to the
+concurrency of the endpoint (SERVICE_<ENDPOINT>_CONCURRENCY), while the latency of a question stays about flat.
+A last scenario sends the same question from every session at once: it must run ONCE and be shared by all of them.
+
+Run from the project root:
+    python -m benchmarks.service_load --sessions 1,2,4,8,16 --requests 4 --out service_load.json
+'''
+import argparse
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks.apps import REPO_ROOT, SQL_QUESTIONS, install_fakes, peak_rss_mb, percentile, prepare_environment, stream
+from benchmarks.fakes import ArticleServer
+
+
+def start_service(concurrency : int):
+    '''
+    Function that serves service.app on a free local port in a background thread.
+    :param concurrency: slots of every endpoint.
+    :return: uvicorn server & its base url.
+    '''
+    import uvicorn
+
+    for endpoint in ('SQL', 'NEWS', 'RESTAURANT'):
+        os.environ[f'SERVICE_{endpoint}_CONCURRENCY'] = str(concurrency)
+    from service.app import app
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def health(base_url : str) -> dict:
+    import requests
+
+    return requests.get(base_url + '/health', timeout=10).json()
+
+
+def load(sessions : int, requests_per_session : int, ask : Callable[[int, int], dict]) -> dict:
+    '''
+    Function that runs sessions concurrent sessions asking requests_per_session questions each, one after the other.
+    :param ask: ask(session, i) asks one question & returns its stream stats.
+    :return: throughput, latency & time to first token percentiles, no of rejected requests.
+    '''
+    from common.serving import ServiceBusy
+
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    rejected = 0
+    lock = threading.Lock()
+
+    def session(s):
+        nonlocal rejected
+        for i in range(requests_per_session):
+            start = time.perf_counter()
+            try:
+                stats = ask(s, i)
+            except ServiceBusy:
+                with lock:
+                    rejected += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if stats.get('ttft') is not None:
+                    ttfts.append(stats['ttft'])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - start
+
+    summary = {
+        'sessions': sessions,
+        'answers': len(latencies),
+        'rejected': rejected,
+        'throughput_per_sec': round(len(latencies) / wall, 3),
+    }
+    if latencies:
+        summary.update({'p50': round(statistics.median(latencies), 4), 'p95': round(percentile(latencies, 0.95), 4)})
+    if ttfts:
+        summary['ttft_p50'] = round(statistics.median(ttfts), 4)
+    return summary
+
+
+def scaling(name : str, levels : List[int], requests_per_session : int, ask : Callable[[int, int, int], dict]) -> List[dict]:
+    '''
+    :param ask: ask(level, session, i), questions must differ across levels so that no answer cache serves them.
+    :return: one summary per no of sessions, with the speedup of the throughput over one session.
+    '''
+    # the first question builds the agent & fills the connection pools, it isn't measured
+    ask(0, 0, -1)
+    results = []
+    for level in levels:
+        summary = load(level, requests_per_session, lambda s, i: ask(level, s, i))
+        summary['speedup'] = round(summary['throughput_per_sec'] / results[0]['throughput_per_sec'], 2) if results else 1.0
+        results.append(summary)
+        print(json.dumps({'scenario': name, **summary}))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default='sql,news,coalescing', help='comma separated scenarios among sql, news, coalescing')
+    parser.add_argument('--sessions', default='1,2,4,8,16', help='comma separated no of concurrent sessions')
+    parser.add_argument('--requests', type=int, default=4, help='questions asked by every session')
+    parser.add_argument('--concurrency', type=int, default=8, help='slots of every endpoint of the service')
+    parser.add_argument('--out', default=None, help='JSON file the results are written to')
+    parser.add_argument('--first-token-latency', type=float, default=0.3, help='seconds before the fake model answers')
+    parser.add_argument('--per-token-latency', type=float, default=0.01, help='seconds between two streamed tokens')
+    parser.add_argument('--answer-words', type=int, default=60, help='length of the fake answers')
+    parser.add_argument('--embed-latency', type=float, default=0.05, help='seconds per fake embedding request')
+    parser.add_argument('--http-latency', type=float, default=0.05, help='seconds per article served')
+    parser.add_argument('--articles', type=int, default=3, help='articles per news question')
+    args = parser.parse_args()
+
+    from common.serving import RemoteStream, post_json
+
+    out = Path(args.out).resolve() if args.out else None
+    scenarios = [name.strip() for name in args.only.split(',') if name.strip()]
+    levels = [int(level) for level in args.sessions.split(',')]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_environment(Path(tmp))
+        os.environ['SERVICE_WARM_UP'] = '0'
+        fakes = install_fakes(args)
+        server, base_url = start_service(args.concurrency)
+        try:
+            if 'sql' in scenarios:
+                def ask_sql(level, s, i):
+                    question = f"How many t-shirts are in stock? (sessions {level}, session {s}, question {i})"
+                    SQL_QUESTIONS[question] = 'SELECT SUM(stock_quantity) FROM t_shirts'
+                    return stream(RemoteStream('/sql/answer', {'question': question}, base_url=base_url))
+
+                results['sql'] = scaling('sql', levels, args.requests, ask_sql)
+
+            if 'news' in scenarios:
+                # parse_html needs unstructured
+                import unstructured.partition.html  # noqa: F401
+
+                with ArticleServer(latency=args.http_latency) as articles:
+                    urls = [articles.url(n) for n in range(args.articles)]
+                    post_json('/news/index', {'urls': urls}, base_url=base_url)
+
+                    def ask_news(level, s, i):
+                        question = f"What did analysts say about Tata Motors? (sessions {level}, session {s}, question {i})"
+                        return stream(RemoteStream('/news/answer', {'question': question, 'urls': urls}, base_url=base_url))
+
+                    results['news'] = scaling('news', levels, args.requests, ask_news)
+
+            if 'coalescing' in scenarios:
+                # every session asks the same new question at the same time
+                sessions = max(levels)
+                before = health(base_url)['coalescing']
+                barrier = threading.Barrier(sessions)
+
+                def ask_same(s, i):
+                    barrier.wait()
+                    return stream(RemoteStream('/sql/answer', {'question': 'What is the total stock of Nike t-shirts?'}, base_url=base_url))
+
+                summary = load(sessions, 1, ask_same)
+                after = health(base_url)['coalescing']
+                summary.update({'executions': after['executions'] - before['executions'], 'coalesced': after['coalesced'] - before['coalesced']})
+                results['coalescing'] = summary
+                print(json.dumps({'scenario': 'coalescing', **summary}))
+        finally:
+            server.should_exit = True
+            os.chdir(REPO_ROOT)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args), 'model_calls': fakes['model'].calls,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        },
+        'results': results,
+    }
+    if out:
+        out.write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
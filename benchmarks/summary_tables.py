@@ -0,0 +1,127 @@
+'''
+Script that benchmarks the typical aggregate questions of the SQL agent against the base tables (t_shirts joined with
+discounts) and against the materialized summary tables, on a scaled-up synthetic AtliQ database in SQLite. It also times
+the initial build of the summaries and an incremental refresh after a few rows changed, and checks that both sides
+return the same numbers.
+
+Run from the project root:
+    python -m benchmarks.summary_tables --rows 200000 --repeat 20
+'''
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from SQL_agent.backend.db_engine import create_db_engine
+from SQL_agent.backend.sqlite_standin import create_atliq_sqlite
+from SQL_agent.backend.summary_tables import SummaryTables
+
+# question -> (query over the base tables, same question over a summary table)
+QUERIES = {
+    'revenue_by_brand': (
+        "SELECT ts.brand, SUM(ts.stock_quantity * ts.price * (1 - COALESCE(d.pct_discount, 0) / 100.0)) AS revenue "
+        "FROM t_shirts ts LEFT JOIN discounts d ON d.t_shirt_id = ts.t_shirt_id GROUP BY ts.brand ORDER BY ts.brand",
+        "SELECT brand, discounted_revenue FROM summary_brand ORDER BY brand",
+    ),
+    'stock_by_color_size': (
+        "SELECT color, size, SUM(stock_quantity) FROM t_shirts GROUP BY color, size ORDER BY color, size",
+        "SELECT color, size, stock_quantity FROM summary_color_size ORDER BY color, size",
+    ),
+    'levi_white_m_revenue': (
+        "SELECT SUM(ts.stock_quantity * ts.price * (1 - COALESCE(d.pct_discount, 0) / 100.0)) "
+        "FROM t_shirts ts LEFT JOIN discounts d ON d.t_shirt_id = ts.t_shirt_id "
+        "WHERE ts.brand = 'Levi' AND ts.color = 'White' AND ts.size = 'M'",
+        "SELECT discounted_revenue FROM summary_brand_color_size WHERE brand = 'Levi' AND color = 'White' AND size = 'M'",
+    ),
+    'inventory_value_total': (
+        "SELECT SUM(stock_quantity * price) FROM t_shirts",
+        "SELECT SUM(inventory_value) FROM summary_brand",
+    ),
+}
+
+
+def create_dataset(path, rows : int, discount_ratio : float, seed : int = 42):
+    '''
+    Function that creates the scaled-up database: brand/color/size repeat since the unique key is dropped and a share
+    of the t-shirts gets a discount on top of the 10 discounts of the schema.
+    '''
+    conn = create_atliq_sqlite(path, rows=rows, unique_brand_color_size=False, seed=seed)
+    rng = random.Random(seed)
+    discounted = rng.sample(range(11, rows + 1), int(rows * discount_ratio))
+    conn.executemany(
+        "INSERT INTO discounts (t_shirt_id, pct_discount) VALUES (?, ?)",
+        [(t_shirt_id, rng.choice((5, 10, 15, 20, 25, 30))) for t_shirt_id in discounted],
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_query(engine, sql, repeat):
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = conn.execute(text(sql)).fetchall()
+            timings.append(time.perf_counter() - start)
+    return rows, timings
+
+
+def same_result(a, b):
+    round_row = lambda row: tuple(round(v, 2) if isinstance(v, float) else v for v in row)
+    return [round_row(row) for row in a] == [round_row(row) for row in b]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='no of t-shirts generated')
+    parser.add_argument('--discount-ratio', type=float, default=0.3, help='share of t-shirts with a discount')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query')
+    parser.add_argument('--changed-rows', type=int, default=100, help='rows updated before the incremental refresh')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f'{tmp}/atliq.db'
+        create_dataset(path, args.rows, args.discount_ratio)
+        engine = create_db_engine(f'sqlite:///{path}', query_timeout=0)
+
+        summaries = SummaryTables(engine)
+        start = time.perf_counter()
+        summaries.setup()
+        results = {'rows': args.rows, 'build_seconds': round(time.perf_counter() - start, 4), 'queries': {}}
+
+        for name, (base_sql, summary_sql) in QUERIES.items():
+            base_rows, base_timings = time_query(engine, base_sql, args.repeat)
+            summary_rows, summary_timings = time_query(engine, summary_sql, args.repeat)
+            base_ms, summary_ms = statistics.median(base_timings) * 1000, statistics.median(summary_timings) * 1000
+            results['queries'][name] = {
+                'base_p50_ms': round(base_ms, 3),
+                'summary_p50_ms': round(summary_ms, 3),
+                'speedup': round(base_ms / summary_ms, 1) if summary_ms else None,
+                'same_result': same_result(base_rows, summary_rows),
+            }
+
+        # incremental refresh after a few stock updates
+        rng = random.Random(0)
+        with engine.begin() as conn:
+            conn.execute(
+                text("UPDATE t_shirts SET stock_quantity = stock_quantity + 1 WHERE t_shirt_id = :id"),
+                [{'id': rng.randint(1, args.rows)} for _ in range(args.changed_rows)],
+            )
+        report = summaries.refresh()
+        results['incremental_refresh'] = {
+            'seconds': round(report.seconds, 4),
+            'updated_rows': sum(report.updated.values()),
+            'inserted_rows': sum(report.inserted.values()),
+            'deleted_rows': sum(report.deleted.values()),
+        }
+        engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Script that benchmarks the text to speech stage offline with a fake TTS endpoint and a null audio sink.
+It compares the previous behaviour (4500 character chunks synthesized one after another, played once everything arrived)
+with the pipelined one (sentence chunks synthesized concurrently, played in order through a ring buffer as they land).
+The pipelined run is repeated through the on-disk audio cache, where the warm run makes no TTS request at all.
+The key number is the time to first audio.
+
+Run from the project root:
+    python -m benchmarks.text_to_speech --sentences 40 --max-concurrency 3
+'''
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import textwrap
+import time
+
+from benchmarks.fakes import FakeTTS, NullAudioSink
+from NewsResearchTool.backend.tts_cache import TTSCache, tts_cache_key
+from NewsResearchTool.backend.tts_pipeline import PcmRingBuffer, sentence_chunks, speak_pipelined
+
+
+def make_answer(sentences : int, seed : int = 0) -> str:
+    rng = random.Random(seed)
+    words = ['market', 'shares', 'rose', 'after', 'the', 'central', 'bank', 'announced', 'rates', 'would', 'stay', 'flat', 'analysts', 'expect', 'growth']
+    return ' '.join(' '.join(rng.choices(words, k=rng.randint(8, 25))).capitalize() + '.' for _ in range(sentences))
+
+
+async def run_sequential(answer, tts):
+    start = time.perf_counter()
+    final_audio = b""
+    for chunk in textwrap.wrap(answer, width=4500, break_long_words=False, break_on_hyphens=False):
+        final_audio += await tts.synthesize(chunk)
+    seconds = time.perf_counter() - start
+    return {'first_audio_seconds': round(seconds, 3), 'synthesis_seconds': round(seconds, 3), 'requests': tts.requests}
+
+
+def cached(synthesize, cache):
+    async def cached_synthesize(chunk):
+        key = tts_cache_key('fake', 'alloy', 'pcm', chunk)
+        pcm = cache.get(key)
+        if pcm is None:
+            pcm = await synthesize(chunk)
+            cache.put(key, pcm)
+        return pcm
+    return cached_synthesize
+
+
+async def run_pipelined(answer, tts, max_concurrency, speed, cache=None):
+    sink = NullAudioSink(PcmRingBuffer(), speed=speed)
+    synthesize = tts.synthesize if cache is None else cached(tts.synthesize, cache)
+    try:
+        stats = await speak_pipelined(sentence_chunks(answer), synthesize, sink, max_concurrency=max_concurrency)
+    finally:
+        sink.close()
+    result = stats.as_dict()
+    result.update(requests=tts.requests, max_in_flight=tts.max_in_flight, underruns=sink.ring_buffer.underruns)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sentences', type=int, default=40)
+    parser.add_argument('--max-concurrency', type=int, default=3)
+    parser.add_argument('--request-latency', type=float, default=0.3, help='fake TTS latency per request in seconds')
+    parser.add_argument('--per-char-latency', type=float, default=0.002, help='fake TTS latency per character in seconds')
+    parser.add_argument('--speed', type=float, default=0, help='playback speed of the null sink, 0 drains instantly')
+    args = parser.parse_args()
+
+    answer = make_answer(args.sentences)
+    new_tts = lambda: FakeTTS(request_latency=args.request_latency, per_char_latency=args.per_char_latency)
+    results = {
+        'chars': len(answer),
+        'sequential': asyncio.run(run_sequential(answer, new_tts())),
+        'pipelined': asyncio.run(run_pipelined(answer, new_tts(), args.max_concurrency, args.speed)),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TTSCache(tmp)
+        results['pipelined_cache_cold'] = asyncio.run(run_pipelined(answer, new_tts(), args.max_concurrency, args.speed, cache))
+        results['pipelined_cache_warm'] = asyncio.run(run_pipelined(answer, new_tts(), args.max_concurrency, args.speed, cache))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
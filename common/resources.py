@@ -0,0 +1,112 @@
+'''
+Script that holds the shared, lazily created clients of the apps: chat models, embeddings & the OpenAI HTTP client.
+Nothing is imported or connected when this module is imported. Every client is created on first use, once per process
+even when several threads (Streamlit sessions, warm-up threads) ask for it at the same time, with the settings every
+backend used to duplicate. Backends build their own heavy resources (DB engines, agents, models) through the same
+`resource` decorator so that the first page of a frontend renders before any of them is ready.
+'''
+import os
+import threading
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+# .env of the project root, loaded once before any client reads its API key
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# settings shared by the chat models of all apps
+CHAT_MODEL = os.getenv('OPENAI_CHAT_MODEL', 'gpt-5.2')
+CHAT_TEMPERATURE = 0.3 # higher number indicates more randomness in the model's output
+CHAT_MAX_TOKENS = 500 # defines the no of words in the model's response
+CHAT_TIMEOUT = 30 # max time in sec to wait for model's response
+
+
+def resource(factory : Callable) -> Callable:
+    '''
+    Decorator turning a factory into a lazily created process singleton per set of arguments. Unlike lru_cache, the
+    factory runs once even when several threads ask for the same resource at the same time; the others wait for it.
+    The wrapper gets cache_clear() & is_ready(*args, **kwargs) e.g. to show whether a warm-up finished.
+    '''
+    instances: Dict[tuple, object] = {}
+    lock = threading.RLock()
+
+    def key(args, kwargs):
+        return args, tuple(sorted(kwargs.items()))
+
+    @wraps(factory)
+    def get(*args, **kwargs):
+        k = key(args, kwargs)
+        try:
+            return instances[k]
+        except KeyError:
+            pass
+        with lock:
+            if k not in instances:
+                instances[k] = factory(*args, **kwargs)
+            return instances[k]
+
+    get.cache_clear = instances.clear
+    get.is_ready = lambda *args, **kwargs: key(args, kwargs) in instances
+    return get
+
+
+def warm_up(*factories : Callable, name : str = 'warm-up') -> threading.Thread:
+    '''
+    Function that creates resources in a background thread, e.g. right after a page rendered so that the first question
+    doesn't pay for them. Failures are left for the first real use to surface.
+    :param factories: zero-argument callables such as get_chat_model.
+    :return: warm-up thread.
+    '''
+    def run():
+        for factory in factories:
+            try:
+                factory()
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+@resource
+def get_chat_model(temperature : float = CHAT_TEMPERATURE, max_tokens : Optional[int] = CHAT_MAX_TOKENS):
+    '''
+    Function that creates the OpenAI chat model shared by the agents & chains.
+    :param temperature: sampling temperature.
+    :param max_tokens: cap of the response length.
+    :return: ChatOpenAI client.
+    '''
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=CHAT_MODEL,
+        api_key=os.getenv('OPENAI_API_KEY'),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=CHAT_TIMEOUT,
+    )
+
+
+@resource
+def get_embeddings():
+    '''
+    :return: OpenAI embedding model shared by the vector index & the semantic answer cache.
+    '''
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+@resource
+def get_async_openai():
+    '''
+    :return: async OpenAI HTTP client e.g. for text to speech, re-using its connection pool across requests.
+    '''
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
@@ -0,0 +1,314 @@
+'''
+Script that holds the pieces of the multi-user agent service (see service/app.py) and of its thin clients.
+Admission control bounds the no of executions per endpoint & rejects requests once the queue is full instead of letting
+latency grow without bound, and request coalescing lets identical in-flight questions share ONE execution: every
+subscriber gets all events of the shared run from its start. Events travel as server-sent events (SSE), which the
+Streamlit frontends read back as text deltas through RemoteStream.
+'''
+import asyncio
+import json
+import math
+import os
+from typing import AsyncIterator, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+# event of a shared run: (name, JSON serializable data) e.g. ('delta', {'text': 'Levi'})
+Event = Tuple[str, dict]
+
+
+class Overloaded(Exception):
+    """
+    Raised when an endpoint can't admit a request: all its slots are busy & its queue is full, or the request waited in
+    the queue longer than the queue timeout. Served as 503 with a Retry-After header.
+    """
+    def __init__(self, endpoint : str, reason : str, retry_after : int = 1):
+        super().__init__(f"{endpoint} is overloaded: {reason}")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded concurrency of one endpoint: at most max_concurrency executions run at once, at most max_queue requests wait
+    for a slot and none of them waits longer than queue_timeout.
+    """
+    def __init__(self, name : str, max_concurrency : int, max_queue : int = 32, queue_timeout : float = 10.0):
+        '''
+        :param name: endpoint name, shown in errors & stats.
+        :param max_concurrency: max no of executions running at once.
+        :param max_queue: max no of requests waiting for a slot, further ones are rejected straight away.
+        :param queue_timeout: max seconds a request waits for a slot.
+        '''
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1.')
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self):
+        '''
+        Function that waits for a free slot, to be given back with release().
+        :raise Overloaded: the queue is full or the wait exceeded queue_timeout.
+        '''
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name, f"{self.running} running & {self.waiting} queued")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(self.name, f"no slot within {self.queue_timeout:g}s", retry_after=math.ceil(self.queue_timeout)) from None
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.admitted += 1
+
+    def release(self):
+        self.running -= 1
+        self._slots.release()
+
+    def as_dict(self) -> dict:
+        return {
+            'running': self.running, 'waiting': self.waiting, 'admitted': self.admitted, 'rejected': self.rejected,
+            'max_concurrency': self.max_concurrency, 'max_queue': self.max_queue,
+        }
+
+
+class SharedRun:
+    """
+    One execution whose events are recorded & replayed to every subscriber, whenever it subscribed. The execution is
+    cancelled once its last subscriber left before it finished.
+    """
+    def __init__(self, events : AsyncIterator[Event], on_done : Callable[['SharedRun'], None]):
+        '''
+        :param events: async iterator of events of the execution.
+        :param on_done: callable run ONCE when the execution finished, failed or got cancelled.
+        '''
+        self.events: List[Event] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_done = on_done
+        self._finished = False
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._produce(events))
+
+    def _notify(self):
+        # wake up the subscribers waiting on the current event & hand a fresh one to the next waiters
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._on_done(self)
+
+    async def _produce(self, events : AsyncIterator[Event]):
+        try:
+            async for event in events:
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = RuntimeError('execution cancelled')
+            raise
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.done = True
+            self._notify()
+            self._finish()
+
+    def subscribe(self) -> AsyncIterator[Event]:
+        '''
+        Function that registers a subscriber right away, hence the run isn't cancelled by others leaving before this one
+        starts reading.
+        :return: async generator of every event of the run from its start.
+        :raise: the error of the run once its events were replayed.
+        '''
+        self.subscribers += 1
+        return self._follow()
+
+    async def _follow(self) -> AsyncIterator[Event]:
+        try:
+            i = 0
+            while True:
+                changed = self._changed
+                while i < len(self.events):
+                    yield self.events[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            # nobody is listening anymore (e.g. every client disconnected): stop paying for the execution
+            if not self.subscribers and not self.done:
+                self._task.cancel()
+                self._finish()
+
+
+class Coalescer:
+    """
+    Registry of in-flight executions keyed on the request, hence identical requests arriving while one is running
+    subscribe to it instead of starting another one.
+    """
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._runs: Dict[Hashable, SharedRun] = {}
+
+    def __len__(self):
+        return len(self._runs)
+
+    async def subscribe(self, key : Hashable, start : Callable[[], AsyncIterator[Event]], admission : Optional[AdmissionController] = None) -> Tuple[AsyncIterator[Event], bool]:
+        '''
+        Function that subscribes to the in-flight execution of key or starts one.
+        :param key: identity of the request e.g. ('sql', normalized question).
+        :param start: zero-argument callable returning the events of a new execution.
+        :param admission: admission controller a new execution takes a slot from, until it ends.
+        :return: events of the shared run from its start (see SharedRun.subscribe) & whether it was joined rather than started.
+        :raise Overloaded: a new execution was needed but not admitted.
+        '''
+        run = self._runs.get(key)
+        if run is None and admission is not None:
+            await admission.acquire()
+            # an identical request may have started the execution while this one waited for a slot
+            run = self._runs.get(key)
+            if run is not None:
+                admission.release()
+        if run is not None:
+            self.coalesced += 1
+            return run.subscribe(), True
+
+        def on_done(finished : SharedRun):
+            if self._runs.get(key) is finished:
+                del self._runs[key]
+            if admission is not None:
+                admission.release()
+
+        self.executions += 1
+        run = SharedRun(start(), on_done)
+        self._runs[key] = run
+        return run.subscribe(), False
+
+    def as_dict(self) -> dict:
+        return {'executions': self.executions, 'coalesced': self.coalesced, 'in_flight': len(self._runs)}
+
+
+def normalize_question(question : str) -> str:
+    '''
+    :return: question with case & whitespace normalized, to coalesce the same question typed slightly differently.
+    '''
+    return ' '.join(question.split()).casefold()
+
+
+# ---------- SERVER-SENT EVENTS ----------
+def sse_event(event : str, data : dict) -> str:
+    '''
+    :return: one server-sent event.
+    '''
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse(lines : Iterable[str]) -> Iterator[Event]:
+    '''
+    :param lines: decoded lines of a text/event-stream response.
+    :return: generator of (event, data) pairs.
+    '''
+    event, data = 'message', []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads('\n'.join(data))
+            event, data = 'message', []
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data.append(line[len('data:'):].strip())
+
+
+# ---------- THIN CLIENT ----------
+class ServiceError(Exception):
+    """
+    Raised by the thin client when the agent service failed to answer.
+    """
+
+
+class ServiceBusy(ServiceError):
+    """
+    Raised by the thin client when the agent service rejected the request because it is overloaded.
+    """
+    def __init__(self, message : str, retry_after : int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def service_url() -> Optional[str]:
+    '''
+    :return: base url of the agent service from AGENT_SERVICE_URL e.g. http://localhost:8000, None to run the agents
+             in-process.
+    '''
+    url = os.getenv('AGENT_SERVICE_URL', '').strip()
+    return url.rstrip('/') or None
+
+
+def _check(response):
+    if response.status_code == 503:
+        raise ServiceBusy(response.json().get('error', 'service overloaded'), int(response.headers.get('Retry-After', '1')))
+    if response.status_code >= 400:
+        raise ServiceError(f"{response.status_code}: {response.text[:200]}")
+
+
+class RemoteStream:
+    """
+    Text deltas of an answer streamed by the agent service, to render with common.streaming.render_stream just like the
+    in-process generators. The final 'done' event (stats & server-side timings) is kept in `done`.
+    """
+    def __init__(self, path : str, payload : dict, base_url : Optional[str] = None, timeout : float = 120):
+        '''
+        :param path: endpoint e.g. '/sql/answer'.
+        :param payload: JSON body of the request.
+        :param base_url: url of the service, AGENT_SERVICE_URL by default.
+        :param timeout: max seconds to wait for the connection & between two events.
+        '''
+        self.url = (base_url or service_url()) + path
+        self.payload = payload
+        self.timeout = timeout
+        self.done: dict = {}
+
+    def __iter__(self) -> Iterator[str]:
+        import requests
+
+        with requests.post(self.url, json=self.payload, stream=True, timeout=self.timeout) as response:
+            _check(response)
+            for event, data in iter_sse(response.iter_lines(decode_unicode=True)):
+                if event == 'delta':
+                    yield data['text']
+                elif event == 'done':
+                    self.done = data
+                elif event == 'error':
+                    raise ServiceError(data['error'])
+
+
+def post_json(path : str, payload : dict, base_url : Optional[str] = None, timeout : float = 120) -> dict:
+    '''
+    Function that calls a non-streaming endpoint of the agent service.
+    :param path: endpoint e.g. '/restaurants'.
+    :param payload: JSON body of the request.
+    :param base_url: url of the service, AGENT_SERVICE_URL by default.
+    :return: JSON response.
+    '''
+    import requests
+
+    response = requests.post((base_url or service_url()) + path, json=payload, timeout=timeout)
+    _check(response)
+    return response.json()
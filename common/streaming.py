@@ -0,0 +1,186 @@
+'''
+Script that holds the streaming primitives shared by the agents & their Streamlit frontends.
+Backends yield text deltas (only the new piece of text of every model chunk) instead of the whole answer so far, and the
+frontends coalesce those deltas into frames rendered at a fixed rate. Copying & rendering then grow linearly with the
+answer length instead of quadratically, and time-to-first-token & tokens/sec are measured along the way.
+'''
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+def text_delta(token, metadata : dict, node : str = 'model') -> str:
+    '''
+    Function that extracts the text of one chunk streamed by a langgraph agent with stream_mode="messages".
+    :param token: message chunk.
+    :param metadata: metadata of the chunk.
+    :param node: graph node whose text is part of the answer.
+    :return: text of the chunk, empty for tool calls & chunks of other nodes.
+    '''
+    if metadata.get('langgraph_node') != node:
+        return ''
+    content = token.content_blocks
+    if content and content[0].get('text', ''):
+        return content[0]['text']
+    return ''
+
+
+def iter_text_deltas(stream : Iterable[Tuple[object, dict]], node : str = 'model') -> Iterator[str]:
+    '''
+    :param stream: output of agent.stream(..., stream_mode="messages").
+    :param node: graph node whose text is part of the answer.
+    :return: generator of non-empty text deltas.
+    '''
+    for token, metadata in stream:
+        delta = text_delta(token, metadata, node)
+        if delta:
+            yield delta
+
+
+async def aiter_text_deltas(stream : AsyncIterator[Tuple[object, dict]], node : str = 'model') -> AsyncIterator[str]:
+    '''
+    :param stream: output of agent.astream(..., stream_mode="messages").
+    :param node: graph node whose text is part of the answer.
+    :return: async generator of non-empty text deltas.
+    '''
+    async for token, metadata in stream:
+        delta = text_delta(token, metadata, node)
+        if delta:
+            yield delta
+
+
+def chunk_text(text : str, chunk_chars : int = 64) -> Iterator[str]:
+    '''
+    Function that splits a complete answer (e.g. from a cache) into deltas the way an agent streams it.
+    :param text: complete answer.
+    :param chunk_chars: approx no of characters per delta. Deltas end on whitespace.
+    :return: generator of deltas whose concatenation is the text.
+    :raise ValueError: chunk_chars is below 1, which would yield empty deltas forever.
+    '''
+    if chunk_chars < 1:
+        raise ValueError('chunk_chars must be at least 1.')
+    start = 0
+    while start < len(text):
+        end = text.find(' ', start + chunk_chars)
+        end = len(text) if end == -1 else end
+        yield text[start:end]
+        start = end
+
+
+@dataclass
+class StreamStats:
+    started_at: float
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    tokens: int = 0 # no of deltas, each streamed model chunk carries about one token
+    chars: int = 0
+    frames: int = 0
+
+    @property
+    def ttft(self) -> Optional[float]:
+        '''
+        :return: seconds from the start of the stream to the first delta.
+        '''
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_sec(self) -> float:
+        '''
+        :return: deltas per second from the first delta to the end of the stream.
+        '''
+        end = self.finished_at or time.perf_counter()
+        if self.first_token_at is None or end <= self.first_token_at:
+            return 0.0
+        return self.tokens / (end - self.first_token_at)
+
+    def as_dict(self) -> dict:
+        return {
+            'ttft': None if self.ttft is None else round(self.ttft, 3), 'tokens_per_sec': round(self.tokens_per_sec, 1),
+            'tokens': self.tokens, 'chars': self.chars, 'frames': self.frames,
+        }
+
+    def caption(self) -> str:
+        '''
+        :return: one line summary to display under an answer.
+        '''
+        ttft = 'n/a' if self.ttft is None else f"{self.ttft:.2f}s"
+        return f"First token: {ttft} | {self.tokens_per_sec:.1f} tokens/s | {self.tokens} tokens"
+
+
+class StreamRenderer:
+    """
+    Accumulates text deltas and renders the answer at most `fps` times per second, whatever the token rate.
+    """
+    def __init__(self, render : Callable[[str], None], fps : float = 12, started_at : Optional[float] = None):
+        '''
+        :param render: callable displaying the answer so far e.g. st.empty().markdown.
+        :param fps: max no of frames rendered per second.
+        :param started_at: perf_counter time the question was asked, defaults to now.
+        '''
+        self.render = render
+        self.interval = 1 / fps if fps else 0
+        self.stats = StreamStats(started_at=started_at if started_at is not None else time.perf_counter())
+        self._text = ''
+        self._pending: List[str] = []
+        self._rendered_at = 0.0
+
+    @property
+    def text(self) -> str:
+        '''
+        :return: answer received so far, including deltas not rendered yet.
+        '''
+        if self._pending:
+            self._text += ''.join(self._pending)
+            self._pending.clear()
+        return self._text
+
+    def feed(self, delta : str):
+        '''
+        Adds a delta and renders a frame if the last one is older than the frame interval.
+        :param delta: new text.
+        :return:
+        '''
+        if not delta:
+            return
+        now = time.perf_counter()
+        if self.stats.first_token_at is None:
+            self.stats.first_token_at = now
+        self.stats.tokens += 1
+        self.stats.chars += len(delta)
+        self._pending.append(delta)
+
+        # the first token is shown right away, then frames are coalesced
+        if self.stats.frames == 0 or now - self._rendered_at >= self.interval:
+            self._frame(now)
+
+    def _frame(self, now : float):
+        self.render(self.text)
+        self.stats.frames += 1
+        self._rendered_at = now
+
+    def close(self) -> str:
+        '''
+        Renders the final frame if deltas are pending.
+        :return: complete answer.
+        '''
+        if self._pending:
+            self._frame(time.perf_counter())
+        self.stats.finished_at = time.perf_counter()
+        return self._text
+
+
+def render_stream(deltas : Iterable[str], render : Callable[[str], None], fps : float = 12) -> Tuple[str, StreamStats]:
+    '''
+    Function that renders a stream of deltas with a StreamRenderer.
+    :param deltas: text deltas e.g. from fetch_response or call_rag_agent.
+    :param render: callable displaying the answer so far.
+    :param fps: max no of frames rendered per second.
+    :return: complete answer & its stream stats.
+    '''
+    renderer = StreamRenderer(render, fps=fps)
+    try:
+        for delta in deltas:
+            renderer.feed(delta)
+    finally:
+        renderer.close()
+    return renderer.text, renderer.stats
@@ -0,0 +1,352 @@
+'''
+Script that records where the time of a request goes as nested spans: URL loading, embedding batches, retrieval, every
+langgraph node step, model call & tool call of the agents (through a langchain callback handler), SQL executions and TTS
+chunks, along with token counts. Finished spans are kept in memory per trace for the timing panels of the Streamlit
+frontends and appended to a JSONL file, one OTLP/JSON span per line, so that they can be inspected with jq or wrapped
+into an OTLP export request for any OpenTelemetry backend.
+
+The export file is set with TRACE_EXPORT (./cache/traces/spans.jsonl by default), an empty value turns the export off.
+Once it exceeds TRACE_EXPORT_MAX_MB (10 by default) it is rotated to <file>.1, hence at most twice that is kept on disk.
+'''
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# span whose context manager the code currently runs in. Asyncio tasks & langchain's tool threads inherit it, plain
+# thread pools don't hence spans started there are given their parent explicitly.
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+def current_span() -> Optional['Span']:
+    '''
+    :return: innermost active span of the calling context, None outside of any span.
+    '''
+    return _current_span.get()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    tracer: Optional['Tracer'] = field(default=None, repr=False)
+
+    @property
+    def seconds(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        '''
+        Adds attributes e.g. token counts known only once the work is done.
+        :return: the span.
+        '''
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, error : Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.tracer is not None:
+            self.tracer._finish(self)
+
+    def to_otlp(self) -> dict:
+        '''
+        :return: span in the OTLP/JSON encoding.
+        '''
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': 1, # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in self.attributes.items() if value is not None],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Tracer:
+    """
+    Creates spans, keeps the finished ones of the last traces in memory & appends them to the export file.
+    """
+    def __init__(self, path = None, max_traces : int = 64, max_bytes : Optional[int] = 10 * 2**20):
+        '''
+        :param path: JSONL file finished spans are appended to, None keeps them in memory only.
+        :param max_traces: no of most recent traces kept in memory.
+        :param max_bytes: size beyond which the export file is rotated to <path>.1 (replacing the previous one), None
+                          lets it grow without bound.
+        '''
+        self.path = Path(path) if path else None
+        self.max_traces = max_traces
+        self.max_bytes = max_bytes
+        self._traces: 'OrderedDict[str, List[Span]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # kept open & line buffered, every span is on disk once it ends
+            self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+
+    def start_span(self, name : str, parent : Optional[Span] = None, new_trace : bool = False, **attributes) -> Span:
+        '''
+        Function that starts a span, to be ended with span.end(). Prefer the span context manager where the work is a block.
+        :param name: e.g. 'sql.query'.
+        :param parent: parent span, the current span of the calling context by default.
+        :param new_trace: start a new trace whatever the current span.
+        :param attributes: attributes of the span.
+        :return: started span.
+        '''
+        parent = None if new_trace else (parent or current_span())
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+            tracer=self,
+        )
+
+    @contextmanager
+    def span(self, name : str, parent : Optional[Span] = None, new_trace : bool = False, **attributes) -> Iterator[Span]:
+        '''
+        Context manager that times a block as a span, made the current span of the block. Exceptions are recorded on the
+        span & re-raised.
+        '''
+        span = self.start_span(name, parent=parent, new_trace=new_trace, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # a generator holding the span was closed from another context
+                pass
+
+    def _finish(self, span : Span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span.to_otlp()) + '\n')
+                if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+                    self._rotate()
+
+    def _rotate(self):
+        '''
+        Moves the full export file to <path>.1 & starts a new one. The caller holds the lock.
+        '''
+        self._file.close()
+        try:
+            # another process sharing the file may have rotated it already, in which case its new file is kept
+            if os.stat(self.path).st_size >= self.max_bytes:
+                os.replace(self.path, self.path.with_name(self.path.name + '.1'))
+        except FileNotFoundError:
+            pass
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+
+    def get_trace(self, trace_id : str) -> List[Span]:
+        '''
+        :return: finished spans of a trace ordered by start time.
+        '''
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda span: span.start_ns)
+
+
+@lru_cache
+def get_tracer() -> Tracer:
+    '''
+    Function that creates the tracer ONCE per process.
+    :return: process-wide tracer.
+    '''
+    max_mb = float(os.getenv('TRACE_EXPORT_MAX_MB', '10'))
+    return Tracer(os.getenv('TRACE_EXPORT', './cache/traces/spans.jsonl') or None, max_bytes=int(max_mb * 2**20) or None)
+
+
+def span(name : str, parent : Optional[Span] = None, new_trace : bool = False, **attributes):
+    '''
+    Shortcut to get_tracer().span, e.g. `with span('sql.query', fingerprint=fp) as s: ...`.
+    '''
+    return get_tracer().span(name, parent=parent, new_trace=new_trace, **attributes)
+
+
+def trace(name : str, **attributes):
+    '''
+    Context manager opening the root span of a new trace, e.g. one per user question in a frontend.
+    '''
+    return get_tracer().span(name, new_trace=True, **attributes)
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """
+    Langchain callback handler turning the runs of an agent into spans: one per langgraph node step, model call (with
+    time to first token & token usage) and tool call. Pass it in the config of agent.stream/invoke.
+    """
+    def __init__(self, parent : Optional[Span] = None, tracer : Optional[Tracer] = None):
+        '''
+        :param parent: span the runs nest under, the current span by default.
+        :param tracer: tracer, the process-wide one by default.
+        '''
+        self.tracer = tracer or get_tracer()
+        self.parent = parent or current_span()
+        self._spans: Dict[Any, Span] = {}
+        self._parents: Dict[Any, Any] = {} # run id -> parent run id, to nest spans under runs that have no span
+        self._tokens: Dict[Any, Any] = {}
+
+    def _parent_span(self, parent_run_id) -> Optional[Span]:
+        while parent_run_id is not None:
+            if parent_run_id in self._spans:
+                return self._spans[parent_run_id]
+            parent_run_id = self._parents.get(parent_run_id)
+        return self.parent
+
+    def _start(self, run_id, parent_run_id, name : str, **attributes) -> Span:
+        self._parents[run_id] = parent_run_id
+        span = self.tracer.start_span(name, parent=self._parent_span(parent_run_id), **attributes)
+        self._spans[run_id] = span
+        return span
+
+    def _end(self, run_id, error : Optional[BaseException] = None, **attributes):
+        self._parents.pop(run_id, None)
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes).end(error)
+
+    # ---------- LANGGRAPH NODES ----------
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get('langgraph_node')
+        # only the run of the node itself, not the runnables it is made of
+        if node and kwargs.get('name') == node:
+            self._start(run_id, parent_run_id, f"node:{node}", step=metadata.get('langgraph_step'))
+        else:
+            self._parents[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # ---------- MODEL CALLS ----------
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._start(run_id, parent_run_id, 'llm', model=metadata.get('ls_model_name'), messages=len(messages[0]) if messages else 0, streamed_tokens=0)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._start(run_id, parent_run_id, 'llm', model=metadata.get('ls_model_name'), streamed_tokens=0)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is None:
+            return
+        if 'ttft_ms' not in span.attributes:
+            span.attributes['ttft_ms'] = round((time.time_ns() - span.start_ns) / 1e6, 1)
+        span.attributes['streamed_tokens'] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        message = getattr(response.generations[0][0], 'message', None) if response.generations and response.generations[0] else None
+        if message is not None and getattr(message, 'usage_metadata', None):
+            usage = {'input_tokens': message.usage_metadata.get('input_tokens'), 'output_tokens': message.usage_metadata.get('output_tokens')}
+        elif response.llm_output and response.llm_output.get('token_usage'):
+            token_usage = response.llm_output['token_usage']
+            usage = {'input_tokens': token_usage.get('prompt_tokens'), 'output_tokens': token_usage.get('completion_tokens')}
+        tool_calls = len(message.tool_calls) if message is not None and getattr(message, 'tool_calls', None) else 0
+        self._end(run_id, tool_calls=tool_calls, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # ---------- TOOL CALLS ----------
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get('name') or kwargs.get('name') or 'tool'
+        span = self._start(run_id, parent_run_id, f"tool:{name}", input_chars=len(input_str or ''))
+        # the tool body runs right after in this context, hence spans it opens (SQL, retrieval) nest under the tool call
+        self._tokens[run_id] = _current_span.set(span)
+
+    def _reset(self, run_id):
+        token = self._tokens.pop(run_id, None)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._reset(run_id)
+        self._end(run_id, output_chars=len(str(getattr(output, 'content', output))))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._reset(run_id)
+        self._end(run_id, error)
+
+
+def timing_table(spans : List[Span]) -> List[dict]:
+    '''
+    Function that lays the spans of a trace out as rows for a timing panel, children indented under their parent.
+    :param spans: spans of one trace e.g. from get_tracer().get_trace(trace_id).
+    :return: rows of {'span', 'start_ms', 'duration_ms', 'details'} in tree order.
+    '''
+    if not spans:
+        return []
+    by_parent: Dict[Optional[str], List[Span]] = {}
+    ids = {span.span_id for span in spans}
+    for span in spans:
+        # a span whose parent isn't finished yet is shown at the top level
+        by_parent.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+    origin = min(span.start_ns for span in spans)
+
+    rows = []
+    def visit(parent_id, depth):
+        for span in sorted(by_parent.get(parent_id, []), key=lambda span: span.start_ns):
+            details = ', '.join(f"{key}={value}" for key, value in span.attributes.items() if value is not None)
+            rows.append({
+                'span': '\u2003' * depth + span.name, # em spaces survive the whitespace trimming of the table
+                'start_ms': round((span.start_ns - origin) / 1e6, 1),
+                'duration_ms': round((span.seconds or 0) * 1000, 1),
+                'details': details + (f" error={span.error}" if span.error else ''),
+            })
+            visit(span.span_id, depth + 1)
+    visit(None, 0)
+    return rows
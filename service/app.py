@@ -0,0 +1,185 @@
+'''
+Script that serves the SQL agent, the news RAG agent & the restaurant generator to many users from ONE process, so that the
+Streamlit frontends become thin clients (set AGENT_SERVICE_URL) instead of running the agents inside their script reruns.
+Answers are streamed as server-sent events from the async agent streams, each endpoint admits a bounded no of executions
+(SERVICE_<ENDPOINT>_CONCURRENCY, SERVICE_MAX_QUEUE waiting, SERVICE_QUEUE_TIMEOUT seconds, then 503 with Retry-After) and
+identical questions in flight share one execution.
+
+Run from the project root:
+    uvicorn service.app:app --host 0.0.0.0 --port 8000
+'''
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from common.resources import get_chat_model, warm_up
+from common.serving import AdmissionController, Coalescer, Event, Overloaded, normalize_question, sse_event
+from common.tracing import get_tracer, timing_table, trace
+from Fictitious_restaurant_with_menu.backend.restaurant_and_menu_generator_server import agenerate_restaurant_and_menu, get_restaurant_catalog, CUISINES
+from NewsResearchTool.backend.tool_based_RAG import acall_rag_agent, get_news_corpus, index_documents_to_vector_db
+from SQL_agent.backend.sql_agent import afetch_response, warm_up_sql_agent
+
+
+def admission(endpoint : str, max_concurrency : int) -> AdmissionController:
+    '''
+    :return: admission controller of the endpoint, its no of slots configurable via SERVICE_<ENDPOINT>_CONCURRENCY.
+    '''
+    return AdmissionController(
+        endpoint,
+        max_concurrency=int(os.getenv(f'SERVICE_{endpoint.upper()}_CONCURRENCY', str(max_concurrency))),
+        max_queue=int(os.getenv('SERVICE_MAX_QUEUE', '32')),
+        queue_timeout=float(os.getenv('SERVICE_QUEUE_TIMEOUT', '10')),
+    )
+
+# agent runs are mostly spent waiting on the model, hence more slots than cores. News questions also load & embed articles.
+admissions = {'sql': admission('sql', 8), 'news': admission('news', 4), 'restaurant': admission('restaurant', 8)}
+coalescer = Coalescer()
+
+
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+    # connect to the database & build the agent, chat model & news corpus in the background, requests are accepted meanwhile
+    if os.getenv('SERVICE_WARM_UP', '1') == '1':
+        warm_up_sql_agent()
+        warm_up(get_chat_model, get_news_corpus, name='news-warm-up')
+    yield
+
+app = FastAPI(title='Agent service', lifespan=lifespan)
+
+
+# ---------- REQUESTS ----------
+class Question(BaseModel):
+    question : str = Field(min_length=1)
+
+class NewsQuestion(BaseModel):
+    question : str = Field(min_length=1)
+    urls : List[str] = Field(min_length=1)
+
+class NewsUrls(BaseModel):
+    urls : List[str] = Field(min_length=1)
+
+class Cuisine(BaseModel):
+    cuisine : str
+
+
+# ---------- HELPERS ----------
+async def answer_events(name : str, deltas : AsyncIterator[str], **attributes) -> AsyncIterator[Event]:
+    '''
+    Function that turns the text deltas of an agent into the events of a shared run, traced as 'service.<name>'.
+    :return: async generator of 'delta' events & a final 'done' event with the stats & timings of the execution.
+    '''
+    started, first_token_at, tokens = time.perf_counter(), None, 0
+    with trace(f'service.{name}', **attributes) as run_span:
+        async for delta in deltas:
+            first_token_at = first_token_at or time.perf_counter()
+            tokens += 1
+            yield 'delta', {'text': delta}
+
+    yield 'done', {
+        'seconds': round(time.perf_counter() - started, 3),
+        'ttft': None if first_token_at is None else round(first_token_at - started, 3),
+        'tokens': tokens,
+        'timings': timing_table(get_tracer().get_trace(run_span.trace_id)),
+    }
+
+def overloaded(exc : Overloaded) -> JSONResponse:
+    return JSONResponse({'error': str(exc)}, status_code=503, headers={'Retry-After': str(exc.retry_after)})
+
+async def stream(endpoint : str, key : tuple, start) -> StreamingResponse:
+    '''
+    Function that streams the shared run of key as server-sent events, starting it if no identical request is in flight.
+    :param endpoint: endpoint whose admission controller the execution takes a slot from.
+    :param key: identity of the request.
+    :param start: zero-argument callable returning the events of a new execution.
+    :return: text/event-stream response, 503 if the endpoint is overloaded.
+    '''
+    try:
+        events, coalesced = await coalescer.subscribe((endpoint,) + key, start, admissions[endpoint])
+    except Overloaded as exc:
+        return overloaded(exc)
+
+    async def body():
+        try:
+            async for event, data in events:
+                if event == 'done':
+                    data = dict(data, coalesced=coalesced)
+                yield sse_event(event, data)
+        except Exception as exc:
+            yield sse_event('error', {'error': f"{type(exc).__name__}: {exc}"})
+
+    # no buffering by proxies: deltas must reach the client as they are produced
+    return StreamingResponse(body(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# ---------- ENDPOINTS ----------
+@app.post('/sql/answer')
+async def sql_answer(request : Question):
+    '''
+    Streams the answer of the SQL agent to a question about the AtliQ T-shirt database.
+    '''
+    key = (normalize_question(request.question),)
+    return await stream('sql', key, lambda: answer_events('sql', afetch_response(request.question)))
+
+@app.post('/news/index')
+async def news_index(request : NewsUrls):
+    '''
+    Fetches & indexes the articles of the urls ahead of the questions. Articles searched by other users are kept.
+    '''
+    try:
+        await admissions['news'].acquire()
+    except Overloaded as exc:
+        return overloaded(exc)
+    try:
+        vector_store = await asyncio.to_thread(index_documents_to_vector_db, tuple(request.urls))
+    finally:
+        admissions['news'].release()
+    return {'sources': list(vector_store.sources)}
+
+@app.post('/news/answer')
+async def news_answer(request : NewsQuestion):
+    '''
+    Streams the answer of the RAG agent to a question about the articles of the urls.
+    '''
+    # the order of the urls doesn't matter to retrieval
+    key = (normalize_question(request.question), frozenset(request.urls))
+    deltas = lambda: acall_rag_agent(request.question, tuple(request.urls))
+    return await stream('news', key, lambda: answer_events('news', deltas(), urls=len(request.urls)))
+
+@app.post('/restaurants')
+async def restaurant(request : Cuisine):
+    '''
+    Returns a restaurant & its menu for the cuisine: a pre-generated one from the catalog if any, else a fresh one.
+    Concurrent requests for a cuisine missing from the catalog share one generation.
+    '''
+    catalog = await asyncio.to_thread(get_restaurant_catalog)
+    response = catalog.get(request.cuisine) if request.cuisine in CUISINES else None
+    if response is not None:
+        return response
+
+    async def generate():
+        yield 'result', await agenerate_restaurant_and_menu(request.cuisine)
+
+    try:
+        events, _ = await coalescer.subscribe(('restaurant', normalize_question(request.cuisine)), generate, admissions['restaurant'])
+    except Overloaded as exc:
+        return overloaded(exc)
+    try:
+        return [data async for _, data in events][-1]
+    except Exception as exc:
+        return JSONResponse({'error': f"{type(exc).__name__}: {exc}"}, status_code=502)
+
+@app.get('/health')
+async def health():
+    '''
+    Load of every endpoint & no of executions shared by identical requests.
+    '''
+    return {
+        'endpoints': {name: controller.as_dict() for name, controller in admissions.items()},
+        'coalescing': coalescer.as_dict(),
+    }